@@ -1,73 +1,140 @@
 # Importation des librairies nécessaires
-import sqlite3
 import json
-from flask import Flask, render_template, request, redirect, url_for, flash, session, Response, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, session, Response, send_file, send_from_directory, jsonify, stream_with_context, abort
 import os
-from fonctions_analyse import analyse_dea
-from fonctions_results import traiter_results
-from io import StringIO
-from threading import Thread
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+import time
+import gzip
+import tempfile
+import zipfile
+from fonctions_results import traiter_results, matrice_texte_vers_csv, resume_run, charger_table, table_vers_csv
+from fonctions_jobs import Ordonnanceur, mettre_en_file, reseuiller_run
+from fonctions_courriels import Expediteur, mettre_en_file_courriel
+from fonctions_cache import cle_modele, cle_cache, appliquer_cache, supprimer_modele_si_orphelin, supprimer_figures_si_orphelines, statistiques as statistiques_cache
+from fonctions_figures import est_nom_figure, migrer_figure, HEATMAP_MAX_GENES
+from fonctions_pagination import COLONNES_LISTE, filtres_runs, paginer_runs
+from fonctions_validation import valider_fichiers, lire_covariables, lire_contrastes
+from fonctions_metriques import exporter_metriques
+from fonctions_interactif import donnees_volcano, donnees_heatmap, NIVEAU_VOLCANO, NIVEAU_VOLCANO_MAX, HEATMAP_MAX_GENES_INTERACTIF
+from fonctions_depot import chemins_jeu, televerser_jeu, reutiliser_jeu, jeux_utilisateur, nettoyer_depot
+from fonctions_genes import indexer_runs_en_attente, completer_seuils_anciens_runs, filtres_genes, rechercher_gene
+from fonctions_api import creer_jeton, utilisateur_jeton, lire_parametres, enregistrer_fichiers, extraire_archive, jeux_existants
+from sqlalchemy.orm import selectinload, load_only
+from sqlalchemy.pool import QueuePool
+from models import db, User, Run, JetonApi, ResultatCache, ResultatGene, mettre_a_jour_schema, configurer_sqlite, STATUT_TERMINE, STATUT_ECHEC, ETAPES, JOB_FIGURES
+from datetime import datetime, timedelta
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired
-from flask_mail import Mail, Message
+from flask_mail import Mail
 import click
+from werkzeug.utils import secure_filename
 from flask.cli import with_appcontext
 
 # Initialisation de l'application Flask
 app = Flask(__name__)
 app.debug = True
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///pydeseq2_db.sqlite'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///pydeseq2_db.sqlite')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Base de données: journal WAL pour SQLite (lectures non bloquées par les écritures), attente maximale d'un verrou
+# d'écriture (s), et connexions gardées ouvertes par le pool (0: une nouvelle connexion par session)
+app.config['DATABASE_WAL'] = os.environ.get('DATABASE_WAL', '1') == '1'
+app.config['DATABASE_BUSY_TIMEOUT'] = float(os.environ.get('DATABASE_BUSY_TIMEOUT', 30))
+app.config['DATABASE_POOL_SIZE'] = int(os.environ.get('DATABASE_POOL_SIZE', 10))
+if app.config['DATABASE_POOL_SIZE']:
+    # Flask-SQLAlchemy choisit sinon NullPool pour SQLite
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'poolclass': QueuePool, 'pool_size': app.config['DATABASE_POOL_SIZE'], 'max_overflow': 20}
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        # Les connexions du pool servent tour à tour les requêtes, l'ordonnanceur et l'expéditeur des courriels
+        app.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'] = {'check_same_thread': False}
 app.config['SECRET_KEY'] = 'your_secret_key'
 app.config['SECURITY_PASSWORD_SALT'] = 'your_salt'
 app.config['MAIL_SERVER'] = 'localhost'
 app.config['MAIL_PORT'] = 1025
 app.config['MAIL_USE_TLS'] = False
 app.config['MAIL_USE_SSL'] = False
+app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'your_email@example.com')
+# File d'envoi des courriels: courriels envoyés par lot sur une même connexion SMTP, intervalle de scrutation de la file (s),
+# fermeture de la connexion SMTP après ce délai sans envoi (s), nombre de tentatives et délai avant la 2e tentative
+# (s, doublé ensuite)
+app.config['MAIL_BATCH_SIZE'] = int(os.environ.get('MAIL_BATCH_SIZE', 50))
+app.config['MAIL_POLL_INTERVAL'] = float(os.environ.get('MAIL_POLL_INTERVAL', 5))
+app.config['MAIL_IDLE_TIMEOUT'] = float(os.environ.get('MAIL_IDLE_TIMEOUT', 30))
+app.config['MAIL_MAX_ATTEMPTS'] = int(os.environ.get('MAIL_MAX_ATTEMPTS', 6))
+app.config['MAIL_RETRY_DELAY'] = float(os.environ.get('MAIL_RETRY_DELAY', 30))
+# Si vrai, le processus web envoie aussi les courriels de la file (les workers `flask run-worker` les envoient toujours)
+app.config['MAIL_INLINE_SENDER'] = os.environ.get('MAIL_INLINE_SENDER', '1') == '1'
+# Adresse publique de l'application, pour les liens des courriels envoyés hors d'une requête (fin d'une analyse)
+app.config['PUBLIC_URL'] = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:5559')
+# Ordonnanceur des analyses: nombre de processus d'analyse simultanés, intervalle de scrutation de la file (s),
+# délai sans heartbeat avant de considérer un worker comme mort (s), limite d'analyses simultanées par utilisateur (0: aucune)
+app.config['ANALYSIS_WORKERS'] = int(os.environ.get('ANALYSIS_WORKERS', 2))
+app.config['ANALYSIS_POLL_INTERVAL'] = float(os.environ.get('ANALYSIS_POLL_INTERVAL', 2))
+app.config['ANALYSIS_HEARTBEAT_TIMEOUT'] = float(os.environ.get('ANALYSIS_HEARTBEAT_TIMEOUT', 60))
+app.config['ANALYSIS_MAX_JOBS_PER_USER'] = int(os.environ.get('ANALYSIS_MAX_JOBS_PER_USER', 0))
+# Nombre de processus pour les tests de Wald des contrastes d'une analyse (1: tests faits l'un après l'autre; au plus
+# les cœurs alloués à l'analyse)
+app.config['ANALYSIS_CONTRAST_PROCESSES'] = int(os.environ.get('ANALYSIS_CONTRAST_PROCESSES', 1))
+# Cœurs partagés par les analyses en cours sur la machine (tous les workers), et cœurs alloués à une analyse dont le
+# fichier counts dépasse ANALYSIS_LARGE_MATRIX_BYTES octets (les autres analyses et les jobs de seuils/figures en ont un)
+app.config['ANALYSIS_CPU_BUDGET'] = int(os.environ.get('ANALYSIS_CPU_BUDGET', os.cpu_count() or 1))
+app.config['ANALYSIS_CPUS_LARGE_MATRIX'] = int(os.environ.get('ANALYSIS_CPUS_LARGE_MATRIX', max(1, app.config['ANALYSIS_CPU_BUDGET'] // app.config['ANALYSIS_WORKERS'])))
+app.config['ANALYSIS_LARGE_MATRIX_BYTES'] = int(os.environ.get('ANALYSIS_LARGE_MATRIX_BYTES', 16 * 1024 * 1024))
+# Si vrai, le processus web exécute aussi les analyses; sinon elles sont exécutées par `flask run-worker`
+app.config['ANALYSIS_INLINE_WORKER'] = os.environ.get('ANALYSIS_INLINE_WORKER', '1') == '1'
+# Cache des résultats: taille maximale (octets) et nombre maximal d'entrées avant éviction LRU
+app.config['RESULT_CACHE_MAX_BYTES'] = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+app.config['RESULT_CACHE_MAX_ENTRIES'] = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 500))
+# Répertoire des modèles ajustés (.npz) réutilisés pour changer les seuils sans refaire l'ajustement
+app.config['RESULTS_DIR'] = os.environ.get('RESULTS_DIR', os.path.join(app.root_path, 'resultats'))
+# Répertoire des figures (PNG nommés par l'empreinte de leur contenu)
+app.config['PLOTS_DIR'] = os.path.join(app.static_folder, 'output')
+# Nombre d'analyses par page dans l'historique, et d'utilisateurs par page dans le tableau de bord admin
+app.config['DASHBOARD_PAGE_SIZE'] = 50
+app.config['ADMIN_USERS_PAGE_SIZE'] = 20
+# Nombre de résultats par page de la recherche d'un gène dans toutes les analyses (page /genes et /api/genes/<gene>)
+app.config['GENES_PAGE_SIZE'] = 100
+# Progression des analyses: par défaut, la page d'attente lit l'état du run avec la route JSON, d'abord toutes les
+# PROGRESS_POLL_INTERVAL secondes, puis de moins en moins souvent (x1,5 à chaque lecture sans changement d'étape, au
+# plus toutes les PROGRESS_POLL_MAX_INTERVAL secondes): une longue analyse ne coûte que quelques requêtes par minute.
+# Si PROGRESS_STREAM est vrai, elle suit un flux Server-Sent Events, qui garde une requête ouverte par page d'attente:
+# seulement avec des workers threadés ou asynchrones (gunicorn --worker-class gthread ou gevent), un worker synchrone
+# serait bloqué pendant tout le flux. Intervalle de lecture de l'état du run (s) et durée maximale d'un flux (s), après
+# laquelle le navigateur se reconnecte automatiquement
+app.config['PROGRESS_POLL_INTERVAL'] = float(os.environ.get('PROGRESS_POLL_INTERVAL', 3))
+app.config['PROGRESS_POLL_MAX_INTERVAL'] = float(os.environ.get('PROGRESS_POLL_MAX_INTERVAL', 30))
+app.config['PROGRESS_STREAM'] = os.environ.get('PROGRESS_STREAM', '0') == '1'
+app.config['PROGRESS_STREAM_INTERVAL'] = float(os.environ.get('PROGRESS_STREAM_INTERVAL', 3))
+app.config['PROGRESS_STREAM_TIMEOUT'] = float(os.environ.get('PROGRESS_STREAM_TIMEOUT', 300))
+# API par lots: nombre maximal d'analyses par lot (et de runs par requête de statut/résultats), taille maximale
+# d'une archive zip décompressée (octets)
+app.config['API_MAX_RUNS_PER_BATCH'] = int(os.environ.get('API_MAX_RUNS_PER_BATCH', 500))
+app.config['API_MAX_ARCHIVE_BYTES'] = int(os.environ.get('API_MAX_ARCHIVE_BYTES', 2 * 1024 * 1024 * 1024))
+# Dépôt des fichiers téléversés (adressé par contenu), quota (octets) et durée de rétention (jours, 0: aucune) des jeux de
+# données qui ne sont plus utilisés par aucune analyse, appliqués par flask gc-datasets
+app.config['UPLOADS_DIR'] = os.environ.get('UPLOADS_DIR', os.path.join(app.root_path, 'datasets', 'depot'))
+app.config['UPLOADS_MAX_BYTES'] = int(os.environ.get('UPLOADS_MAX_BYTES', 10 * 1024 * 1024 * 1024))
+app.config['UPLOADS_RETENTION_DAYS'] = float(os.environ.get('UPLOADS_RETENTION_DAYS', 30))
 
 # Initialisation de Flask-Mail
 mail = Mail(app)
 s = URLSafeTimedSerializer(app.config['SECRET_KEY'])
-db = SQLAlchemy(app)
-
-# Définition du modèle de données utilisateur
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    first_name = db.Column(db.String(120), nullable=False)
-    last_name = db.Column(db.String(120), nullable=False)
-    role = db.Column(db.String(10), default='user', nullable=False)
-
-# Définition du modèle de données pour les résultats d'analyse
-class Run(db.Model):
-    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    analysis_date = db.Column(db.DateTime, default=datetime.utcnow)
-    text_results = db.Column(db.Text, nullable=True)
-    heatmap_path = db.Column(db.String(255), nullable=True)
-    volcanoplot_path = db.Column(db.String(255), nullable=True)
-    user = db.relationship('User', backref=db.backref('runs', lazy=True))
+db.init_app(app)
 
 # Création de la base de données
 with app.app_context():
+    configurer_sqlite(db.engine, app.config['DATABASE_WAL'], app.config['DATABASE_BUSY_TIMEOUT'])
     db.create_all()
+    mettre_a_jour_schema()
+    completer_seuils_anciens_runs()
 
-# Fonction pour exécuter une analyse
-def execute_analysis(counts_file, metadata_file, refit_cooks, min_reads_per_gene, alpha_thres, lfc_thres, user_id, run_id):
-    string_results, heatmap_path, volcanoplot_path = analyse_dea(counts_file, metadata_file, refit_cooks, min_reads_per_gene, alpha_thres, lfc_thres)
-    with app.app_context():
-        run = Run.query.filter_by(id=run_id, user_id=user_id).first_or_404()
-        run.text_results = string_results
-        run.heatmap_path = heatmap_path
-        run.volcanoplot_path = volcanoplot_path
-        db.session.commit()
+# Ordonnanceur et expéditeur des courriels intégrés au processus web, démarrés à la première requête
+ordonnanceur = Ordonnanceur(app)
+expediteur = Expediteur(app, mail)
 
-# Fonction pour exécuter une analyse dans un thread séparé
-def execute_analysis_thread(counts_file, metadata_file, refit_cooks, min_reads_per_gene, alpha_thres, lfc_thres, user_id, run_id):
-    thread = Thread(target=execute_analysis, args=(counts_file, metadata_file, refit_cooks, min_reads_per_gene, alpha_thres, lfc_thres, user_id, run_id))
-    thread.daemon = True
-    thread.start()
+@app.before_first_request
+def demarrer_ordonnanceur():
+    if app.config['ANALYSIS_INLINE_WORKER']:
+        ordonnanceur.demarrer()
+    if app.config['MAIL_INLINE_SENDER']:
+        expediteur.demarrer()
 
 # Fonction pour vérifier si l'utilisateur est un administrateur
 def is_admin():
@@ -89,6 +156,114 @@ def create_admin(email, first_name, last_name):
     db.session.commit()
     print('Admin created successfully.')
 
+# Commande CLI pour créer un jeton d'accès à l'API (affiché une seule fois)
+@app.cli.command("create-token")
+@click.argument("email")
+@click.option("--name", default=None, help="Description du jeton (ex.: nom du pipeline).")
+@with_appcontext
+def create_token(email, name):
+    """Crée un jeton d'accès à l'API pour un utilisateur."""
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        print('User not found.')
+        return
+    jeton = creer_jeton(user, name)
+    db.session.commit()
+    print(jeton)
+
+# Commande CLI pour révoquer tous les jetons d'accès à l'API d'un utilisateur
+@app.cli.command("revoke-tokens")
+@click.argument("email")
+@with_appcontext
+def revoke_tokens(email):
+    """Révoque les jetons d'accès à l'API d'un utilisateur."""
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        print('User not found.')
+        return
+    supprimes = JetonApi.query.filter_by(user_id=user.id).delete()
+    db.session.commit()
+    print(f'{supprimes} jetons révoqués.')
+
+# Commande CLI pour nettoyer le dépôt des fichiers téléversés: jeux de données sans analyse expirés ou au-delà du quota
+@app.cli.command("gc-datasets")
+@click.option("--max-bytes", type=int, default=None, help="Quota du dépôt en octets (défaut: UPLOADS_MAX_BYTES).")
+@click.option("--retention-days", type=float, default=None, help="Rétention des jeux de données sans analyse, en jours (défaut: UPLOADS_RETENTION_DAYS; 0: aucune).")
+@click.option("--dry-run", is_flag=True, help="Afficher le bilan sans rien supprimer.")
+@with_appcontext
+def gc_datasets(max_bytes, retention_days, dry_run):
+    """Supprime les jeux de données et fichiers téléversés qui ne sont plus utilisés."""
+    max_octets = app.config['UPLOADS_MAX_BYTES'] if max_bytes is None else max_bytes
+    jours = app.config['UPLOADS_RETENTION_DAYS'] if retention_days is None else retention_days
+    bilan = nettoyer_depot(max_octets, timedelta(days=jours) if jours else None, simulation=dry_run)
+    prefixe = '(simulation) ' if dry_run else ''
+    print(f"{prefixe}{bilan['datasets']} jeux de données et {bilan['files']} fichiers supprimés, "
+          f"{bilan['bytes_freed']} octets libérés; taille du dépôt: {bilan['bytes']} octets (quota: {max_octets}).")
+
+# Commande CLI pour indexer par gène les résultats des analyses terminées (fait aussi au fil de l'eau par l'ordonnanceur)
+@app.cli.command("index-genes")
+@click.option("--rebuild", is_flag=True, help="Réindexer aussi les analyses déjà indexées.")
+@with_appcontext
+def index_genes(rebuild):
+    """Indexe les résultats par gène des analyses terminées."""
+    if rebuild:
+        Run.query.update({'genes_indexed': False}, synchronize_session=False)
+        db.session.commit()
+    indexes = indexer_runs_en_attente()
+    print(f'{indexes} analyses indexées; {ResultatGene.query.count()} résultats par gène dans l\'index.')
+
+# Commande CLI pour afficher les statistiques du cache des résultats
+@app.cli.command("cache-stats")
+@with_appcontext
+def cache_stats():
+    """Affiche les statistiques du cache des résultats."""
+    for nom, valeur in statistiques_cache().items():
+        print(f'{nom}: {valeur}')
+
+# Commande CLI pour déplacer les figures encodées en base64 des anciennes analyses vers le stockage de fichiers
+@app.cli.command("migrate-plots")
+@click.option("--batch-size", type=int, default=50, help="Nombre d'analyses migrées par transaction.")
+@with_appcontext
+def migrate_plots(batch_size):
+    """Migre les figures base64 de la BD vers static/output/."""
+    dossier_figures = app.config['PLOTS_DIR']
+    migrees = 0
+    for modele, colonnes in [(Run, ('heatmap_path', 'volcanoplot_path')), (ResultatCache, ('heatmap', 'volcanoplot'))]:
+        cle_primaire = modele.__mapper__.primary_key[0]
+        # Les figures base64 dépassent largement la longueur d'un nom de fichier
+        filtre = db.or_(*(db.func.length(getattr(modele, colonne)) > 68 for colonne in colonnes))
+        while True:
+            lot = modele.query.filter(filtre).order_by(cle_primaire).limit(batch_size).all()
+            if not lot:
+                break
+            for ligne in lot:
+                for colonne in colonnes:
+                    setattr(ligne, colonne, migrer_figure(getattr(ligne, colonne), dossier_figures))
+            db.session.commit()
+            migrees += len(lot)
+            # Libère les images base64 déjà traitées
+            db.session.expunge_all()
+    print(f'{migrees} lignes migrées.')
+
+# Commande CLI pour lancer un worker d'analyse séparé du processus web
+@app.cli.command("run-worker")
+@click.option("--workers", type=int, default=None, help="Nombre de processus d'analyse simultanés.")
+@with_appcontext
+def run_worker(workers):
+    """Exécute les analyses de la file d'attente."""
+    worker = Ordonnanceur(app, max_workers=workers)
+    # Les courriels de fin d'analyse sont envoyés par le worker, même si le processus web n'envoie pas de courriels
+    expediteur_worker = Expediteur(app, mail)
+    expediteur_worker.demarrer()
+    print(f'Worker {worker.nom} démarré avec {worker.max_workers} processus.')
+    try:
+        worker.boucle()
+    except KeyboardInterrupt:
+        print('Arrêt du worker.')
+    finally:
+        expediteur_worker.arreter()
+        expediteur_worker.thread.join(timeout=10)
+
 # Route pour vérifier l'email par un token
 @app.route('/verify_email/<token>')
 def verify_email(token):
@@ -116,8 +291,17 @@ def admin_dashboard():
     if not is_admin():
         flash('Accès non autorisé.', 'error')
         return redirect(url_for('login'))
-    users = User.query.all()
-    return render_template('admin_dashboard.html', users=users)
+    # Utilisateurs paginés par id; leurs analyses (colonnes légères seulement) sont chargées en une seule requête
+    # pour toute la page au lieu d'une requête par utilisateur
+    filtres, criteres = filtres_runs(request.args)
+    apres = request.args.get('after', type=int)
+    taille = app.config['ADMIN_USERS_PAGE_SIZE']
+    requete = User.query.options(selectinload(User.runs.and_(*criteres)).load_only(*COLONNES_LISTE))
+    if apres:
+        requete = requete.filter(User.id > apres)
+    users = requete.order_by(User.id).limit(taille + 1).all()
+    suivant = users[taille - 1].id if len(users) > taille else None
+    return render_template('admin_dashboard.html', users=users[:taille], filtres=filtres, suivant=suivant)
 
 # Route pour supprimer un utilisateur
 @app.route('/delete_user/<int:user_id>', methods=['POST'])
@@ -141,8 +325,14 @@ def delete_user(user_id):
 def delete_run(run_id):
     run = Run.query.get_or_404(run_id)
     if session.get('user_id') == run.user_id or is_admin():
+        modele_path, figures = run.model_path, [run.heatmap_path, run.volcanoplot_path]
+        for contraste in run.contrastes:
+            figures += [contraste.heatmap_path, contraste.volcanoplot_path]
+        ResultatGene.query.filter_by(run_id=run.id).delete(synchronize_session=False)
         db.session.delete(run)
         db.session.commit()
+        supprimer_modele_si_orphelin(modele_path)
+        supprimer_figures_si_orphelines(figures)
         flash(f'Analyse {run_id} supprimée avec succès.', 'success')
     else:
         flash('Accès non autorisé. Vous ne pouvez supprimer que les analyses que vous possédez.', 'error')
@@ -161,8 +351,10 @@ def dashboard():
         user = User.query.filter_by(email=user_email).first()
         if user:
             session['user_id'] = user.id
-            user_runs = Run.query.filter_by(user_id=user.id).all()
-            return render_template('dashboard.html', user_runs=user_runs)
+            filtres, criteres = filtres_runs(request.args)
+            requete = Run.query.filter_by(user_id=user.id).filter(*criteres)
+            user_runs, suivant = paginer_runs(requete, request.args.get('cursor'), app.config['DASHBOARD_PAGE_SIZE'])
+            return render_template('dashboard.html', user_runs=user_runs, filtres=filtres, suivant=suivant)
         else:
             flash('Utilisateur non trouvé. Veuillez vous reconnecter.', 'error')
             return redirect(url_for('login'))
@@ -170,6 +362,19 @@ def dashboard():
         flash('Veuillez vous connecter pour accéder au tableau de bord.', 'error')
         return redirect(url_for('login'))
 
+# Route pour retrouver un gène dans toutes les analyses de l'utilisateur (toutes les analyses pour un administrateur)
+@app.route('/genes')
+def genes():
+    if 'user_id' not in session:
+        flash('Veuillez vous connecter pour rechercher un gène.', 'error')
+        return redirect(url_for('login'))
+    filtres, criteres = filtres_genes(request.args)
+    resultats, suivant = [], None
+    if filtres['gene']:
+        resultats, suivant = rechercher_gene(filtres['gene'], criteres, filtres['sort'], request.args.get('cursor'),
+                                             app.config['GENES_PAGE_SIZE'], user_id=None if is_admin() else session['user_id'])
+    return render_template('genes.html', resultats=resultats, filtres=filtres, suivant=suivant)
+
 # Route pour l'inscription
 @app.route('/inscription', methods=['GET', 'POST'])
 def inscription():
@@ -187,18 +392,12 @@ def inscription():
         
         link = url_for('verify_email', token=token, _external=True)
         
-        try:
-            msg = Message('Confirmer inscription', sender='your_email@example.com', recipients=[email])
-            msg.body = 'Votre lien de vérification est : {}'.format(link)
-            mail.send(msg)
-        except Exception as e:
-            app.logger.error('Échec de l\'envoi du lien de vérification: %s', e)
-            flash("Échec de l'envoi de l'e-mail de vérification. Veuillez réessayer.", 'inscription-failed')
-            return redirect(url_for('inscription'))
-        
+        # Courriel envoyé en arrière-plan (fonctions_courriels), dans la même transaction que le compte
+        mettre_en_file_courriel(email, 'Confirmer inscription', 'Votre lien de vérification est : {}'.format(link))
         new_user = User(email=email, first_name=first_name, last_name=last_name)
         db.session.add(new_user)
         db.session.commit()
+        expediteur.reveiller()
         flash("Un lien de vérification a été envoyé à votre adresse courriel. Veuillez vérifier votre boîte de réception.", 'inscription-success')
         return redirect(url_for('login'))
     return render_template('inscription.html')
@@ -217,9 +416,10 @@ def login():
         
         link = url_for('verify_email', token=token, _external=True)
         
-        msg = Message('Vérification de la connexion', sender='your_email@example.com', recipients=[email])
-        msg.body = 'Veuillez cliquer sur le lien pour vérifier votre email et compléter le processus de connexion : {}'.format(link)
-        mail.send(msg)
+        mettre_en_file_courriel(email, 'Vérification de la connexion',
+                                'Veuillez cliquer sur le lien pour vérifier votre email et compléter le processus de connexion : {}'.format(link))
+        db.session.commit()
+        expediteur.reveiller()
         
         flash('Un email de vérification a été envoyé à votre adresse courriel. Veuillez vérifier votre boîte de réception.', 'authentication_email_sent')
         return redirect(url_for('index'))
@@ -237,65 +437,164 @@ def download_example_metadata():
     example_metadata_file_path = os.path.join("datasets", "metadata_table.csv")
     return send_file(example_metadata_file_path, as_attachment=True)
 
+# Page du formulaire d'analyse, avec les jeux de données déjà téléversés par l'utilisateur
+def page_analyse():
+    return render_template('analyse.html', jeux=jeux_utilisateur(session['user_id']))
+
 # Route pour lancer une nouvelle analyse
 @app.route('/analyse', methods=["GET", "POST"])
 def analyse():
     if request.method == "POST":
         refit_cooks = "refit_cooks" in request.form.getlist("options")
+        notify = "notify" in request.form.getlist("options")
         min_reads_per_gene = int(request.form["min_reads_per_gene"])
         alpha_thres = float(request.form["alpha_thres"])
         lfc_thres = float(request.form["lfc_thres"])
-
-        counts_file = request.files['counts_file']
-        metadata_file = request.files['metadata_file']
-        counts_file.save(os.path.join("datasets", counts_file.filename))
-        metadata_file.save(os.path.join("datasets", metadata_file.filename))
-
-        counts_file_path = os.path.join("datasets", counts_file.filename)
-        metadata_file_path = os.path.join("datasets", metadata_file.filename)
-        
         user_id = session['user_id']
-        run_id = None
+
+        # Fichiers: jeu de données déjà téléversé, ou nouveaux fichiers écrits dans le dépôt adressé par contenu
+        # (le fichier des gènes, seulement pour une matrice MatrixMarket, est optionnel)
+        dataset_id = request.form.get('dataset_id', type=int)
+        if dataset_id:
+            jeu = reutiliser_jeu(user_id, dataset_id)
+            if jeu is None:
+                flash('Jeu de données introuvable.', 'error')
+                return page_analyse()
+        else:
+            fichiers = {role: (request.files[f'{role}_file'].stream, request.files[f'{role}_file'].filename)
+                        for role in ('counts', 'metadata')}
+            genes_file = request.files.get('genes_file')
+            if genes_file is not None and genes_file.filename:
+                fichiers['genes'] = (genes_file.stream, genes_file.filename)
+            jeu = televerser_jeu(user_id, fichiers)
+        chemins = chemins_jeu(jeu)
+        counts_file_path = chemins['counts_file']
+        metadata_file_path = chemins['metadata_file']
+        genes_file_path = chemins['genes_file']
+
+        # Design: covariables (colonnes du fichier metadata) et contrastes à tester (par défaut toutes les paires de conditions)
+        covariables = lire_covariables(request.form.get('covariates'))
+        try:
+            contrastes = lire_contrastes(request.form.get('contrasts'))
+        except ValueError as erreur:
+            db.session.rollback()
+            flash(str(erreur), 'error')
+            return page_analyse()
+
+        # Vérification des en-têtes (format, échantillons des counts présents dans metadata) avant de mettre l'analyse en file.
+        # Les fichiers refusés ne sont pas enregistrés comme jeu de données (supprimés du dépôt par flask gc-datasets).
+        erreurs = valider_fichiers(counts_file_path, metadata_file_path, genes_file_path, covariables, contrastes)
+        if erreurs:
+            db.session.rollback()
+            for erreur in erreurs:
+                flash(erreur, 'error')
+            return page_analyse()
 
         new_run = Run(
                 user_id=user_id,
                 analysis_date=datetime.now(),
                 text_results=None,
                 heatmap_path=None,
-                volcanoplot_path=None
+                volcanoplot_path=None,
+                notify=notify
         )
-
-        with app.app_context():
-            db.session.add(new_run)
-            db.session.commit()
-            run_id = new_run.id
-
-        execute_analysis_thread(counts_file_path, metadata_file_path, refit_cooks, min_reads_per_gene, alpha_thres, lfc_thres, user_id, run_id)
-        session['run_id'] = run_id
+        db.session.add(new_run)
+        cle_ajustement = cle_modele(counts_file_path, metadata_file_path, refit_cooks, min_reads_per_gene, genes_file_path, covariables, contrastes)
+        cle = cle_cache(cle_ajustement, alpha_thres, lfc_thres)
+        mettre_en_file(new_run, counts_file_path, metadata_file_path, refit_cooks, min_reads_per_gene, alpha_thres, lfc_thres, model_key=cle_ajustement, cache_key=cle, genes_file=genes_file_path,
+                       covariables=covariables, contrastes=contrastes, jeu_donnees=jeu)
+        # Résultats identiques déjà calculés: le run est terminé immédiatement
+        en_cache = appliquer_cache(new_run, cle)
+        db.session.commit()
+        if not en_cache:
+            ordonnanceur.reveiller()
+        session['run_id'] = new_run.id
 
         return redirect(url_for('display_wait'))
     
-    return render_template('analyse.html')
+    return page_analyse()
 
-# Route pour télécharger les résultats au format CSV
+# Route pour télécharger les résultats au format CSV (?contrast=<position>: contraste du run, le premier par défaut)
 @app.route('/download_csv/<int:run_id>')
 def download_csv(run_id):
     user_id = session['user_id']
-    with app.app_context():
-        run = Run.query.filter_by(id=run_id, user_id=user_id).first_or_404()
-
-        text_dict = traiter_results(run.text_results)
-        csv_data = text_dict['matrice']
+    run = Run.query.filter_by(id=run_id, user_id=user_id, status=STATUT_TERMINE).first_or_404()
+    contraste = request.args.get('contrast', 0, type=int)
 
-        headers = {
-            "Content-Disposition": f"attachment; filename=matrice_data.csv"
-        }
+    nom_fichier = 'matrice_data.csv' if contraste == 0 else f'matrice_data_{contraste}.csv'
+    headers = {
+        "Content-Disposition": f"attachment; filename={nom_fichier}"
+    }
 
-        return Response(
-            csv_data,
-            mimetype="text/csv",
-            headers=headers
-        )
+    try:
+        csv_data = csv_run(run, contraste)
+    except IndexError:
+        return Response(status=404)
+
+    return Response(
+        csv_data,
+        mimetype="text/csv",
+        headers=headers
+    )
+
+# CSV des résultats d'un contraste d'un run terminé (IndexError si le run n'a pas ce contraste)
+def csv_run(run, contraste):
+    if run.text_results is not None:
+        # Ancien format: matrice texte à largeur fixe convertie en CSV
+        if contraste != 0:
+            raise IndexError(contraste)
+        return matrice_texte_vers_csv(traiter_results(run.text_results)['matrice'])
+    # Le CSV est produit par blocs directement à partir des colonnes du modèle ajusté
+    return table_vers_csv(charger_table(run.model_path, run.alpha_thres, run.lfc_thres, contraste))
+
+# Réponse JSON compacte, compressée avec gzip si le navigateur l'accepte. L'ETag permet au navigateur de réutiliser
+# les données déjà reçues (le modèle ajusté ne change pas pour une même URL).
+def reponse_json_compressee(donnees):
+    contenu = json.dumps(donnees, separators=(',', ':')).encode()
+    response = Response(contenu, mimetype='application/json')
+    response.add_etag()
+    response.vary.add('Accept-Encoding')
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response = response.make_conditional(request)
+    if response.status_code == 200 and 'gzip' in request.accept_encodings:
+        response.set_data(gzip.compress(contenu, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+# Modèle ajusté d'un run terminé de l'utilisateur connecté (404 si les données des figures interactives n'existent pas)
+def modele_run(run_id):
+    run = Run.query.filter_by(id=run_id, user_id=session['user_id'], status=STATUT_TERMINE).first_or_404()
+    if not run.model_path or not os.path.exists(run.model_path):
+        abort(404)
+    return run
+
+# Route des points du volcano plot interactif d'un contraste, réduits selon le niveau de détail
+# (?level=<taille de la grille>, zoom: ?x0=&x1=&y0=&y1=, limités à l'étendue des données)
+@app.route('/results/<int:run_id>/contrasts/<int:position>/volcano.json')
+def volcano_json(run_id, position):
+    run = modele_run(run_id)
+    niveau = min(max(request.args.get('level', NIVEAU_VOLCANO, type=int), 10), NIVEAU_VOLCANO_MAX)
+    bornes = [request.args.get(nom, type=float) for nom in ('x0', 'x1', 'y0', 'y1')]
+    try:
+        donnees = donnees_volcano(run.model_path, position, niveau, bornes)
+    except IndexError:
+        abort(404)
+    return reponse_json_compressee(donnees)
+
+# Route de la matrice du heatmap interactif d'un contraste (?alpha=&lfc=: seuils, ceux du run par défaut;
+# ?max_genes=: nombre maximal de gènes)
+@app.route('/results/<int:run_id>/contrasts/<int:position>/heatmap.json')
+def heatmap_json(run_id, position):
+    run = modele_run(run_id)
+    alpha_thres = request.args.get('alpha', run.alpha_thres, type=float)
+    lfc_thres = request.args.get('lfc', run.lfc_thres, type=float)
+    max_genes = min(max(request.args.get('max_genes', HEATMAP_MAX_GENES, type=int), 1), HEATMAP_MAX_GENES_INTERACTIF)
+    try:
+        donnees = donnees_heatmap(run.model_path, position, alpha_thres, lfc_thres, max_genes)
+    except IndexError:
+        abort(404)
+    return reponse_json_compressee(donnees)
 
 # Route pour afficher les résultats d'une analyse
 @app.route('/results/<int:run_id>')
@@ -306,27 +605,366 @@ def display_results(run_id):
 
     user_id = session['user_id']
 
-    with app.app_context():
-        run = Run.query.filter_by(id=run_id, user_id=user_id).first_or_404()
-        text_results = traiter_results(run.text_results)
-        return render_template('results.html', run_id=run_id, text_results=text_results, heatmap_path=run.heatmap_path, volcanoplot_path=run.volcanoplot_path)
+    run = Run.query.filter_by(id=run_id, user_id=user_id).first_or_404()
+    if run.status != STATUT_TERMINE:
+        session['run_id'] = run_id
+        return redirect(url_for('display_wait'))
+    resultats = resume_run(run)
+    # Figures en cours de génération par le job de figures: la page se recharge jusqu'à ce qu'elles soient prêtes
+    figures_en_cours = run.job is not None and run.job.kind == JOB_FIGURES
+    rethreshold = run.job is not None and not figures_en_cours and bool(run.model_path) and os.path.exists(run.model_path)
+    # Figures interactives: seulement pour les analyses dont le modèle ajusté est sauvegardé
+    interactif = bool(run.model_path) and os.path.exists(run.model_path)
+    return render_template('results.html', run_id=run_id, resultats=resultats, rethreshold=rethreshold, figures_en_cours=figures_en_cours,
+                           interactif=interactif)
+
+# Route pour servir les figures. Le nom étant l'empreinte du contenu, la réponse peut être mise en cache
+# indéfiniment; send_from_directory gère l'ETag, If-None-Match/If-Modified-Since et les requêtes Range.
+@app.route('/plots/<filename>')
+def plot_file(filename):
+    if not est_nom_figure(filename):
+        return Response(status=404)
+    response = send_from_directory(app.config['PLOTS_DIR'], filename, mimetype='image/png', conditional=True,
+                                   etag=filename[:-len('.png')], max_age=365 * 24 * 3600)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# URL d'une figure pour les templates: fichier du stockage, ou image base64 des analyses non migrées
+@app.template_global()
+def url_figure(valeur):
+    if est_nom_figure(valeur):
+        return url_for('plot_file', filename=valeur)
+    return f'data:image/png;base64, {valeur}'
+
+# Route pour changer les seuils alpha et log2FoldChange d'une analyse terminée sans refaire l'ajustement pyDESeq2
+@app.route('/results/<int:run_id>/rethreshold', methods=['POST'])
+def rethreshold(run_id):
+    if 'user_id' not in session:
+        flash('Veuillez vous connecter pour accéder à cette page.', 'error')
+        return redirect(url_for('login'))
 
-# Route pour la page d'attente pendant le traitement de l'analyse
+    run = Run.query.filter_by(id=run_id, user_id=session['user_id']).first_or_404()
+    if run.status != STATUT_TERMINE or run.job is None or not run.model_path or not os.path.exists(run.model_path):
+        flash("Les seuils de cette analyse ne peuvent pas être modifiés, veuillez lancer une nouvelle analyse.", 'error')
+        return redirect(url_for('display_results', run_id=run_id))
+    if run.job.kind == JOB_FIGURES:
+        flash("Les figures de cette analyse sont en cours de génération, veuillez réessayer dans quelques secondes.", 'error')
+        return redirect(url_for('display_results', run_id=run_id))
+
+    alpha_thres = float(request.form["alpha_thres"])
+    lfc_thres = float(request.form["lfc_thres"])
+    en_cache = reseuiller_run(run, alpha_thres, lfc_thres)
+    db.session.commit()
+    if en_cache:
+        return redirect(url_for('display_results', run_id=run_id))
+    ordonnanceur.reveiller()
+    session['run_id'] = run_id
+    return redirect(url_for('display_wait'))
+
+# État d'un run pour la page d'attente: statut, étape en cours et progression (fraction des étapes commencées)
+def etat_run(run):
+    etapes = list(ETAPES)
+    if run.status == STATUT_TERMINE:
+        progression = 1.0
+    elif run.stage in ETAPES:
+        progression = etapes.index(run.stage) / len(etapes)
+    else:
+        progression = 0.0
+    return {
+        'run_id': run.id,
+        'status': run.status,
+        'stage': run.stage,
+        'stage_label': ETAPES.get(run.stage),
+        'progress': round(progression, 3),
+        'error': run.error if run.status == STATUT_ECHEC else None,
+    }
+
+# Lecture de l'état d'un run: seulement les colonnes nécessaires
+def lire_etat_run(run_id, user_id):
+    return (Run.query.options(load_only('id', 'status', 'stage', 'error'))
+            .filter_by(id=run_id, user_id=user_id)
+            .first_or_404())
+
+# Route JSON de l'état d'une analyse (alternative au flux d'événements)
+@app.route('/runs/<int:run_id>/status')
+def run_status(run_id):
+    run = lire_etat_run(run_id, session['user_id'])
+    return jsonify(etat_run(run))
+
+# Flux Server-Sent Events de la progression d'une analyse: un événement 'progression' à chaque changement d'étape,
+# puis un événement 'fin' lorsque l'analyse est terminée ou a échoué
+@app.route('/runs/<int:run_id>/events')
+def run_events(run_id):
+    if not app.config['PROGRESS_STREAM']:
+        abort(404)
+    user_id = session['user_id']
+    lire_etat_run(run_id, user_id)
+    intervalle = app.config['PROGRESS_STREAM_INTERVAL']
+    fin_flux = time.monotonic() + app.config['PROGRESS_STREAM_TIMEOUT']
+
+    def evenements():
+        yield 'retry: 3000\n\n'
+        precedent = None
+        dernier_envoi = time.monotonic()
+        while time.monotonic() < fin_flux:
+            etat = etat_run(lire_etat_run(run_id, user_id))
+            # Fin de la transaction de lecture pour voir les mises à jour de l'ordonnanceur au prochain tour
+            db.session.remove()
+            if etat != precedent:
+                precedent = etat
+                dernier_envoi = time.monotonic()
+                evenement = 'fin' if etat['status'] in (STATUT_TERMINE, STATUT_ECHEC) else 'progression'
+                yield f"event: {evenement}\ndata: {json.dumps(etat)}\n\n"
+                if evenement == 'fin':
+                    return
+            elif time.monotonic() - dernier_envoi > 15:
+                # Commentaire pour garder la connexion ouverte à travers les proxys
+                dernier_envoi = time.monotonic()
+                yield ': ping\n\n'
+            time.sleep(intervalle)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(evenements()), mimetype='text/event-stream', headers=headers)
+
+# Route pour la page d'attente pendant le traitement de l'analyse.
+# La page suit la progression avec la route JSON (ou le flux d'événements si PROGRESS_STREAM); le POST sert à la redirection finale (et sans JavaScript)
 @app.route('/wait', methods=["GET", "POST"])
 def display_wait():
-    if request.method == "POST":
-
-        user_id = session['user_id']
-        run_id = session['run_id']
+    user_id = session['user_id']
+    run_id = session['run_id']
+    run = lire_etat_run(run_id, user_id)
 
-        with app.app_context():
-            run = Run.query.filter_by(id=run_id, user_id=user_id).first_or_404()
-            if run.text_results == None:
-                return render_template('wait.html')
-            else:
-                return redirect(url_for('display_results', run_id=run_id))
+    if request.method == "POST":
+        if run.status == STATUT_TERMINE:
+            return redirect(url_for('display_results', run_id=run_id))
+        elif run.status == STATUT_ECHEC:
+            flash(f"L'analyse {run_id} a échoué: {run.error}", 'error')
+            return redirect(url_for('dashboard'))
+
+    return render_template('wait.html', etat=etat_run(run), etapes=ETAPES, flux=app.config['PROGRESS_STREAM'],
+                           intervalle=app.config['PROGRESS_POLL_INTERVAL'], intervalle_max=app.config['PROGRESS_POLL_MAX_INTERVAL'])
+
+# Réponse d'erreur de l'API JSON
+def erreur_api(message, statut, **details):
+    return jsonify(error=message, **details), statut
+
+# Utilisateur de l'API authentifié par le jeton de l'en-tête Authorization (None si absent ou invalide)
+def utilisateur_api():
+    return utilisateur_jeton(request.headers.get('Authorization'))
+
+# Identifiants des runs demandés à l'API (?ids=1,2,3 ou ?ids=1&ids=2). Lève ValueError si un identifiant est invalide.
+def ids_runs_api():
+    ids = []
+    for valeur in request.args.getlist('ids'):
+        ids += [int(morceau) for morceau in valeur.split(',') if morceau.strip()]
+    return list(dict.fromkeys(ids))
+
+# Runs de l'utilisateur de l'API, dans l'ordre demandé, et identifiants introuvables
+def runs_api(user, ids):
+    runs = (Run.query.options(selectinload(Run.contrastes))
+            .filter(Run.user_id == user.id, Run.id.in_(ids))
+            .all())
+    par_id = {run.id: run for run in runs}
+    return [par_id[run_id] for run_id in ids if run_id in par_id], [run_id for run_id in ids if run_id not in par_id]
+
+# État d'un run pour l'API: celui de la page d'attente, avec les paramètres et le résumé des résultats s'il est terminé
+def etat_run_api(run):
+    etat = etat_run(run)
+    etat['parameters'] = {
+        'counts_file': run.counts_file,
+        'metadata_file': run.metadata_file,
+        'refit_cooks': run.refit_cooks,
+        'min_reads_per_gene': run.min_reads_per_gene,
+        'alpha_thres': run.alpha_thres,
+        'lfc_thres': run.lfc_thres,
+        'covariates': run.covariates,
+    }
+    if run.status == STATUT_TERMINE:
+        resume = resume_run(run)
+        contrastes = []
+        for contraste in resume['contrastes']:
+            contrastes.append({
+                'position': contraste['position'],
+                'design_factor': contraste['design_factor'],
+                'condition_1': contraste['condition_1'],
+                'condition_2': contraste['condition_2'],
+                'n_significant': contraste['n_significant'],
+                'csv_url': url_for('api_run_csv', run_id=run.id, contrast=contraste['position'], _external=True),
+                'heatmap_url': url_for('plot_file', filename=contraste['heatmap_path'], _external=True) if est_nom_figure(contraste['heatmap_path']) else None,
+                'volcanoplot_url': url_for('plot_file', filename=contraste['volcanoplot_path'], _external=True) if est_nom_figure(contraste['volcanoplot_path']) else None,
+            })
+        etat['results'] = {
+            'design_factor': resume.get('design_factor'),
+            'n_genes': resume.get('n_genes'),
+            'n_significant': resume.get('n_significant'),
+            'contrasts': contrastes,
+        }
+    return etat
+
+# Route de l'API pour soumettre un lot d'analyses: une analyse par jeu de données et par combinaison de la grille
+# de paramètres (voir fonctions_api). Tous les jeux de données sont vérifiés avant la mise en file: si un seul est
+# invalide, aucune analyse n'est créée. Les analyses sont mises en file dans une seule transaction.
+@app.route('/api/batches', methods=['POST'])
+def api_batches():
+    user = utilisateur_api()
+    if user is None:
+        return erreur_api("Jeton d'accès manquant ou invalide.", 401)
+    try:
+        grille, covariables, contrastes = lire_parametres(request.form.get('parameters'))
+    except ValueError as erreur:
+        return erreur_api(str(erreur), 400)
 
-    return render_template('wait.html')
+    # Les fichiers d'un lot refusé ne sont pas enregistrés comme jeux de données (supprimés du dépôt par flask gc-datasets)
+    try:
+        jeux = jeux_existants(user.id, request.form.getlist('dataset_id'))
+        archive = request.files.get('archive')
+        if archive is not None and archive.filename:
+            jeux += extraire_archive(user.id, archive.stream, app.config['API_MAX_ARCHIVE_BYTES'])
+        else:
+            jeux += enregistrer_fichiers(user.id, request.files.getlist('counts_file'), request.files.getlist('metadata_file'),
+                                         request.files.getlist('genes_file'), request.form.getlist('name'))
+        if not jeux:
+            raise ValueError("Aucun jeu de données: champs counts_file/metadata_file, archive ou dataset_id attendus.")
+        n_runs = len(jeux) * len(grille)
+        if n_runs > app.config['API_MAX_RUNS_PER_BATCH']:
+            raise ValueError(f"Le lot demande {n_runs} analyses (maximum: {app.config['API_MAX_RUNS_PER_BATCH']}).")
+    except ValueError as erreur:
+        db.session.rollback()
+        return erreur_api(str(erreur), 400)
+    for jeu in jeux:
+        jeu.update(chemins_jeu(jeu['dataset']))
+
+    # Vérification des en-têtes de chaque jeu de données, comme pour le formulaire d'analyse
+    erreurs = {}
+    for jeu in jeux:
+        erreurs_jeu = valider_fichiers(jeu['counts_file'], jeu['metadata_file'], jeu['genes_file'], covariables, contrastes)
+        if erreurs_jeu:
+            erreurs[jeu['name']] = erreurs_jeu
+    if erreurs:
+        db.session.rollback()
+        return erreur_api('Jeux de données invalides.', 400, datasets=erreurs)
+
+    maintenant = datetime.now()
+    soumis = []
+    en_file = False
+    for jeu in jeux:
+        # Empreinte des fichiers calculée une seule fois par jeu de données et paramètres d'ajustement
+        cles_modele = {}
+        for parametres in grille:
+            ajustement = (parametres['refit_cooks'], parametres['min_reads_per_gene'])
+            if ajustement not in cles_modele:
+                cles_modele[ajustement] = cle_modele(jeu['counts_file'], jeu['metadata_file'], *ajustement, jeu['genes_file'], covariables, contrastes)
+            cle = cle_cache(cles_modele[ajustement], parametres['alpha_thres'], parametres['lfc_thres'])
+            run = Run(user_id=user.id, analysis_date=maintenant)
+            db.session.add(run)
+            mettre_en_file(run, jeu['counts_file'], jeu['metadata_file'], parametres['refit_cooks'], parametres['min_reads_per_gene'],
+                           parametres['alpha_thres'], parametres['lfc_thres'], model_key=cles_modele[ajustement], cache_key=cle,
+                           genes_file=jeu['genes_file'], covariables=covariables, contrastes=contrastes, jeu_donnees=jeu['dataset'])
+            en_file |= not appliquer_cache(run, cle)
+            soumis.append((jeu['name'], parametres, run))
+    db.session.commit()
+    if en_file:
+        ordonnanceur.reveiller()
+
+    return jsonify(runs=[{
+        'run_id': run.id,
+        'dataset': nom,
+        'dataset_id': run.dataset_id,
+        'parameters': parametres,
+        'status': run.status,
+    } for nom, parametres, run in soumis]), 201
+
+# Route de l'API pour les jeux de données déjà téléversés, réutilisables dans un lot (champs dataset_id)
+@app.route('/api/datasets')
+def api_datasets():
+    user = utilisateur_api()
+    if user is None:
+        return erreur_api("Jeton d'accès manquant ou invalide.", 401)
+    return jsonify(datasets=[dict(jeu, created_at=jeu['created_at'].isoformat(), last_used_at=jeu['last_used_at'].isoformat())
+                             for jeu in jeux_utilisateur(user.id)])
+
+# Route de l'API pour les résultats d'un gène dans toutes les analyses indexées de l'utilisateur, mêmes filtres que la page
+# /genes (padj_max, lfc_min, significant, date_from, date_to, sort) et pagination par curseur (?cursor=<next_cursor>)
+@app.route('/api/genes/<gene>')
+def api_genes(gene):
+    user = utilisateur_api()
+    if user is None:
+        return erreur_api("Jeton d'accès manquant ou invalide.", 401)
+    filtres, criteres = filtres_genes(request.args)
+    taille = max(1, min(request.args.get('limit', app.config['GENES_PAGE_SIZE'], type=int), app.config['GENES_PAGE_SIZE']))
+    resultats, suivant = rechercher_gene(gene, criteres, filtres['sort'], request.args.get('cursor'), taille, user_id=user.id)
+    return jsonify(gene=gene, results=[dict(resultat, analysis_date=resultat['analysis_date'].isoformat())
+                                       for resultat in resultats], next_cursor=suivant)
+
+# Route de l'API pour l'état de plusieurs analyses (?ids=1,2,3), avec le résumé des résultats de celles qui sont terminées
+@app.route('/api/runs')
+def api_runs():
+    user = utilisateur_api()
+    if user is None:
+        return erreur_api("Jeton d'accès manquant ou invalide.", 401)
+    try:
+        ids = ids_runs_api()
+    except ValueError:
+        return erreur_api('Identifiants de runs invalides.', 400)
+    if len(ids) > app.config['API_MAX_RUNS_PER_BATCH']:
+        return erreur_api(f"Au plus {app.config['API_MAX_RUNS_PER_BATCH']} runs par requête.", 400)
+    runs, introuvables = runs_api(user, ids)
+    return jsonify(runs=[etat_run_api(run) for run in runs], missing=introuvables)
+
+# Route de l'API pour le CSV des résultats d'un contraste d'une analyse terminée (?contrast=<position>, 0 par défaut)
+@app.route('/api/runs/<int:run_id>/results.csv')
+def api_run_csv(run_id):
+    user = utilisateur_api()
+    if user is None:
+        return erreur_api("Jeton d'accès manquant ou invalide.", 401)
+    run = Run.query.filter_by(id=run_id, user_id=user.id, status=STATUT_TERMINE).first()
+    if run is None:
+        return erreur_api('Analyse introuvable ou non terminée.', 404)
+    try:
+        csv_data = csv_run(run, request.args.get('contrast', 0, type=int))
+    except IndexError:
+        return erreur_api("L'analyse n'a pas ce contraste.", 404)
+    return Response(csv_data, mimetype='text/csv')
+
+# Route de l'API pour les résultats de plusieurs analyses en une requête (?ids=1,2,3): archive zip d'un CSV par contraste
+# de chaque analyse terminée (run_<id>/contrast_<position>_<condition testée>_vs_<référence>.csv). Les analyses non terminées
+# sont ignorées; leur état est donné par /api/runs.
+@app.route('/api/runs/results.zip')
+def api_runs_zip():
+    user = utilisateur_api()
+    if user is None:
+        return erreur_api("Jeton d'accès manquant ou invalide.", 401)
+    try:
+        ids = ids_runs_api()
+    except ValueError:
+        return erreur_api('Identifiants de runs invalides.', 400)
+    if len(ids) > app.config['API_MAX_RUNS_PER_BATCH']:
+        return erreur_api(f"Au plus {app.config['API_MAX_RUNS_PER_BATCH']} runs par requête.", 400)
+    runs, _ = runs_api(user, ids)
+
+    # L'archive est écrite dans un fichier temporaire (les tables peuvent être volumineuses), CSV par CSV
+    fichier = tempfile.TemporaryFile()
+    with zipfile.ZipFile(fichier, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for run in runs:
+            if run.status != STATUT_TERMINE:
+                continue
+            for contraste in resume_run(run)['contrastes']:
+                nom = secure_filename(f"contrast_{contraste['position']}_{contraste['condition_1']}_vs_{contraste['condition_2']}")
+                try:
+                    csv_data = csv_run(run, contraste['position'])
+                except (IndexError, FileNotFoundError):
+                    continue
+                with archive.open(f'run_{run.id}/{nom}.csv', 'w') as sortie:
+                    for bloc in csv_data if not isinstance(csv_data, str) else [csv_data]:
+                        sortie.write(bloc.encode())
+    fichier.seek(0)
+    return send_file(fichier, mimetype='application/zip', as_attachment=True, download_name='results.zip')
+
+# Route des métriques au format texte de Prometheus (file d'attente, cache, temps et mémoire par étape d'analyse)
+@app.route('/metrics')
+def metrics():
+    return Response(exporter_metriques(), mimetype='text/plain; version=0.0.4')
 
 # Route pour la page d'accueil qui redirige vers la connexion
 @app.route('/')
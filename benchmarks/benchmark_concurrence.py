@@ -0,0 +1,214 @@
+# benchmarks/benchmark_concurrence.py
+# Test de charge de la BD: lectures et écritures simultanées.
+#
+# Des threads lecteurs chargent le tableau de bord (/dashboard, comme un navigateur) pendant que des threads
+# écrivains enregistrent des résultats comme l'ordonnanceur: mise à jour du run et remplacement de ses lignes dans
+# l'index des gènes (--rows lignes, une seule transaction), en boucle pendant --duration secondes.
+# La même charge est mesurée avec deux configurations de la BD SQLite, chacune dans un nouvel interpréteur et une BD
+# temporaire:
+#   avant       réglages par défaut de SQLite (journal rollback, attente d'un verrou 5 s, nouvelle connexion par session)
+#   apres       réglages de l'application (journal WAL, DATABASE_BUSY_TIMEOUT, pool de DATABASE_POOL_SIZE connexions)
+# Pour chacune: latence des lectures (médiane, p95, p99, max), débit des lectures et des écritures, erreurs (BD
+# verrouillée). Les résultats sont écrits dans un fichier JSON, qui peut servir de référence (--compare).
+#
+# Exemples:
+#   python benchmarks/benchmark_concurrence.py --output benchmarks/concurrence.json
+#   python benchmarks/benchmark_concurrence.py --readers 8 --writers 2 --rows 50000 --compare benchmarks/concurrence.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGURATIONS = {
+    'avant': {'DATABASE_WAL': '0', 'DATABASE_BUSY_TIMEOUT': '5', 'DATABASE_POOL_SIZE': '0'},
+    'apres': {},
+}
+
+MESURE = '''
+import json, random, threading, time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import OperationalError
+import app
+from models import db, User, Run, STATUT_TERMINE
+from fonctions_genes import remplacer_lignes
+
+with app.app.app_context():
+    for numero in range(PARAMETRES['users']):
+        db.session.add(User(email=f'utilisateur{numero}@exemple.org', first_name='Utilisateur', last_name=str(numero)))
+    db.session.commit()
+    utilisateurs = [(user.id, user.email) for user in User.query.all()]
+    debut = datetime(2024, 1, 1)
+    db.session.execute(Run.__table__.insert(), [{
+        'user_id': user_id, 'status': STATUT_TERMINE, 'analysis_date': debut + timedelta(minutes=position),
+        'counts_file': 'counts.csv', 'alpha_thres': 0.05, 'lfc_thres': 1.0, 'n_genes': PARAMETRES['rows'],
+        'genes_indexed': True,
+    } for position in range(PARAMETRES['runs']) for user_id, _ in utilisateurs])
+    db.session.commit()
+    runs = [run_id for run_id, in db.session.query(Run.id).all()]
+
+fin = time.monotonic() + PARAMETRES['duration']
+lectures, ecritures = [], []
+erreurs = {'reads': 0, 'writes': 0}
+verrou = threading.Lock()
+
+def lecteur(user_id, email):
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['user_email'] = email
+    while time.monotonic() < fin:
+        debut = time.perf_counter()
+        try:
+            reponse = client.get('/dashboard')
+            ok = reponse.status_code == 200
+        except OperationalError:
+            ok = False
+        duree = time.perf_counter() - debut
+        with verrou:
+            if ok:
+                lectures.append(duree)
+            else:
+                erreurs['reads'] += 1
+
+def ecrivain(graine):
+    aleatoire = random.Random(graine)
+    # Lignes préparées une fois: seule la transaction d'écriture est mesurée
+    lignes = [{'run_id': 0, 'position': 0, 'gene': f'gene{numero}', 'base_mean': aleatoire.random() * 1000,
+               'log2_fold_change': aleatoire.gauss(0, 2), 'padj': aleatoire.random()} for numero in range(PARAMETRES['rows'])]
+    profil = json.dumps({'charge': 'x' * PARAMETRES['payload']})
+    while time.monotonic() < fin:
+        run_id = aleatoire.choice(runs)
+        for ligne in lignes:
+            ligne['run_id'] = run_id
+        debut = time.perf_counter()
+        with app.app.app_context():
+            try:
+                Run.query.filter_by(id=run_id).update({'profile': profil, 'finished_at': datetime.utcnow()},
+                                                      synchronize_session=False)
+                remplacer_lignes(run_id, lignes)
+                db.session.commit()
+                ok = True
+            except OperationalError:
+                db.session.rollback()
+                ok = False
+            finally:
+                db.session.remove()
+        duree = time.perf_counter() - debut
+        with verrou:
+            if ok:
+                ecritures.append(duree)
+            else:
+                erreurs['writes'] += 1
+
+threads = [threading.Thread(target=lecteur, args=utilisateurs[numero % len(utilisateurs)]) for numero in range(PARAMETRES['readers'])]
+threads += [threading.Thread(target=ecrivain, args=(numero,)) for numero in range(PARAMETRES['writers'])]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+
+def centile(valeurs, proportion):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(proportion * len(valeurs)))] if valeurs else None
+
+print(json.dumps({
+    'read_p50': centile(lectures, 0.5),
+    'read_p95': centile(lectures, 0.95),
+    'read_p99': centile(lectures, 0.99),
+    'read_max': max(lectures, default=None),
+    'reads_per_s': len(lectures) / PARAMETRES['duration'],
+    'write_p50': centile(ecritures, 0.5),
+    'write_max': max(ecritures, default=None),
+    'writes_per_s': len(ecritures) / PARAMETRES['duration'],
+    'read_errors': erreurs['reads'],
+    'write_errors': erreurs['writes'],
+}))
+'''
+
+# Exécute la charge dans un nouvel interpréteur, avec une configuration de la BD et une BD temporaire
+def mesurer(configuration, parametres, dossier):
+    environnement = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(dossier, 'charge.sqlite')}",
+                         ANALYSIS_INLINE_WORKER='0', MAIL_INLINE_SENDER='0', PYTHONPATH=RACINE, **configuration)
+    prelude = f'PARAMETRES = {parametres!r}\n'
+    sortie = subprocess.run([sys.executable, '-c', prelude + MESURE], cwd=dossier, env=environnement,
+                            capture_output=True, text=True, check=True)
+    return json.loads(sortie.stdout.strip().splitlines()[-1])
+
+def informations_machine():
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def ms(valeur):
+    return f'{valeur * 1000:7.1f} ms' if valeur is not None else '      - ms'
+
+def afficher(nom, mesures):
+    print(f"{nom:6} lectures: médiane {ms(mesures['read_p50'])}, p95 {ms(mesures['read_p95'])}, p99 {ms(mesures['read_p99'])}, "
+          f"max {ms(mesures['read_max'])}, {mesures['reads_per_s']:6.1f}/s; écritures: {mesures['writes_per_s']:5.2f}/s "
+          f"(médiane {ms(mesures['write_p50'])}); erreurs: {mesures['read_errors']} lectures, {mesures['write_errors']} écritures")
+
+# Comparaison avec une référence (configuration apres): retourne la liste des régressions (latence p95 des lectures ou
+# durée médiane des écritures plus lente que la référence de plus de seuil, en proportion, et nouvelles erreurs)
+def comparer(resultats, reference, seuil):
+    regressions = []
+    actuel = resultats['measures']['apres']
+    precedent = reference.get('measures', {}).get('apres', {})
+    for cle in ('read_p95', 'write_p50'):
+        if actuel.get(cle) and precedent.get(cle) and actuel[cle] > precedent[cle] * (1 + seuil):
+            regressions.append((cle, precedent[cle], actuel[cle]))
+    for cle in ('read_errors', 'write_errors'):
+        if actuel[cle] > precedent.get(cle, 0):
+            regressions.append((cle, precedent.get(cle, 0), actuel[cle]))
+    for cle, avant, apres in regressions:
+        print(f"RÉGRESSION {cle}: {avant} -> {apres}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Test de charge de la BD: lectures et écritures simultanées.')
+    parser.add_argument('--duration', type=float, default=20, help='Durée de la charge de chaque configuration (s).')
+    parser.add_argument('--readers', type=int, default=4, help='Threads qui chargent le tableau de bord.')
+    parser.add_argument('--writers', type=int, default=2, help='Threads qui enregistrent des résultats.')
+    parser.add_argument('--rows', type=int, default=20000, help="Lignes de l'index des gènes écrites par résultat.")
+    parser.add_argument('--payload', type=int, default=256 * 1024, help='Octets du profil écrit dans le run par résultat.')
+    parser.add_argument('--users', type=int, default=4, help='Utilisateurs (chacun avec --runs analyses).')
+    parser.add_argument('--runs', type=int, default=200, help='Analyses par utilisateur.')
+    parser.add_argument('--configuration', choices=sorted(CONFIGURATIONS), action='append',
+                        help='Configuration mesurée (répétable; défaut: toutes).')
+    parser.add_argument('--output', help='Fichier JSON des résultats.')
+    parser.add_argument('--compare', help="Fichier JSON de référence; code de sortie 1 en cas de régression.")
+    parser.add_argument('--threshold', type=float, default=0.5, help='Ralentissement relatif toléré par --compare (0.5: 50%%).')
+    arguments = parser.parse_args()
+
+    parametres = {cle: getattr(arguments, cle) for cle in ('duration', 'readers', 'writers', 'rows', 'payload', 'users', 'runs')}
+    resultats = {'created_at': datetime.now().isoformat(timespec='seconds'), 'machine': informations_machine(),
+                 'parameters': parametres, 'measures': {}}
+    for nom in arguments.configuration or list(CONFIGURATIONS):
+        with tempfile.TemporaryDirectory() as dossier:
+            resultats['measures'][nom] = mesurer(CONFIGURATIONS[nom], parametres, dossier)
+        afficher(nom, resultats['measures'][nom])
+    if len(resultats['measures']) == len(CONFIGURATIONS) and arguments.readers and arguments.writers:
+        avant, apres = resultats['measures']['avant'], resultats['measures']['apres']
+        print(f"p95 des lectures: {avant['read_p95'] / apres['read_p95']:.1f}x plus rapide, "
+              f"max {avant['read_max'] / apres['read_max']:.1f}x; écritures: {apres['writes_per_s'] / max(avant['writes_per_s'], 1e-9):.1f}x le débit")
+
+    if arguments.output:
+        with open(arguments.output, 'w') as fichier:
+            json.dump(resultats, fichier, indent=2)
+
+    if arguments.compare and 'apres' in resultats['measures']:
+        with open(arguments.compare) as fichier:
+            reference = json.load(fichier)
+        if comparer(resultats, reference, arguments.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
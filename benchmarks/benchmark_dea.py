@@ -0,0 +1,307 @@
+# benchmarks/benchmark_dea.py
+# Banc d'essai des performances de l'analyse pyDESeq2.
+#
+# Mesure analyse_dea() et chacune de ses étapes (fonctions_profilage) sur les jeux de données du dépôt
+# (datasets/count_table.csv, GEO GSE200504 et GSE246572) et sur des matrices synthétiques de taille croissante.
+# Chaque cas est exécuté dans un processus séparé pour que le pic de mémoire mesuré soit le sien.
+# Les résultats sont écrits dans un fichier JSON, qui peut servir de référence pour une exécution suivante (--compare).
+#
+# Le mode --headless mesure aussi la latence de bout en bout (soumission -> résultats) à travers les routes Flask
+# avec le client de test, l'ordonnanceur intégré et une BD temporaire: analyse complète, resoumission identique
+# (cache des résultats) et changement de seuils.
+#
+# --cpus limite les cœurs de chaque analyse (processus de l'inférence pyDESeq2 et threads BLAS/OpenMP, comme les workers);
+# --concurrent exécute plusieurs analyses identiques en même temps pour mesurer la contention entre analyses.
+#
+# Exemples:
+#   python benchmarks/benchmark_dea.py --output benchmarks/baseline.json
+#   python benchmarks/benchmark_dea.py --suite complete --repeat 3 --output resultats.json --compare benchmarks/baseline.json
+#   python benchmarks/benchmark_dea.py --suite rapide --headless
+#   python benchmarks/benchmark_dea.py --suite rapide --concurrent 4 --cpus 8
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+import numpy as np
+import pandas as pd
+from fonctions_validation import decrire_counts
+
+# Jeux de données du dépôt: nom -> (counts, metadata)
+JEUX_DEPOT = {
+    'count_table': ('datasets/count_table.csv', 'datasets/metadata_table.csv'),
+    'GSE200504': ('datasets/external_datasets/counts_GSE200504.csv', 'datasets/external_datasets/metadata_GSE200504.csv'),
+    'GSE246572': ('datasets/external_datasets/counts_GSE246572.csv', 'datasets/external_datasets/metadata_GSE246572.csv'),
+}
+
+# Suites de cas: jeux du dépôt et tailles des matrices synthétiques (gènes x échantillons)
+SUITES = {
+    'rapide': (['count_table'], [(10000, 8)]),
+    'standard': (list(JEUX_DEPOT), [(10000, 8), (20000, 50)]),
+    'complete': (list(JEUX_DEPOT), [(10000, 8), (20000, 50), (60000, 100), (60000, 500)]),
+}
+
+# Paramètres d'analyse utilisés pour tous les cas
+PARAMETRES = {'refit_cooks': True, 'min_reads_per_gene': 10, 'alpha_thres': 0.05, 'lfc_thres': 1.0}
+
+# Dossier des matrices synthétiques (réutilisées d'une exécution à l'autre)
+DOSSIER_SYNTHETIQUES = os.path.join(RACINE, 'benchmarks', 'donnees')
+
+# Génération d'une matrice de counts synthétique (loi binomiale négative, 10% de gènes différentiels entre deux
+# conditions), écrite dans DOSSIER_SYNTHETIQUES. Retourne les chemins des fichiers counts et metadata.
+def matrice_synthetique(n_genes, n_samples, graine=0):
+    nom = f'synthetique_{n_genes}x{n_samples}_{graine}'
+    counts_file = os.path.join(DOSSIER_SYNTHETIQUES, f'{nom}_counts.csv')
+    metadata_file = os.path.join(DOSSIER_SYNTHETIQUES, f'{nom}_metadata.csv')
+    if os.path.exists(counts_file) and os.path.exists(metadata_file):
+        return counts_file, metadata_file
+
+    os.makedirs(DOSSIER_SYNTHETIQUES, exist_ok=True)
+    rng = np.random.default_rng(graine)
+    samples = [f'S{numero}' for numero in range(1, n_samples + 1)]
+    conditions = np.array(['A'] * (n_samples // 2) + ['B'] * (n_samples - n_samples // 2))
+    moyennes = rng.lognormal(mean=4, sigma=2, size=n_genes)
+    dispersions = 0.05 + 2 / np.sqrt(moyennes + 1)
+    facteurs = np.ones(n_genes)
+    differentiels = rng.choice(n_genes, size=n_genes // 10, replace=False)
+    facteurs[differentiels] = 2 ** rng.normal(0, 1.5, size=len(differentiels))
+
+    fichier_temporaire = f'{counts_file}.tmp'
+    with open(fichier_temporaire, 'w') as fichier:
+        fichier.write(','.join(['Geneid'] + samples) + '\n')
+        # Écriture par blocs de gènes pour borner la mémoire des grandes matrices
+        for debut in range(0, n_genes, 5000):
+            fin = min(debut + 5000, n_genes)
+            mu = np.outer(moyennes[debut:fin], np.ones(n_samples))
+            mu[:, conditions == 'B'] *= facteurs[debut:fin, None]
+            n = 1 / dispersions[debut:fin, None]
+            bloc = rng.negative_binomial(n, n / (n + mu))
+            genes = pd.Index([f'GENE{numero:06d}' for numero in range(debut, fin)])
+            pd.DataFrame(bloc, index=genes, columns=samples).to_csv(fichier, header=False)
+    os.replace(fichier_temporaire, counts_file)
+    pd.DataFrame({'condition': conditions}, index=pd.Index(samples, name='sample')).to_csv(metadata_file)
+    return counts_file, metadata_file
+
+def cas_a_executer(suite, tailles=None):
+    jeux, synthetiques = SUITES[suite]
+    if tailles is not None:
+        synthetiques = tailles
+    cas = [(nom, os.path.join(RACINE, JEUX_DEPOT[nom][0]), os.path.join(RACINE, JEUX_DEPOT[nom][1])) for nom in jeux]
+    for n_genes, n_samples in synthetiques:
+        counts_file, metadata_file = matrice_synthetique(n_genes, n_samples)
+        cas.append((f'synthetique_{n_genes}x{n_samples}', counts_file, metadata_file))
+    return cas
+
+# Exécuté dans un processus séparé: analyse_dea() répétée, avec les mesures de chaque étape
+# (coeurs: cœurs de l'analyse; None: choix par défaut de pyDESeq2 et des bibliothèques BLAS)
+def executer_cas(counts_file, metadata_file, repetitions, coeurs=None):
+    from fonctions_analyse import analyse_dea
+    from fonctions_jobs import limiter_threads
+    executions = []
+    with tempfile.TemporaryDirectory() as dossier, limiter_threads(coeurs) if coeurs else contextlib.nullcontext():
+        for repetition in range(repetitions):
+            profil = {}
+            debut = time.perf_counter()
+            resume, _ = analyse_dea(counts_file, metadata_file, modele_path=os.path.join(dossier, f'{repetition}.npz'),
+                                    profil=profil, n_cpus=coeurs, **PARAMETRES)
+            executions.append({'wall': time.perf_counter() - debut, 'stages': profil, 'n_genes': resume['n_genes']})
+    return {
+        'executions': executions,
+        # ru_maxrss est en kilo-octets sous Linux
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    }
+
+# Médiane des temps et plus grand pic de mémoire des répétitions d'un cas
+def resumer_cas(nom, counts_file, resultat):
+    executions = resultat['executions']
+    etapes = {}
+    for etape in executions[0]['stages']:
+        mesures = [execution['stages'][etape] for execution in executions if etape in execution['stages']]
+        etapes[etape] = {
+            'wall': statistics.median(mesure['wall'] for mesure in mesures),
+            'cpu': statistics.median(mesure['cpu'] for mesure in mesures),
+            'peak_rss': max(mesure['peak_rss'] for mesure in mesures),
+            'peak_rss_children': max(mesure['peak_rss_children'] for mesure in mesures),
+        }
+    return {
+        'counts_file': os.path.relpath(counts_file, RACINE),
+        'n_samples': decrire_counts(counts_file)['n_samples'],
+        'n_genes_tested': executions[0]['n_genes'],
+        'repeat': len(executions),
+        'wall': statistics.median(execution['wall'] for execution in executions),
+        'wall_runs': [execution['wall'] for execution in executions],
+        'peak_rss': resultat['peak_rss'],
+        'stages': etapes,
+    }
+
+# Latence de bout en bout à travers les routes Flask (client de test), avec une BD et des dossiers temporaires
+def executer_headless(cas, dossier):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(dossier, 'benchmark.sqlite')}"
+    os.environ['RESULTS_DIR'] = os.path.join(dossier, 'resultats')
+    os.environ.setdefault('ANALYSIS_POLL_INTERVAL', '0.2')
+    os.environ['ANALYSIS_INLINE_WORKER'] = '1'
+    # Les fichiers déposés sont écrits dans le dépôt du dossier temporaire, pas dans datasets/depot/ du dépôt git
+    os.environ['UPLOADS_DIR'] = os.path.join(dossier, 'depot')
+    os.chdir(dossier)
+    import app as application
+    app = application.app
+    app.config['PLOTS_DIR'] = os.path.join(dossier, 'figures')
+    client = app.test_client()
+    with app.app_context():
+        utilisateur = application.User(email='benchmark@example.org', first_name='Benchmark', last_name='Benchmark')
+        application.db.session.add(utilisateur)
+        application.db.session.commit()
+        user_id = utilisateur.id
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+
+    def attendre(run_id):
+        while True:
+            etat = client.get(f'/runs/{run_id}/status').get_json()
+            if etat['status'] in ('done', 'failed'):
+                return etat
+            time.sleep(0.05)
+
+    def soumettre(nom, counts_file, metadata_file):
+        with open(counts_file, 'rb') as counts, open(metadata_file, 'rb') as metadata:
+            donnees = {
+                'min_reads_per_gene': str(PARAMETRES['min_reads_per_gene']),
+                'alpha_thres': str(PARAMETRES['alpha_thres']),
+                'lfc_thres': str(PARAMETRES['lfc_thres']),
+                'options': 'refit_cooks',
+                'counts_file': (counts, f'{nom}_{os.path.basename(counts_file)}'),
+                'metadata_file': (metadata, f'{nom}_{os.path.basename(metadata_file)}'),
+            }
+            reponse = client.post('/analyse', data=donnees, content_type='multipart/form-data')
+        if reponse.status_code != 302:
+            raise RuntimeError(f"Soumission refusée pour {nom} (HTTP {reponse.status_code})")
+        with client.session_transaction() as session:
+            return session['run_id']
+
+    mesures = {}
+    for nom, counts_file, metadata_file in cas:
+        latences = {}
+        debut = time.perf_counter()
+        run_id = soumettre(nom, counts_file, metadata_file)
+        etat = attendre(run_id)
+        client.get(f'/results/{run_id}')
+        latences['submit_to_result'] = time.perf_counter() - debut
+
+        debut = time.perf_counter()
+        attendre(soumettre(nom, counts_file, metadata_file))
+        latences['submit_to_result_cached'] = time.perf_counter() - debut
+
+        debut = time.perf_counter()
+        client.post(f'/results/{run_id}/rethreshold', data={'alpha_thres': '0.1', 'lfc_thres': '0.5'})
+        attendre(run_id)
+        latences['rethreshold'] = time.perf_counter() - debut
+        latences['status'] = etat['status']
+        mesures[nom] = latences
+        print(f"{nom}: analyse {latences['submit_to_result']:.2f} s, cache {latences['submit_to_result_cached']:.3f} s, "
+              f"seuils {latences['rethreshold']:.2f} s ({etat['status']})")
+    application.ordonnanceur.arreter()
+    return mesures
+
+def informations_machine():
+    import pydeseq2
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'pydeseq2': pydeseq2.__version__,
+    }
+
+# Comparaison avec une référence: retourne la liste des régressions (temps médian plus lent que la référence de plus
+# de seuil, en proportion, et d'au moins ecart_minimal secondes pour ignorer le bruit des étapes très courtes)
+def comparer(resultats, reference, seuil, ecart_minimal=0.05):
+    regressions = []
+    lignes = []
+    for nom, cas in resultats['cases'].items():
+        cas_reference = reference.get('cases', {}).get(nom)
+        if cas_reference is None:
+            continue
+        paires = [('total', cas['wall'], cas_reference['wall'])]
+        paires += [(etape, mesure['wall'], cas_reference['stages'][etape]['wall'])
+                   for etape, mesure in cas['stages'].items() if etape in cas_reference['stages']]
+        for etape, actuel, precedent in paires:
+            ratio = actuel / precedent if precedent > 0 else float('inf')
+            regression = ratio > 1 + seuil and actuel - precedent > ecart_minimal
+            lignes.append(f"{nom:32} {etape:24} {precedent:9.3f} s {actuel:9.3f} s {ratio:6.2f}x{'  RÉGRESSION' if regression else ''}")
+            if regression:
+                regressions.append((nom, etape, precedent, actuel))
+        memoire_precedente, memoire = cas_reference['peak_rss'], cas['peak_rss']
+        lignes.append(f"{nom:32} {'peak_rss (Mo)':24} {memoire_precedente / 2**20:9.1f}   {memoire / 2**20:9.1f}   {memoire / memoire_precedente:6.2f}x")
+    print('\n'.join(lignes))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai de l'analyse pyDESeq2 (temps et mémoire par étape).")
+    parser.add_argument('--suite', choices=sorted(SUITES), default='standard', help='Ensemble de cas à exécuter.')
+    parser.add_argument('--sizes', help="Tailles des matrices synthétiques, ex.: 10000x8,60000x500 (remplace celles de la suite).")
+    parser.add_argument('--repeat', type=int, default=1, help='Nombre de répétitions de chaque cas (médiane des temps).')
+    parser.add_argument('--output', help='Fichier JSON des résultats.')
+    parser.add_argument('--compare', help="Fichier JSON de référence; code de sortie 1 en cas de régression.")
+    parser.add_argument('--threshold', type=float, default=0.2, help='Ralentissement relatif toléré par --compare (0.2: 20%%).')
+    parser.add_argument('--headless', action='store_true', help='Mesurer aussi la latence de bout en bout à travers les routes Flask.')
+    parser.add_argument('--cpus', type=int, default=None, help='Cœurs de chaque analyse (défaut: tous, choix de pyDESeq2).')
+    parser.add_argument('--concurrent', type=int, default=1, help="Nombre d'analyses identiques exécutées en même temps pour chaque cas.")
+    arguments = parser.parse_args()
+
+    tailles = None
+    if arguments.sizes:
+        tailles = [tuple(int(valeur) for valeur in taille.split('x')) for taille in arguments.sizes.split(',')]
+    cas = cas_a_executer(arguments.suite, tailles)
+
+    resultats = {'created_at': datetime.now().isoformat(timespec='seconds'), 'machine': informations_machine(),
+                 'parameters': PARAMETRES, 'cpus': arguments.cpus, 'concurrent': arguments.concurrent, 'cases': {}}
+    # Un nouveau processus (spawn) par cas: pic de mémoire propre au cas, sans l'état des cas précédents
+    contexte = multiprocessing.get_context('spawn')
+    for nom, counts_file, metadata_file in cas:
+        debut = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=arguments.concurrent, mp_context=contexte) as pool:
+            futures = [pool.submit(executer_cas, counts_file, metadata_file, arguments.repeat, arguments.cpus)
+                       for _ in range(arguments.concurrent)]
+            parties = [future.result() for future in futures]
+        resultat = {
+            'executions': [execution for partie in parties for execution in partie['executions']],
+            'peak_rss': max(partie['peak_rss'] for partie in parties),
+        }
+        resultats['cases'][nom] = resumer_cas(nom, counts_file, resultat)
+        # Durée totale des analyses exécutées en même temps (--concurrent)
+        resultats['cases'][nom]['elapsed'] = time.perf_counter() - debut
+        print(f"{nom}: {resultats['cases'][nom]['wall']:.2f} s, pic RSS {resultats['cases'][nom]['peak_rss'] / 2**20:.0f} Mo"
+              + (f", {arguments.concurrent} analyses en {resultats['cases'][nom]['elapsed']:.2f} s" if arguments.concurrent > 1 else ''))
+
+    if arguments.headless:
+        with tempfile.TemporaryDirectory() as dossier:
+            resultats['headless'] = executer_headless(cas, dossier)
+
+    if arguments.output:
+        with open(arguments.output, 'w') as fichier:
+            json.dump(resultats, fichier, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare) as fichier:
+            reference = json.load(fichier)
+        regressions = comparer(resultats, reference, arguments.threshold)
+        if regressions:
+            print(f"{len(regressions)} régression(s) par rapport à {arguments.compare}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# benchmarks/benchmark_demarrage.py
+# Banc d'essai du démarrage du processus web et du pool d'analyse.
+#
+# Chaque mesure est faite dans un nouvel interpréteur Python (comme un worker gunicorn qui démarre), avec une BD
+# temporaire:
+#   web         import de app.py (temps, pic RSS, modules de la pile scientifique chargés) puis première requête /login
+#   analyse     import de la pile scientifique (fonctions_analyse) dans un processus neuf: le coût qu'une analyse
+#               paierait sans le préchargement du pool
+#   pool        pool de l'ordonnanceur (forkserver préchargé): délai avant qu'un job soumis dès la création du pool
+#               s'exécute, puis surcoût d'un job une fois le pool prêt
+# Les résultats (médianes de --repeat exécutions) sont écrits dans un fichier JSON, qui peut servir de référence pour une
+# exécution suivante (--compare).
+#
+# Exemples:
+#   python benchmarks/benchmark_demarrage.py --output benchmarks/demarrage.json
+#   python benchmarks/benchmark_demarrage.py --repeat 10 --compare benchmarks/demarrage.json
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules qui ne doivent pas être chargés par le processus web
+MODULES_LOURDS = ['pandas', 'matplotlib', 'seaborn', 'scipy', 'sklearn', 'anndata', 'pydeseq2']
+
+MESURE_WEB = '''
+import json, resource, sys, time
+debut = time.perf_counter()
+import app
+import_app = time.perf_counter() - debut
+client = app.app.test_client()
+debut = time.perf_counter()
+client.get('/login')
+premiere_requete = time.perf_counter() - debut
+print(json.dumps({
+    'import_app': import_app,
+    'first_request': premiere_requete,
+    'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    'heavy_modules': sorted(module for module in MODULES_LOURDS if module in sys.modules),
+}))
+'''
+
+MESURE_ANALYSE = '''
+import json, resource, time
+debut = time.perf_counter()
+import fonctions_analyse
+print(json.dumps({
+    'import_analysis_stack': time.perf_counter() - debut,
+    'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+}))
+'''
+
+MESURE_POOL = '''
+import json, time
+import app
+from fonctions_jobs import Ordonnanceur, prechauffer
+ordonnanceur = Ordonnanceur(app.app, max_workers=2)
+debut = time.perf_counter()
+pool = ordonnanceur.nouveau_pool()
+pool.submit(prechauffer).result()
+pret = time.perf_counter() - debut
+# Pool prêt: les deux processus sont démarrés et la pile scientifique est déjà importée
+debut = time.perf_counter()
+pool.submit(prechauffer).result()
+surcout = time.perf_counter() - debut
+pool.shutdown()
+print(json.dumps({'pool_ready': pret, 'job_overhead': surcout, 'start_method': ordonnanceur.contexte.get_start_method()}))
+'''
+
+# Exécute une mesure dans un nouvel interpréteur, avec une BD et un dossier de travail temporaires
+def mesurer(code, dossier):
+    environnement = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(dossier, 'benchmark.sqlite')}",
+                         ANALYSIS_INLINE_WORKER='0', PYTHONPATH=RACINE)
+    prelude = f'MODULES_LOURDS = {MODULES_LOURDS!r}\n'
+    sortie = subprocess.run([sys.executable, '-c', prelude + code], cwd=dossier, env=environnement,
+                            capture_output=True, text=True, check=True)
+    return json.loads(sortie.stdout.strip().splitlines()[-1])
+
+# Médiane de chaque mesure numérique des répétitions (les autres valeurs sont celles de la dernière répétition)
+def resumer(executions):
+    resume = dict(executions[-1])
+    for cle, valeur in resume.items():
+        if isinstance(valeur, (int, float)):
+            resume[cle] = statistics.median(execution[cle] for execution in executions)
+    return resume
+
+def informations_machine():
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+    }
+
+# Comparaison avec une référence: retourne la liste des régressions (temps plus lent que la référence de plus de seuil,
+# en proportion, et d'au moins ecart_minimal secondes)
+def comparer(resultats, reference, seuil, ecart_minimal=0.05):
+    regressions = []
+    for partie, mesures in resultats['measures'].items():
+        mesures_reference = reference.get('measures', {}).get(partie, {})
+        for cle, actuel in mesures.items():
+            precedent = mesures_reference.get(cle)
+            if not isinstance(actuel, float) or not isinstance(precedent, (int, float)) or cle == 'peak_rss':
+                continue
+            ratio = actuel / precedent if precedent > 0 else float('inf')
+            regression = ratio > 1 + seuil and actuel - precedent > ecart_minimal
+            print(f"{partie:10} {cle:24} {precedent:9.3f} s {actuel:9.3f} s {ratio:6.2f}x{'  RÉGRESSION' if regression else ''}")
+            if regression:
+                regressions.append((partie, cle, precedent, actuel))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc d'essai du démarrage du processus web et du pool d'analyse.")
+    parser.add_argument('--repeat', type=int, default=5, help='Nombre de répétitions de chaque mesure (médiane).')
+    parser.add_argument('--output', help='Fichier JSON des résultats.')
+    parser.add_argument('--compare', help="Fichier JSON de référence; code de sortie 1 en cas de régression.")
+    parser.add_argument('--threshold', type=float, default=0.2, help='Ralentissement relatif toléré par --compare (0.2: 20%%).')
+    arguments = parser.parse_args()
+
+    resultats = {'created_at': datetime.now().isoformat(timespec='seconds'), 'machine': informations_machine(),
+                 'repeat': arguments.repeat, 'measures': {}}
+    for partie, code in (('web', MESURE_WEB), ('analyse', MESURE_ANALYSE), ('pool', MESURE_POOL)):
+        with tempfile.TemporaryDirectory() as dossier:
+            resultats['measures'][partie] = resumer([mesurer(code, dossier) for _ in range(arguments.repeat)])
+    web, analyse, pool = (resultats['measures'][partie] for partie in ('web', 'analyse', 'pool'))
+    print(f"web: import de app.py {web['import_app']:.3f} s, première requête {web['first_request']:.3f} s, "
+          f"pic RSS {web['peak_rss'] / 2**20:.0f} Mo, modules lourds chargés: {', '.join(web['heavy_modules']) or 'aucun'}")
+    print(f"analyse: import de la pile scientifique {analyse['import_analysis_stack']:.3f} s, pic RSS {analyse['peak_rss'] / 2**20:.0f} Mo")
+    print(f"pool ({pool['start_method']}): prêt en {pool['pool_ready']:.3f} s, surcoût d'un job {pool['job_overhead'] * 1000:.1f} ms")
+
+    if arguments.output:
+        with open(arguments.output, 'w') as fichier:
+            json.dump(resultats, fichier, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare) as fichier:
+            reference = json.load(fichier)
+        regressions = comparer(resultats, reference, arguments.threshold)
+        if regressions:
+            print(f"{len(regressions)} régression(s) par rapport à {arguments.compare}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
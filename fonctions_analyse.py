@@ -1,169 +1,331 @@
 # Fonctions appelés par app.py
 
 import os
+from itertools import combinations
 import pandas as pd
 import numpy as np
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
 import seaborn as sns
+from scipy.cluster import hierarchy
 from pydeseq2.dds import DeseqDataSet
 from pydeseq2.ds import DeseqStats
+from joblib import Parallel, delayed
+from fonctions_ingestion import ingerer
+from fonctions_validation import niveau_pydeseq
+from fonctions_figures import HEATMAP_MAX_GENES
+from fonctions_profilage import mesurer
+from models import ETAPE_LECTURE, ETAPE_SIZE_FACTORS, ETAPE_DISPERSIONS, ETAPE_LFC, ETAPE_COOKS, ETAPE_WALD, ETAPE_FIGURES
 import io
-import base64
-
-def csv_to_pandaDF(csv_file):
-    # Convertie .csv en pandas.Dataframe
-    panda_df = pd.read_csv(csv_file)
-    return panda_df
-
-def preprocess_counts(counts, min_reads_per_gene):
-    # pydeseq2 nécessite que la 1ère colonne de données (gènes/samples) soit la colonne index de la pandas.Dataframe afin d'avoir que des
-    # des nombres dans la matrice counts (et non le nom des gènes/samples)
-    counts = counts.set_index(counts.columns[0])    
-    
-    ## Filtrer les comptes brutes ##
-    # @kanapathippilai.mathura DATA FILTERING: filter out NaN conditions, low counts per gene
-    # Calcule la somme des counts/reads par gène (par row sans compter la 1ere colonne avec les noms des gènes) et
-    # garder que les gènes qui ont une somme plus grande que min_reads_per_gene pour enlever les gènes qui
-    # contiennent peu de reads/counts à travers tous les échantillons
-    counts = counts[counts.sum(axis = 1) >= min_reads_per_gene]
-
-    ## Inverser les colonnes et lignes ##
-    # La majorité des données counts sur les base de données comme NCBI GEO sont comme-ci:
-        # ligne: features/gènes
-        # colonne: les échantillons
-    # pydeseq2 nécessite que counts soit comme-ci:
-        # ligne: les échantillons
-        # colonne: features/gènes
-    counts = counts.T
-    return counts
-
-def preprocess_df(counts_file, metadata_file, min_reads_per_gene):
-    counts = csv_to_pandaDF(counts_file)
-    metadata = csv_to_pandaDF(metadata_file)
-
-    counts = preprocess_counts(counts, min_reads_per_gene)
-    
-    # pydeseq2 nécessite que la 1ère colonne de données (gènes/samples) soit la colonne index de la pandas.Dataframe afin d'avoir que des
-    # des nombres dans la matrice counts (et non le nom des gènes/samples)
-    metadata = metadata.set_index(metadata.columns[0])
 
+# fastcluster est optionnel: même résultat que scipy pour le clustering du heatmap, mais plus rapide
+try:
+    import fastcluster
+except ImportError:
+    fastcluster = None
+
+# Au-delà de ce nombre de gènes non significatifs, le volcano plot les affiche en densité (hexbin) plutôt qu'en points
+VOLCANO_HEXBIN_MIN_POINTS = 20000
+
+# Signale le début d'une étape de l'analyse (progression: fonction appelée avec le nom de l'étape, ou None)
+def signaler(progression, etape):
+    if progression is not None:
+        progression(etape)
+
+def preprocess_df(counts_file, metadata_file, min_reads_per_gene, genes_file=None, covariables=None):
+    # Lecture par blocs des counts avec filtration des gènes qui ont peu de reads (min_reads_per_gene), après
+    # vérification que les échantillons des counts et metadata correspondent.
+    # pydeseq2 nécessite que les noms des gènes/samples soient les index des pandas.Dataframe afin d'avoir que des
+    # des nombres dans la matrice counts, et que counts soit: ligne: les échantillons, colonne: features/gènes
+    counts, metadata = ingerer(counts_file, metadata_file, min_reads_per_gene, genes_file=genes_file, covariables=covariables)
     return counts, metadata
 
 def get_design_factor(metadata):
     design_factor = str(metadata.columns[0])
     return design_factor
 
-def pipeline_pydeseq(counts, metadata, design_factor, refit_cooks):
+# Toutes les paires de conditions du design factor: chaque condition est testée contre chacune des conditions
+# qui la précèdent dans l'ordre alphabétique (la 1ère paire est le contraste par défaut de pydeseq2)
+def paires_conditions(conditions):
+    return [[testee, reference] for reference, testee in combinations(sorted(conditions), 2)]
+
+# Test de Wald d'un contraste [design_factor, condition testée, condition de référence] sur le modèle déjà ajusté,
+# avec les mêmes processus d'inférence que l'ajustement (sans inference, DeseqStats utiliserait tous les cœurs)
+def tester_contraste(dds, contrast):
+    ds = DeseqStats(dds, contrast=contrast, inference=dds.inference)
+    ds.summary()
+    return ds.results_df, list(ds.contrast)
+
+# n_cpus: processus de l'inférence pyDESeq2 (joblib) pour l'ajustement et les tests (None: tous les cœurs de la machine)
+def pipeline_pydeseq(counts, metadata, design_factor, refit_cooks, progression=None, profil=None, covariables=None, contrastes=None, processus=1,
+                     n_cpus=None):
     # Creation d'objet DeseqDataSet à partir de counts et metadata qui contient:
     #   dds.X       Matrice des counts des gènes pour chaque sample (n_samples x n_gènes)
     #   dds.obs     Matrice 1D des valeurs des design_factors où index: nom des samples (length: n_samples)
     #   dds.var     Matrice 1D des annotations gene-level où index: nom des gènes (length: n_genes)
     #   dds.varm    Contient 'dispersions', 'fitted_dispersions', 'LFC', '_outlier_genes'
     #   etc. ...
-    dds = DeseqDataSet(
-        counts=counts,
-        metadata=metadata,
-        design_factors=design_factor,
-        refit_cooks=refit_cooks
-    )
-    # Effectue l'estimation de la dispersion et log fold change (LFC)
-    # Enveloppe pour la 1ère partie du pipeline pydeseq2 avant d'utiliser DeseqStats()
-    dds.deseq2()
-
-    ds = DeseqStats(dds)
-    ds.summary()
+    # Le design factor doit être le dernier facteur du design (après les covariables): c'est celui des contrastes.
+    # Les covariables numériques sont des facteurs continus, les autres des facteurs catégoriels.
+    covariables = list(covariables or [])
+    continus = [covariable for covariable in covariables if pd.api.types.is_numeric_dtype(metadata[covariable])]
+    with mesurer(profil, 'construction'):
+        dds = DeseqDataSet(
+            counts=counts,
+            metadata=metadata,
+            design_factors=covariables + [design_factor] if covariables else design_factor,
+            continuous_factors=continus or None,
+            refit_cooks=refit_cooks,
+            n_cpus=n_cpus
+        )
+    # pydeseq2 remplace les '_' des noms de facteurs par des '-'
+    design_factor = dds.design_factors[-1]
+    # Effectue l'estimation de la dispersion et log fold change (LFC): mêmes étapes que dds.deseq2(),
+    # appelées une par une pour signaler la progression et mesurer chaque étape
+    signaler(progression, ETAPE_SIZE_FACTORS)
+    with mesurer(profil, ETAPE_SIZE_FACTORS):
+        dds.fit_size_factors()
+    signaler(progression, ETAPE_DISPERSIONS)
+    with mesurer(profil, ETAPE_DISPERSIONS):
+        dds.fit_genewise_dispersions()
+        dds.fit_dispersion_trend()
+        dds.fit_dispersion_prior()
+        dds.fit_MAP_dispersions()
+    signaler(progression, ETAPE_LFC)
+    with mesurer(profil, ETAPE_LFC):
+        dds.fit_LFC()
+    signaler(progression, ETAPE_COOKS)
+    with mesurer(profil, ETAPE_COOKS):
+        dds.calculate_cooks()
+        if dds.refit_cooks:
+            # Remplace les counts outliers, puis refait l'estimation des dispersions et LFC des gènes concernés
+            dds.refit()
 
-    return dds, ds
+    # Un test de Wald par contraste, sans refaire l'ajustement; les tests peuvent être répartis sur plusieurs processus
+    if contrastes is None:
+        contrastes = paires_conditions(dds.obs[design_factor].unique())
+    # Conditions demandées renommées comme les niveaux du facteur dans dds.obs ('_' -> '-')
+    contrastes = [[design_factor, niveau_pydeseq(testee), niveau_pydeseq(reference)] for testee, reference in contrastes]
+    signaler(progression, ETAPE_WALD)
+    with mesurer(profil, ETAPE_WALD):
+        if processus > 1 and len(contrastes) > 1:
+            # Les processus de l'inférence sont partagés entre les tests faits en parallèle
+            n_jobs = min(processus, len(contrastes))
+            dds.inference.n_cpus = max(1, dds.inference.n_cpus // n_jobs)
+            resultats = Parallel(n_jobs=n_jobs)(delayed(tester_contraste)(dds, contrast) for contrast in contrastes)
+        else:
+            resultats = [tester_contraste(dds, contrast) for contrast in contrastes]
 
-def post_filt(res_df, dds, alpha_thres, lfc_thres):
+    return dds, resultats
+
+def post_filt(res_df, log1p_df, alpha_thres, lfc_thres):
     # Filtrer les gènes pour garder ceux qui sont expressés différentiellement de façon statistiquement significative (inférieur à alpha_thres)
     # et avec un plus grande variation d'expression génique (supérieur à lfc_thres)
     filt_res_df = res_df[(res_df.padj < alpha_thres) & (abs(res_df.log2FoldChange) > lfc_thres)]
 
-    # Filter dds avec les index des gènes de filt_res_df
-    filt_dds = dds[:,filt_res_df.index]
-    return filt_res_df, filt_dds
+    # Filter les counts log1p (samples x gènes) avec les index des gènes de filt_res_df
+    filt_log1p_df = log1p_df[filt_res_df.index]
+    return filt_res_df, filt_log1p_df
+
+# Gènes affichés dans le heatmap: au plus max_genes, les plus variables (les gènes de variance nulle ne peuvent pas
+# être centrés-réduits)
+def selectionner_genes_heatmap(log1p_df, max_genes=HEATMAP_MAX_GENES):
+    variances = log1p_df.var(axis=0)
+    variances = variances[variances > 0]
+    return log1p_df[variances.nlargest(max_genes).index]
 
-def plot_heatmap(dea_df):
-    clustermap_data = pd.DataFrame(dea_df.layers['log1p'].T, index=dea_df.var_names, columns=dea_df.obs_names)
+# Clustering hiérarchique (average, euclidien, comme seaborn) des lignes d'une matrice
+def lier(matrice):
+    if fastcluster is not None:
+        return fastcluster.linkage(matrice, method='average', metric='euclidean')
+    return hierarchy.linkage(matrice, method='average', metric='euclidean')
+
+def plot_heatmap(log1p_df, profil=None, max_genes=HEATMAP_MAX_GENES):
     new_virtual_file = io.BytesIO()
 
-    sns.clustermap(clustermap_data, z_score=0, cmap='RdYlBu_r')
-    plt.title('Heatmap')
-    plt.savefig(new_virtual_file, bbox_inches='tight', format='png')
-    plt.close()
+    with mesurer(profil, 'heatmap_clustermap'):
+        clustermap_data = selectionner_genes_heatmap(log1p_df, max_genes).T
+        if clustermap_data.shape[0] == 0:
+            # Aucun gène significatif avec ces seuils: figure vide avec un message
+            plt.figure(figsize=(6, 2))
+            plt.text(0.5, 0.5, 'Aucun gène significatif à afficher', ha='center', va='center')
+            plt.axis('off')
+        else:
+            # Les clusterings sont calculés une seule fois, sur les counts centrés-réduits par gène (z_score=0)
+            z_scores = clustermap_data.sub(clustermap_data.mean(axis=1), axis=0).div(clustermap_data.std(axis=1), axis=0).to_numpy()
+            lignes = clustermap_data.shape[0] > 1
+            colonnes = clustermap_data.shape[1] > 1
+            sns.clustermap(clustermap_data, z_score=0, cmap='RdYlBu_r',
+                           row_cluster=lignes, col_cluster=colonnes,
+                           row_linkage=lier(z_scores) if lignes else None,
+                           col_linkage=lier(z_scores.T) if colonnes else None,
+                           rasterized=True)
+            plt.title('Heatmap')
+    with mesurer(profil, 'heatmap_png'):
+        plt.savefig(new_virtual_file, bbox_inches='tight', format='png')
+        plt.close()
 
-    base64_file = base64.b64encode(new_virtual_file.getvalue()).decode()
-    return base64_file
+    return new_virtual_file.getvalue()
 
-def plot_volcanoplot(volcano_data, volcano_data_filt, alpha_thres):
-    volcano_data['-log10(padj)'] = -np.log10(volcano_data['padj'] + 1e-200)  
-    volcano_data_filt['-log10(padj)'] = -np.log10(volcano_data_filt['padj'] + 1e-200)
-    new_virtual_file = io.BytesIO()
+# Volcano plot de tous les gènes (results_df), les gènes significatifs (index significatifs) en rouge.
+# Les points sont rastérisés; au-delà de VOLCANO_HEXBIN_MIN_POINTS gènes non significatifs, ceux-ci sont affichés en densité.
+def plot_volcanoplot(results_df, significatifs, alpha_thres, profil=None):
+    with mesurer(profil, 'volcanoplot'):
+        lfc = results_df['log2FoldChange'].to_numpy()
+        log_padj = -np.log10(results_df['padj'].to_numpy() + 1e-200)
+        # Les gènes sans padj (filtrage indépendant, outliers) ne sont pas affichés
+        affiches = np.isfinite(lfc) & np.isfinite(log_padj)
+        rouges = results_df.index.isin(significatifs) & affiches
+        gris = affiches & ~rouges
+        new_virtual_file = io.BytesIO()
+
+        plt.figure()
+        if gris.sum() > VOLCANO_HEXBIN_MIN_POINTS:
+            # Échelle logarithmique dont le minimum (1 gène) reste visible en gris clair
+            plt.hexbin(lfc[gris], log_padj[gris], gridsize=100, norm=LogNorm(vmin=0.3), cmap='Greys', mincnt=1, rasterized=True)
+        else:
+            plt.scatter(lfc[gris], log_padj[gris], s=12, color='grey', alpha=0.5, linewidths=0, rasterized=True)
+        plt.scatter(lfc[rouges], log_padj[rouges], s=12, color='red', linewidths=0, rasterized=True)
+
+        plt.axhline(y=-np.log10(alpha_thres + 1e-200), color='black', linestyle='--', linewidth=1)
+        plt.xlabel('Log2 Fold Change')
+        plt.ylabel('-log10(padj)')
+        plt.title('Volcano Plot')
+    with mesurer(profil, 'volcanoplot_png'):
+        plt.savefig(new_virtual_file, bbox_inches='tight', format='png')
+        plt.close()
+
+    return new_virtual_file.getvalue()
 
-    sns.scatterplot(x='log2FoldChange', y='-log10(padj)', data=volcano_data, color='grey', alpha=0.5)
-    sns.scatterplot(x='log2FoldChange', y='-log10(padj)', data=volcano_data_filt, color='red')
-
-    plt.axhline(y=-np.log10(alpha_thres + 1e-200), color='black', linestyle='--', linewidth=1)
-    plt.xlabel('Log2 Fold Change')
-    plt.ylabel('-log10(padj)')
-    plt.title('Volcano Plot')
-    plt.savefig(new_virtual_file, bbox_inches='tight', format='png')
-    plt.close()
-
-    base64_file = base64.b64encode(new_virtual_file.getvalue()).decode()
-    return base64_file
-
-# Affichage des résultats
-def affichage_results(counts_file, metadata_file, design_factor, refit_cooks, min_reads_per_gene, alpha_thres, lfc_thres, dds, ds, filt_results_df):
-    results = f"counts_file:{str(counts_file.rsplit('/', 1)[-1])}\n"
-    results += f"metadata_file:{str(metadata_file.rsplit('/', 1)[-1])}\n"
-    results += f"refit_cooks:{str(refit_cooks)}\n"
-    results += f"min_reads_per_gene:{str(min_reads_per_gene)}\n"
-    results += f"design_factor:{ds.contrast[0]}\n"
-    results += f"condition_1:{ds.contrast[1]}\n"
-    results += f"condition_2:{ds.contrast[2]}\n"
-    results += f"alpha_thres:{alpha_thres}\nlfc_thres:{lfc_thres}\n"
-    results += f"matrice:{filt_results_df.to_string()}"
-    #results += f"1. DDS Dispersions:\n{str(dds.varm['dispersions'])}\n\n"
-    #results += f"2. DDS LFC (log fold change):\n{str(dds.varm['LFC'])}\n\n"
-    #results += f"3. DDS Outlier Genes:\n{str(dds.varm['_outlier_genes'])}\n\n"
-    return results
+# Résumé des résultats, enregistré dans les colonnes du run: le premier contraste, et le nombre de gènes significatifs
+# dans au moins un contraste (significatifs: index des gènes retenus par post_filt() pour chaque contraste)
+def resume_results(contrast, results_df, significatifs):
+    return {
+        'design_factor': contrast[0],
+        'condition_1': contrast[1],
+        'condition_2': contrast[2],
+        'n_genes': int(len(results_df)),
+        'n_significant': len(set().union(*significatifs)),
+    }
+
+# Modèle ajusté: tout ce qui est nécessaire pour refaire le filtrage, les figures et le résumé sans refaire dds.deseq2()
+#   log1p       log1p des counts normalisés (samples x gènes)
+#   contrastes  pour chaque contraste: contrast ([design_factor, condition_1, condition_2]) et
+#               results_df (ds.results_df pour tous les gènes)
+def extraire_modele(dds, resultats):
+    log1p_df = pd.DataFrame(np.log1p(dds.layers['normed_counts']), index=dds.obs_names, columns=dds.var_names)
+    contrastes = [{'contrast': contrast, 'results_df': results_df} for results_df, contrast in resultats]
+    return {'log1p': log1p_df, 'contrastes': contrastes}
+
+# Sauvegarde du modèle en format binaire compressé (.npz): float64 pour les statistiques, float32 pour les counts log1p.
+# Les tables des contrastes ont les mêmes gènes et colonnes: results est un tableau contrastes x gènes x colonnes.
+# L'écriture passe par un fichier temporaire pour que les lecteurs ne voient jamais un fichier partiel.
+def sauvegarder_modele(modele, modele_path):
+    os.makedirs(os.path.dirname(modele_path) or '.', exist_ok=True)
+    results_df = modele['contrastes'][0]['results_df']
+    log1p_df = modele['log1p']
+    fichier_temporaire = f"{modele_path}.{os.getpid()}.tmp"
+    with open(fichier_temporaire, 'wb') as fichier:
+        np.savez_compressed(
+            fichier,
+            genes=results_df.index.to_numpy(dtype=str),
+            gene_index_name=np.array(results_df.index.name or 'Geneid'),
+            results_columns=np.array(results_df.columns, dtype=str),
+            results=np.stack([contraste['results_df'].loc[results_df.index, results_df.columns].to_numpy(dtype=np.float64)
+                              for contraste in modele['contrastes']]),
+            samples=log1p_df.index.to_numpy(dtype=str),
+            log1p=log1p_df[results_df.index].to_numpy(dtype=np.float32),
+            contrasts=np.array([contraste['contrast'] for contraste in modele['contrastes']], dtype=str)
+        )
+    os.replace(fichier_temporaire, modele_path)
+
+# Les modèles sauvegardés avant les analyses multi-contrastes ont une seule table (2D) et une clé 'contrast'
+def charger_modele(modele_path):
+    with np.load(modele_path, allow_pickle=False) as donnees:
+        genes = pd.Index(donnees['genes'], name=str(donnees['gene_index_name']))
+        if 'contrasts' in donnees:
+            results, contrasts = donnees['results'], donnees['contrasts']
+        else:
+            results, contrasts = donnees['results'][np.newaxis], donnees['contrast'][np.newaxis]
+        contrastes = [{'contrast': [str(valeur) for valeur in contrast],
+                       'results_df': pd.DataFrame(table, index=genes, columns=donnees['results_columns'])}
+                      for table, contrast in zip(results, contrasts)]
+        log1p_df = pd.DataFrame(donnees['log1p'], index=donnees['samples'], columns=genes)
+    return {'log1p': log1p_df, 'contrastes': contrastes}
+
+# Partie de l'analyse qui dépend des seuils alpha_thres et lfc_thres: filtration, figures et résumé, pour chaque contraste.
+# Les tables des résultats ne sont pas retournées: elles sont relues du modèle sauvegardé avec les seuils du run.
+# Retourne le résumé du run et, pour chaque contraste: design_factor, condition_1, condition_2, n_significant, heatmap et
+# volcanoplot (PNG, seulement si figures est vrai).
+def seuiller_modele(modele, alpha_thres, lfc_thres, progression=None, profil=None, figures=True):
+    signaler(progression, ETAPE_FIGURES)
+    resultats_contrastes = []
+    significatifs = []
+    for contraste in modele['contrastes']:
+        results_df = contraste['results_df']
+        contrast = contraste['contrast']
+
+        # Filtration pour avoir les genes significativement et hautement differentiel
+        with mesurer(profil, 'filtration'):
+            filt_results_df, filt_log1p_df = post_filt(results_df, modele['log1p'], alpha_thres, lfc_thres)
+
+        significatifs.append(filt_results_df.index)
+        resultat = {
+            'design_factor': contrast[0],
+            'condition_1': contrast[1],
+            'condition_2': contrast[2],
+            'n_significant': int(len(filt_results_df)),
+        }
+        if figures:
+            # HEATMAP
+            resultat['heatmap'] = plot_heatmap(filt_log1p_df, profil)
+
+            # VOLCANO PLOT
+            resultat['volcanoplot'] = plot_volcanoplot(results_df, filt_results_df.index, alpha_thres, profil)
+        resultats_contrastes.append(resultat)
+
+    # RESULTS : à changer au fur et à mesure que j'ajoute des informations à afficher en sortie
+    premier = modele['contrastes'][0]
+    results = resume_results(premier['contrast'], premier['results_df'], significatifs)
+    return results, resultats_contrastes
+
+# Refaire seulement la partie post-ajustement d'une analyse à partir d'un modèle sauvegardé (changement de seuils)
+def reseuiller(modele_path, alpha_thres, lfc_thres, progression=None, profil=None, figures=True):
+    with mesurer(profil, 'chargement_modele'):
+        modele = charger_modele(modele_path)
+    return seuiller_modele(modele, alpha_thres, lfc_thres, progression, profil, figures)
 
 
 # Analyse d'expression genetique differentiel
-def analyse_dea(counts_file, metadata_file, refit_cooks, min_reads_per_gene, alpha_thres, lfc_thres):
+#   covariables           colonnes du fichier metadata ajoutées au design (en plus du design factor)
+#   contrastes            liste de [condition testée, condition de référence] (None: toutes les paires de conditions)
+#   processus_contrastes  nombre de processus pour les tests de Wald des contrastes
+#   n_cpus                processus de l'inférence pyDESeq2 (None: tous les cœurs de la machine)
+#   figures               faux: seulement les résultats, les figures sont faites ensuite à partir du modèle sauvegardé
+def analyse_dea(counts_file, metadata_file, refit_cooks, min_reads_per_gene, alpha_thres, lfc_thres, modele_path=None, genes_file=None,
+                covariables=None, contrastes=None, processus_contrastes=1, progression=None, profil=None, figures=True, n_cpus=None):
     # DATA PREPROCESSING
     # Pré-filtrer des fichiers counts, metadata
-    counts, metadata = preprocess_df(counts_file, metadata_file, min_reads_per_gene)
+    signaler(progression, ETAPE_LECTURE)
+    with mesurer(profil, ETAPE_LECTURE):
+        counts, metadata = preprocess_df(counts_file, metadata_file, min_reads_per_gene, genes_file, covariables)
 
     # Récupérer design_factor
     design_factor = get_design_factor(metadata)
 
     # EXECUTER PIPELINE PYDESEQ2
-    dds, ds = pipeline_pydeseq(counts, metadata, design_factor, refit_cooks)
+    dds, resultats = pipeline_pydeseq(counts, metadata, design_factor, refit_cooks, progression, profil,
+                                      covariables, contrastes, processus_contrastes, n_cpus)
 
     # POST PROCESSING
     # Effectue une transformation logarithmique sur les données contenues dans dds.layers['normed_counts']
-    # et enregistre le résultat dans dds.layers['log1p'] nécessaire pour le heatmap
-    dds.layers['log1p'] = np.log1p(dds.layers['normed_counts'])
-
-    # Filtration pour avoir les genes significativement et hautement differentiel
-    filt_results_df, filt_dds = post_filt(ds.results_df, dds, alpha_thres, lfc_thres)
+    # nécessaire pour le heatmap, et conserve le modèle ajusté pour pouvoir changer les seuils sans refaire l'ajustement
+    with mesurer(profil, 'extraction_modele'):
+        modele = extraire_modele(dds, resultats)
+    if modele_path is not None:
+        with mesurer(profil, 'sauvegarde_modele'):
+            sauvegarder_modele(modele, modele_path)
 
-    # HEATMAP
-    heatmap_path = plot_heatmap(filt_dds)
-    
-    # VOLCANO PLOT
-    # créer une copie du ds.results_df et ds.results_df filtré avec alpha_thres et lfc_thres pour ajouter une colone '-log10(padj)'à ces dataframes
-    volcano_data = ds.results_df.copy()
-    volcano_data_filt = filt_results_df.copy()
-
-    volcanoplot_path = plot_volcanoplot(volcano_data, volcano_data_filt, alpha_thres)
-
-    
-    # RESULTS : à changer au fur et à mesure que j'ajoute des informations à afficher en sortie
-    results = affichage_results(counts_file, metadata_file, design_factor, refit_cooks, min_reads_per_gene, alpha_thres, lfc_thres, dds, ds, filt_results_df)
-    return results, heatmap_path, volcanoplot_path
\ No newline at end of file
+    return seuiller_modele(modele, alpha_thres, lfc_thres, progression, profil, figures)
@@ -0,0 +1,210 @@
+# fonctions_api.py
+# API JSON pour soumettre des analyses par lots (routes /api/... de app.py), authentifiée par jeton (en-tête
+# "Authorization: Bearer <jeton>") au lieu de la session et du courriel de connexion.
+# Un lot est une liste de jeux de données (paires counts/metadata, avec un fichier des gènes optionnel) et une grille de
+# paramètres: une analyse est mise en file pour chaque jeu de données et chaque combinaison de paramètres.
+# Les jeux de données sont envoyés (et écrits dans le dépôt adressé par contenu, fonctions_depot):
+#   en multipart    champs counts_file, metadata_file et genes_file (optionnel) répétés, associés dans l'ordre;
+#                   champ name (optionnel) répété de même
+#   en archive zip  champ archive; les fichiers <nom>_counts.<ext>, <nom>_metadata.<ext> et <nom>_genes.<ext>
+#                   (séparateur _, - ou .) forment le jeu de données <nom>; les autres fichiers sont ignorés
+# ou réutilisés sans nouveau téléversement (champs dataset_id répétés, voir /api/datasets).
+# La grille (champ parameters, JSON) donne pour refit_cooks, min_reads_per_gene, alpha_thres et lfc_thres une valeur
+# ou une liste de valeurs (valeurs du formulaire d'analyse par défaut), plus les covariables et contrastes du design
+# (les mêmes pour tout le lot), ex.: {"alpha_thres": [0.01, 0.05], "lfc_thres": 1, "covariates": ["batch"], "contrasts": "KO vs WT"}
+
+import hashlib
+import itertools
+import json
+import math
+import os
+import posixpath
+import re
+import secrets
+import zipfile
+from datetime import datetime, timedelta
+from werkzeug.utils import secure_filename
+from models import db, JetonApi
+from fonctions_validation import lire_covariables, lire_contrastes
+from fonctions_depot import televerser_jeu, reutiliser_jeu
+
+# Les dates d'utilisation des jetons ne sont mises à jour qu'une fois par minute (pas une écriture par requête)
+DELAI_UTILISATION_JETON = timedelta(minutes=1)
+
+MOTIF_FICHIER = re.compile(r'^(?P<nom>.+?)[_.-](?P<role>counts|metadata|genes)(?P<extension>\..*)?$', re.IGNORECASE)
+
+def lire_booleen(valeur):
+    if isinstance(valeur, bool):
+        return valeur
+    if valeur in (0, 1):
+        return bool(valeur)
+    if isinstance(valeur, str) and valeur.lower() in ('true', 'false'):
+        return valeur.lower() == 'true'
+    raise ValueError(f"valeur booléenne attendue, pas {valeur!r}")
+
+def lire_entier(valeur):
+    if isinstance(valeur, bool) or float(valeur) != int(float(valeur)):
+        raise ValueError(f"nombre entier attendu, pas {valeur!r}")
+    return int(float(valeur))
+
+def lire_reel(valeur):
+    if isinstance(valeur, bool):
+        raise ValueError(f"nombre attendu, pas {valeur!r}")
+    return float(valeur)
+
+# Paramètres de la grille: lecture d'une valeur, valeur par défaut (celle du formulaire d'analyse) et validation
+PARAMETRES_GRILLE = {
+    'refit_cooks': (lire_booleen, False, lambda valeur: True),
+    'min_reads_per_gene': (lire_entier, 1, lambda valeur: valeur >= 0),
+    'alpha_thres': (lire_reel, 0.01, lambda valeur: 0 <= valeur <= 1),
+    'lfc_thres': (lire_reel, 2.0, math.isfinite),
+}
+
+# Jeton d'accès: seule son empreinte est gardée dans la BD
+def empreinte_jeton(jeton):
+    return hashlib.sha256(jeton.encode()).hexdigest()
+
+# Crée un jeton pour un utilisateur (la transaction est validée par l'appelant). Retourne le jeton en clair.
+def creer_jeton(user, nom=None):
+    jeton = secrets.token_urlsafe(32)
+    db.session.add(JetonApi(user=user, name=nom, token_hash=empreinte_jeton(jeton)))
+    return jeton
+
+# Utilisateur authentifié par l'en-tête Authorization d'une requête (None si le jeton est absent ou inconnu)
+def utilisateur_jeton(entete):
+    type_jeton, _, jeton = (entete or '').partition(' ')
+    if type_jeton.lower() != 'bearer' or not jeton.strip():
+        return None
+    entree = JetonApi.query.filter_by(token_hash=empreinte_jeton(jeton.strip())).first()
+    if entree is None:
+        return None
+    maintenant = datetime.utcnow()
+    if entree.last_used_at is None or entree.last_used_at < maintenant - DELAI_UTILISATION_JETON:
+        entree.last_used_at = maintenant
+        db.session.commit()
+    return entree.user
+
+# Lecture du champ parameters d'un lot. Retourne (grille: liste de dictionnaires de paramètres, covariables, contrastes).
+# Lève ValueError si un paramètre est inconnu ou invalide.
+def lire_parametres(texte):
+    try:
+        parametres = json.loads(texte) if texte and texte.strip() else {}
+    except json.JSONDecodeError as erreur:
+        raise ValueError(f"Le champ parameters n'est pas un JSON valide: {erreur}")
+    if not isinstance(parametres, dict):
+        raise ValueError("Le champ parameters doit être un objet JSON.")
+    inconnus = set(parametres) - set(PARAMETRES_GRILLE) - {'covariates', 'contrasts'}
+    if inconnus:
+        raise ValueError(f"Paramètres inconnus: {', '.join(sorted(inconnus))}.")
+
+    valeurs_grille = {}
+    for nom, (lire, defaut, valide) in PARAMETRES_GRILLE.items():
+        valeurs = parametres.get(nom, defaut)
+        valeurs = valeurs if isinstance(valeurs, list) else [valeurs]
+        if not valeurs:
+            raise ValueError(f"Le paramètre {nom} n'a aucune valeur.")
+        try:
+            valeurs = [lire(valeur) for valeur in valeurs]
+        except (TypeError, ValueError, OverflowError) as erreur:
+            raise ValueError(f"Paramètre {nom} invalide: {erreur}")
+        if not all(valide(valeur) for valeur in valeurs):
+            raise ValueError(f"Paramètre {nom} hors limites: {valeurs}.")
+        # Valeurs répétées dans une liste: une seule analyse
+        valeurs_grille[nom] = list(dict.fromkeys(valeurs))
+    grille = [dict(zip(valeurs_grille, combinaison)) for combinaison in itertools.product(*valeurs_grille.values())]
+
+    covariables = parametres.get('covariates') or []
+    if isinstance(covariables, str):
+        covariables = lire_covariables(covariables)
+    elif not all(isinstance(covariable, str) for covariable in covariables):
+        raise ValueError("Le paramètre covariates doit être une liste de colonnes du fichier metadata.")
+    contrastes = parametres.get('contrasts')
+    if isinstance(contrastes, list):
+        contrastes = '; '.join(' vs '.join(map(str, contraste)) if isinstance(contraste, list) else str(contraste)
+                               for contraste in contrastes)
+    return grille, [covariable.strip() for covariable in covariables if covariable.strip()], lire_contrastes(contrastes)
+
+# Nom d'un fichier reçu, sans dossier ni caractères dangereux (défaut si rien ne reste)
+def nom_fichier_sur(nom, defaut):
+    return secure_filename(posixpath.basename((nom or '').replace('\\', '/'))) or defaut
+
+# Écrit dans le dépôt les fichiers d'un lot envoyé en multipart.
+# Retourne la liste des jeux de données: {name, dataset: JeuDonnees} (la transaction est validée par l'appelant).
+def enregistrer_fichiers(user_id, counts_files, metadata_files, genes_files, noms):
+    counts_files = [fichier for fichier in counts_files if fichier.filename]
+    metadata_files = [fichier for fichier in metadata_files if fichier.filename]
+    if len(metadata_files) != len(counts_files):
+        raise ValueError(f"{len(counts_files)} fichiers counts_file mais {len(metadata_files)} fichiers metadata_file.")
+    if genes_files and len(genes_files) != len(counts_files):
+        raise ValueError("Les champs genes_file doivent être associés un à un aux fichiers counts_file (fichier vide si absent).")
+    if noms and len(noms) != len(counts_files):
+        raise ValueError("Les champs name doivent être associés un à un aux fichiers counts_file.")
+    jeux = []
+    for position, (counts_file, metadata_file) in enumerate(zip(counts_files, metadata_files)):
+        fichiers = {
+            'counts': (counts_file.stream, nom_fichier_sur(counts_file.filename, 'counts')),
+            'metadata': (metadata_file.stream, nom_fichier_sur(metadata_file.filename, 'metadata')),
+        }
+        if genes_files and genes_files[position].filename:
+            fichiers['genes'] = (genes_files[position].stream, nom_fichier_sur(genes_files[position].filename, 'genes'))
+        jeux.append({
+            'name': noms[position] if noms else os.path.splitext(counts_file.filename)[0],
+            'dataset': televerser_jeu(user_id, fichiers),
+        })
+    return jeux
+
+# Écrit dans le dépôt les jeux de données d'une archive zip (même retour qu'enregistrer_fichiers()).
+# Les chemins de l'archive ne sont jamais utilisés pour écrire; la taille décompressée totale est limitée à max_octets.
+def extraire_archive(user_id, archive, max_octets):
+    try:
+        zip_lot = zipfile.ZipFile(archive)
+    except zipfile.BadZipFile:
+        raise ValueError("Le champ archive n'est pas une archive zip valide.")
+    with zip_lot:
+        membres = {}
+        for info in zip_lot.infolist():
+            nom_base = posixpath.basename(info.filename)
+            if info.is_dir() or nom_base.startswith('.') or info.filename.startswith('__MACOSX/'):
+                continue
+            correspondance = MOTIF_FICHIER.match(nom_base)
+            if correspondance is None:
+                continue
+            nom = posixpath.join(posixpath.dirname(info.filename), correspondance.group('nom'))
+            role = correspondance.group('role').lower()
+            fichiers = membres.setdefault(nom, {})
+            if role in fichiers:
+                raise ValueError(f"L'archive contient plusieurs fichiers {role} pour le jeu de données '{nom}'.")
+            fichiers[role] = info
+        if not membres:
+            raise ValueError("L'archive ne contient aucun fichier <nom>_counts / <nom>_metadata.")
+        incomplets = sorted(nom for nom, fichiers in membres.items() if 'counts' not in fichiers or 'metadata' not in fichiers)
+        if incomplets:
+            raise ValueError(f"Jeux de données sans fichier counts ou metadata dans l'archive: {', '.join(incomplets)}.")
+        taille = sum(info.file_size for fichiers in membres.values() for info in fichiers.values())
+        if taille > max_octets:
+            raise ValueError(f"L'archive décompressée dépasse la taille maximale ({taille} > {max_octets} octets).")
+
+        jeux = []
+        for nom in sorted(membres):
+            # Chaque fichier est lu au plus jusqu'à la taille déclarée dans l'archive
+            sources = {role: zip_lot.open(info) for role, info in membres[nom].items()}
+            try:
+                fichiers = {role: (source, nom_fichier_sur(membres[nom][role].filename, role)) for role, source in sources.items()}
+                jeux.append({'name': nom, 'dataset': televerser_jeu(user_id, fichiers)})
+            finally:
+                for source in sources.values():
+                    source.close()
+    return jeux
+
+# Jeux de données déjà téléversés réutilisés par un lot (champs dataset_id). Lève ValueError si l'un d'eux n'existe pas.
+def jeux_existants(user_id, ids):
+    jeux = []
+    for jeu_id in ids:
+        try:
+            jeu = reutiliser_jeu(user_id, int(jeu_id))
+        except ValueError:
+            jeu = None
+        if jeu is None:
+            raise ValueError(f"Jeu de données introuvable: {jeu_id}.")
+        jeux.append({'name': os.path.splitext(jeu.counts_name)[0], 'dataset': jeu})
+    return jeux
@@ -0,0 +1,189 @@
+# fonctions_cache.py
+# Cache des résultats d'analyse adressé par contenu.
+# La clé est l'empreinte SHA-256 du contenu des fichiers counts/metadata et des paramètres d'analyse:
+# deux soumissions identiques (même si les fichiers portent des noms différents) réutilisent les mêmes résultats.
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func
+from models import db, Run, Contraste, ResultatCache, Compteur, STATUT_TERMINE
+from fonctions_figures import taille_figure, supprimer_figure
+
+TAILLE_BLOC = 1024 * 1024
+
+# Empreinte SHA-256 du contenu d'un fichier, lu par blocs pour ne pas le charger entièrement en mémoire
+def empreinte_fichier(chemin):
+    sha = hashlib.sha256()
+    with open(chemin, 'rb') as fichier:
+        for bloc in iter(lambda: fichier.read(TAILLE_BLOC), b''):
+            sha.update(bloc)
+    return sha.hexdigest()
+
+def empreinte_parametres(parametres):
+    return hashlib.sha256(json.dumps(parametres, sort_keys=True).encode()).hexdigest()
+
+# Clé du modèle ajusté: empreinte des fichiers d'entrée et des paramètres utilisés par dds.deseq2()
+def cle_modele(counts_file, metadata_file, refit_cooks, min_reads_per_gene, genes_file=None, covariables=None, contrastes=None):
+    parametres = {
+        'counts': empreinte_fichier(counts_file),
+        'metadata': empreinte_fichier(metadata_file),
+        'refit_cooks': bool(refit_cooks),
+        'min_reads_per_gene': int(min_reads_per_gene),
+    }
+    # Fichier des gènes (MatrixMarket) ajouté seulement s'il est fourni: les clés existantes restent valides
+    if genes_file is not None:
+        parametres['genes'] = empreinte_fichier(genes_file)
+    # De même pour le design: covariables et contrastes ajoutés seulement s'ils sont demandés
+    if covariables:
+        parametres['covariables'] = list(covariables)
+    if contrastes:
+        parametres['contrastes'] = [list(contraste) for contraste in contrastes]
+    return empreinte_parametres(parametres)
+
+# Clé du cache pour une analyse: le modèle ajusté et les seuils de filtration
+def cle_cache(model_key, alpha_thres, lfc_thres):
+    return empreinte_parametres({
+        'model': model_key,
+        'alpha_thres': float(alpha_thres),
+        'lfc_thres': float(lfc_thres),
+    })
+
+# Chemin du modèle ajusté sauvegardé pour une clé de modèle
+def chemin_modele(model_key):
+    return os.path.join(current_app.config['RESULTS_DIR'], f'{model_key}.npz')
+
+# Incrémente un compteur global (créé à la première utilisation)
+def incrementer(nom, valeur=1):
+    if Compteur.query.filter_by(name=nom).update({'value': Compteur.value + valeur}, synchronize_session=False) == 0:
+        db.session.add(Compteur(name=nom, value=valeur))
+
+# Fonction pour chercher une entrée du cache; met à jour les compteurs de succès/échecs et la date d'utilisation (LRU)
+def chercher(cle, compter_echec=True):
+    entree = ResultatCache.query.get(cle)
+    if entree is None:
+        if compter_echec:
+            incrementer('cache_misses')
+        return None
+    entree.hits += 1
+    entree.last_used_at = datetime.utcnow()
+    incrementer('cache_hits')
+    return entree
+
+# Supprime le fichier d'un modèle ajusté s'il n'est plus utilisé par aucun run ni aucune entrée du cache (les modèles
+# sont partagés entre les runs ayant les mêmes fichiers d'entrée et paramètres d'ajustement)
+def supprimer_modele_si_orphelin(modele_path):
+    if not modele_path or not os.path.exists(modele_path):
+        return
+    if Run.query.filter_by(model_path=modele_path).count() == 0 and ResultatCache.query.filter_by(model_path=modele_path).count() == 0:
+        os.remove(modele_path)
+
+# Supprime les figures qui ne sont plus utilisées par aucun run ni aucune entrée du cache
+def supprimer_figures_si_orphelines(noms):
+    for nom in set(noms):
+        if not nom:
+            continue
+        runs = Run.query.filter((Run.heatmap_path == nom) | (Run.volcanoplot_path == nom)).count()
+        contrastes = Contraste.query.filter((Contraste.heatmap_path == nom) | (Contraste.volcanoplot_path == nom)).count()
+        # Les figures des contrastes d'une entrée sont dans son résumé (JSON)
+        entrees = ResultatCache.query.filter((ResultatCache.heatmap == nom) | (ResultatCache.volcanoplot == nom)
+                                             | ResultatCache.summary.contains(nom)).count()
+        if runs == 0 and contrastes == 0 and entrees == 0:
+            supprimer_figure(nom, current_app.config['PLOTS_DIR'])
+
+# Remplace les contrastes d'un run; les figures du run sont celles du premier contraste.
+# contrastes: liste de dictionnaires design_factor, condition_1, condition_2, n_significant, heatmap, volcanoplot
+# (heatmap et volcanoplot absents tant que les figures ne sont pas faites)
+def enregistrer_contrastes(run, contrastes):
+    run.contrastes = [Contraste(position=position, design_factor=contraste['design_factor'], condition_1=contraste['condition_1'],
+                                condition_2=contraste['condition_2'], n_significant=contraste['n_significant'],
+                                heatmap_path=contraste.get('heatmap'), volcanoplot_path=contraste.get('volcanoplot'))
+                      for position, contraste in enumerate(contrastes)]
+    if contrastes:
+        run.heatmap_path = contrastes[0].get('heatmap')
+        run.volcanoplot_path = contrastes[0].get('volcanoplot')
+
+# Noms des figures de tous les contrastes d'une entrée du cache
+def figures_entree(entree):
+    figures = [entree.heatmap, entree.volcanoplot]
+    for contraste in json.loads(entree.summary).get('contrastes', []):
+        figures += [contraste['heatmap'], contraste['volcanoplot']]
+    return figures
+
+# Fonction pour compléter un run à partir du cache. Retourne vrai si les résultats ont été trouvés.
+# La transaction est validée par l'appelant.
+def appliquer_cache(run, cle, compter_echec=True):
+    entree = chercher(cle, compter_echec)
+    if entree is None:
+        return False
+    if not os.path.exists(entree.model_path):
+        # Le modèle a été supprimé: l'entrée ne peut plus servir
+        db.session.delete(entree)
+        return False
+    maintenant = datetime.utcnow()
+    resume = json.loads(entree.summary)
+    # Les entrées créées avant les analyses multi-contrastes n'ont pas de contrastes dans leur résumé
+    contrastes = resume.pop('contrastes', [])
+    for colonne, valeur in resume.items():
+        setattr(run, colonne, valeur)
+    run.heatmap_path = entree.heatmap
+    run.volcanoplot_path = entree.volcanoplot
+    enregistrer_contrastes(run, contrastes)
+    if run.model_path != entree.model_path:
+        # Nouveau modèle: le run est réindexé par gène (fonctions_genes)
+        run.genes_indexed = False
+    run.model_path = entree.model_path
+    run.status = STATUT_TERMINE
+    run.started_at = maintenant
+    run.finished_at = maintenant
+    return True
+
+# Fonction pour ajouter des résultats au cache puis évincer les entrées les moins récemment utilisées.
+# La taille comptée est celle des fichiers des figures (de tous les contrastes) et du modèle ajusté référencés.
+def mettre_en_cache(cle, modele_path, resume, contrastes):
+    if ResultatCache.query.get(cle) is None:
+        dossier_figures = current_app.config['PLOTS_DIR']
+        entree = ResultatCache(key=cle, model_path=modele_path, summary=json.dumps(dict(resume, contrastes=contrastes)),
+                               heatmap=contrastes[0]['heatmap'], volcanoplot=contrastes[0]['volcanoplot'])
+        entree.size = os.path.getsize(modele_path) + sum(taille_figure(nom, dossier_figures) for nom in set(figures_entree(entree)))
+        db.session.add(entree)
+        db.session.flush()
+    evincer(current_app.config['RESULT_CACHE_MAX_BYTES'], current_app.config['RESULT_CACHE_MAX_ENTRIES'])
+
+# Supprime les entrées les moins récemment utilisées jusqu'à respecter la taille et le nombre maximal d'entrées
+def evincer(max_octets, max_entrees):
+    taille_totale, nombre = db.session.query(func.coalesce(func.sum(ResultatCache.size), 0), func.count(ResultatCache.key)).one()
+    if taille_totale <= max_octets and nombre <= max_entrees:
+        return 0
+    evincees = 0
+    modeles = set()
+    figures = []
+    for entree in ResultatCache.query.order_by(ResultatCache.last_used_at).all():
+        if taille_totale <= max_octets and nombre <= max_entrees:
+            break
+        db.session.delete(entree)
+        modeles.add(entree.model_path)
+        figures += figures_entree(entree)
+        taille_totale -= entree.size
+        nombre -= 1
+        evincees += 1
+    incrementer('cache_evictions', evincees)
+    db.session.flush()
+    for modele_path in modeles:
+        supprimer_modele_si_orphelin(modele_path)
+    supprimer_figures_si_orphelines(figures)
+    return evincees
+
+# Statistiques du cache (taille, nombre d'entrées, succès, échecs, évictions)
+def statistiques():
+    taille_totale, nombre = db.session.query(func.coalesce(func.sum(ResultatCache.size), 0), func.count(ResultatCache.key)).one()
+    compteurs = {compteur.name: compteur.value for compteur in Compteur.query.filter(Compteur.name.like('cache_%')).all()}
+    return {
+        'entries': nombre,
+        'bytes': taille_totale,
+        'hits': compteurs.get('cache_hits', 0),
+        'misses': compteurs.get('cache_misses', 0),
+        'evictions': compteurs.get('cache_evictions', 0),
+    }
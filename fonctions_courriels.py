@@ -0,0 +1,181 @@
+# fonctions_courriels.py
+# File d'envoi des courriels (liens de connexion et d'inscription, fin des analyses).
+# Les routes n'envoient pas les courriels elles-mêmes: elles les ajoutent à la table courriel et réveillent l'expéditeur,
+# un thread d'arrière-plan qui les envoie par lots sur une connexion SMTP gardée ouverte tant que des courriels arrivent
+# (fermée après MAIL_IDLE_TIMEOUT secondes sans envoi). Un envoi échoué est réessayé après MAIL_RETRY_DELAY secondes,
+# délai doublé à chaque échec, jusqu'à MAIL_MAX_ATTEMPTS tentatives; un destinataire refusé par le serveur ne l'est pas,
+# et n'interrompt pas l'envoi du reste du lot.
+# La réclamation des courriels est atomique (UPDATE conditionnel): le processus web et les workers (flask run-worker)
+# peuvent chacun avoir un expéditeur.
+
+import os
+import smtplib
+import socket
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from flask_mail import Message
+from models import db, Courriel, COURRIEL_EN_ATTENTE, COURRIEL_ENVOI, COURRIEL_ENVOYE, COURRIEL_ECHEC
+
+# Un courriel réclamé par un expéditeur arrêté avant son envoi retourne dans la file après ce délai
+DELAI_RECLAMATION = timedelta(minutes=5)
+# Les courriels envoyés (qui contiennent des liens de connexion) sont supprimés après ce délai
+DELAI_CONSERVATION = timedelta(days=7)
+
+# Ajoute un courriel à la file d'envoi (la transaction est validée par l'appelant)
+def mettre_en_file_courriel(destinataire, sujet, corps):
+    courriel = Courriel(recipient=destinataire, subject=sujet, body=corps)
+    db.session.add(courriel)
+    return courriel
+
+# Réclame au plus n courriels prêts à être envoyés, les plus anciens d'abord
+def reclamer_courriels(expediteur, n):
+    maintenant = datetime.utcnow()
+    Courriel.query.filter(Courriel.status == COURRIEL_ENVOI, Courriel.claimed_at < maintenant - DELAI_RECLAMATION).update(
+        {'status': COURRIEL_EN_ATTENTE, 'worker': None}, synchronize_session=False)
+    ids = [courriel_id for courriel_id, in (db.session.query(Courriel.id)
+                                            .filter(Courriel.status == COURRIEL_EN_ATTENTE, Courriel.next_attempt_at <= maintenant)
+                                            .order_by(Courriel.next_attempt_at, Courriel.id)
+                                            .limit(n))]
+    if ids:
+        # Seuls les courriels encore en attente sont réclamés: ceux pris entre-temps par un autre expéditeur sont ignorés
+        (Courriel.query
+         .filter(Courriel.id.in_(ids), Courriel.status == COURRIEL_EN_ATTENTE)
+         .update({'status': COURRIEL_ENVOI, 'worker': expediteur, 'claimed_at': maintenant}, synchronize_session=False))
+    db.session.commit()
+    if not ids:
+        return []
+    return (Courriel.query
+            .filter(Courriel.id.in_(ids), Courriel.status == COURRIEL_ENVOI, Courriel.worker == expediteur)
+            .order_by(Courriel.id)
+            .all())
+
+def purger_courriels(limite):
+    Courriel.query.filter(Courriel.status == COURRIEL_ENVOYE, Courriel.sent_at < limite).delete(synchronize_session=False)
+    db.session.commit()
+
+class Expediteur:
+    # Boucle qui réclame les courriels de la file et les envoie avec Flask-Mail, dans un thread du processus courant
+    def __init__(self, app, mail, taille_lot=None, intervalle=None):
+        self.app = app
+        self.mail = mail
+        self.taille_lot = taille_lot or app.config['MAIL_BATCH_SIZE']
+        self.intervalle = intervalle or app.config['MAIL_POLL_INTERVAL']
+        self.delai_inactivite = app.config['MAIL_IDLE_TIMEOUT']
+        self.max_tentatives = app.config['MAIL_MAX_ATTEMPTS']
+        self.delai_reessai = app.config['MAIL_RETRY_DELAY']
+        self.nom = f'{socket.gethostname()}:{os.getpid()}'
+        # Connexion SMTP ouverte (Flask-Mail) et heure de son dernier envoi
+        self.connexion = None
+        self.pile = ExitStack()
+        self.dernier_envoi = 0
+        self.reveil = threading.Event()
+        self.arret = threading.Event()
+        self.thread = None
+
+    def demarrer(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.boucle, name='expediteur-courriels', daemon=True)
+            self.thread.start()
+
+    # Réveille la boucle immédiatement (appelé après l'ajout d'un courriel à la file)
+    def reveiller(self):
+        self.reveil.set()
+
+    def arreter(self):
+        self.arret.set()
+        self.reveil.set()
+
+    def boucle(self):
+        try:
+            while not self.arret.is_set():
+                envoyes = 0
+                with self.app.app_context():
+                    try:
+                        envoyes = self.iteration()
+                    except Exception:
+                        db.session.rollback()
+                        self.app.logger.exception("Erreur dans l'expéditeur des courriels")
+                    finally:
+                        db.session.remove()
+                if envoyes:
+                    # Rafale: le lot suivant est réclamé sans attendre, sur la même connexion
+                    continue
+                if self.connexion is not None and time.monotonic() - self.dernier_envoi > self.delai_inactivite:
+                    self.fermer()
+                self.reveil.wait(min(self.intervalle, self.delai_inactivite))
+                self.reveil.clear()
+        finally:
+            self.fermer()
+
+    # Envoie un lot de courriels; retourne le nombre de courriels envoyés
+    def iteration(self):
+        courriels = reclamer_courriels(self.nom, self.taille_lot)
+        if not courriels:
+            purger_courriels(datetime.utcnow() - DELAI_CONSERVATION)
+            return 0
+        envoyes = 0
+        for position, courriel in enumerate(courriels):
+            courriel.attempts += 1
+            try:
+                self.envoyer(courriel)
+            except smtplib.SMTPRecipientsRefused as erreur:
+                # Seul ce destinataire est en cause (la transaction SMTP a été annulée, la connexion reste utilisable):
+                # le courriel est en échec et le reste du lot est envoyé
+                self.echec(courriel, erreur)
+                db.session.commit()
+                continue
+            except Exception as erreur:
+                self.echec(courriel, erreur)
+                # Serveur injoignable ou connexion dans un état inconnu: le reste du lot retourne dans la file
+                for suivant in courriels[position + 1:]:
+                    suivant.status = COURRIEL_EN_ATTENTE
+                    suivant.worker = None
+                db.session.commit()
+                break
+            courriel.status = COURRIEL_ENVOYE
+            courriel.sent_at = datetime.utcnow()
+            courriel.error = None
+            # Validé après chaque envoi: un courriel envoyé n'est jamais renvoyé si l'expéditeur s'arrête
+            db.session.commit()
+            envoyes += 1
+        return envoyes
+
+    def envoyer(self, courriel):
+        message = Message(courriel.subject, recipients=[courriel.recipient], body=courriel.body)
+        try:
+            self.connexion_ouverte().send(message)
+        except smtplib.SMTPServerDisconnected:
+            # Connexion fermée par le serveur pendant l'inactivité: nouvelle tentative immédiate sur une nouvelle connexion
+            self.fermer()
+            self.connexion_ouverte().send(message)
+        self.dernier_envoi = time.monotonic()
+
+    def echec(self, courriel, erreur):
+        if not isinstance(erreur, smtplib.SMTPRecipientsRefused):
+            self.fermer()
+        courriel.error = f'{type(erreur).__name__}: {erreur}'
+        courriel.worker = None
+        if isinstance(erreur, smtplib.SMTPRecipientsRefused) or courriel.attempts >= self.max_tentatives:
+            courriel.status = COURRIEL_ECHEC
+            self.app.logger.error("Échec de l'envoi du courriel %s à %s: %s", courriel.id, courriel.recipient, erreur)
+        else:
+            courriel.status = COURRIEL_EN_ATTENTE
+            courriel.next_attempt_at = datetime.utcnow() + timedelta(seconds=self.delai_reessai * 2 ** (courriel.attempts - 1))
+            self.app.logger.warning("Envoi du courriel %s reporté (tentative %s): %s", courriel.id, courriel.attempts, erreur)
+
+    def connexion_ouverte(self):
+        if self.connexion is None:
+            self.connexion = self.pile.enter_context(self.mail.connect())
+        return self.connexion
+
+    def fermer(self):
+        if self.connexion is None:
+            return
+        self.connexion = None
+        try:
+            self.pile.close()
+        except (smtplib.SMTPException, OSError):
+            # Connexion déjà fermée par le serveur
+            pass
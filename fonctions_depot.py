@@ -0,0 +1,207 @@
+# fonctions_depot.py
+# Dépôt des fichiers téléversés, adressé par contenu: chaque fichier est écrit une seule fois, sous l'empreinte SHA-256
+# de son contenu (UPLOADS_DIR/<2 premiers caractères>/<empreinte>), quels que soient son nom d'origine et l'utilisateur
+# qui l'envoie. Un téléversement est lu par blocs dans un fichier temporaire (empreinte calculée pendant l'écriture),
+# puis renommé atomiquement: deux utilisateurs qui envoient counts.csv ne s'écrasent plus, et un fichier déjà présent
+# n'est pas écrit de nouveau. Le format des counts est détecté par le contenu: les fichiers n'ont pas d'extension.
+# Un jeu de données (JeuDonnees) réunit les fichiers d'une analyse avec leurs noms d'origine; il est référencé par les
+# runs qui l'utilisent et peut servir à de nouvelles analyses.
+# Nettoyage (flask gc-datasets): suppression des jeux de données sans run inutilisés depuis la durée de rétention, puis
+# des moins récemment utilisés tant que le dépôt dépasse son quota, et enfin des fichiers qui ne font plus partie
+# d'aucun jeu de données. Les jeux et fichiers utilisés depuis moins de DELAI_GRACE ne sont jamais supprimés
+# (téléversement en cours de vérification ou de mise en file).
+
+import hashlib
+import os
+import tempfile
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, or_
+from models import db, Run, FichierDepot, JeuDonnees
+
+TAILLE_BLOC = 1024 * 1024
+DELAI_GRACE = timedelta(hours=1)
+PREFIXE_TEMPORAIRE = '.televersement-'
+
+def chemin_fichier(sha256):
+    return os.path.join(current_app.config['UPLOADS_DIR'], sha256[:2], sha256)
+
+# Chemins des fichiers d'un jeu de données, sous les noms des paramètres d'analyse
+def chemins_jeu(jeu):
+    return {
+        'counts_file': chemin_fichier(jeu.counts_sha),
+        'metadata_file': chemin_fichier(jeu.metadata_sha),
+        'genes_file': chemin_fichier(jeu.genes_sha) if jeu.genes_sha else None,
+    }
+
+# Écrit le contenu d'un flux dans le dépôt (s'il n'y est pas déjà) et retourne son FichierDepot
+# (ajouté à la session; la transaction est validée par l'appelant)
+def stocker(flux):
+    dossier = current_app.config['UPLOADS_DIR']
+    os.makedirs(dossier, exist_ok=True)
+    sha = hashlib.sha256()
+    taille = 0
+    with tempfile.NamedTemporaryFile(dir=dossier, prefix=PREFIXE_TEMPORAIRE, delete=False) as temporaire:
+        try:
+            for bloc in iter(lambda: flux.read(TAILLE_BLOC), b''):
+                sha.update(bloc)
+                temporaire.write(bloc)
+                taille += len(bloc)
+        except BaseException:
+            os.remove(temporaire.name)
+            raise
+    empreinte = sha.hexdigest()
+    chemin = chemin_fichier(empreinte)
+    if os.path.exists(chemin):
+        # Même contenu déjà dans le dépôt (date de modification mise à jour: le nettoyage ne le supprime pas avant que
+        # sa ligne soit enregistrée)
+        os.remove(temporaire.name)
+        os.utime(chemin)
+    else:
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        os.replace(temporaire.name, chemin)
+
+    maintenant = datetime.utcnow()
+    fichier = FichierDepot.query.get(empreinte)
+    if fichier is None:
+        fichier = FichierDepot(sha256=empreinte, size=taille, created_at=maintenant)
+        db.session.add(fichier)
+    fichier.last_used_at = maintenant
+    return fichier
+
+# Téléverse les fichiers d'un jeu de données et retourne le JeuDonnees de l'utilisateur pour ces fichiers: celui qu'il a
+# déjà envoyé avec les mêmes contenus, ou un nouveau (la transaction est validée par l'appelant).
+#   fichiers  rôle ('counts', 'metadata', 'genes') -> (flux binaire, nom d'origine); 'genes' est optionnel
+def televerser_jeu(user_id, fichiers):
+    shas = {role: stocker(flux).sha256 for role, (flux, _) in fichiers.items()}
+    noms = {role: nom for role, (_, nom) in fichiers.items()}
+    jeu = JeuDonnees.query.filter_by(user_id=user_id, counts_sha=shas['counts'], metadata_sha=shas['metadata'],
+                                     genes_sha=shas.get('genes')).first()
+    if jeu is None:
+        jeu = JeuDonnees(user_id=user_id, counts_sha=shas['counts'], metadata_sha=shas['metadata'], genes_sha=shas.get('genes'),
+                         counts_name=noms['counts'], metadata_name=noms['metadata'], genes_name=noms.get('genes'))
+        db.session.add(jeu)
+    jeu.last_used_at = datetime.utcnow()
+    return jeu
+
+# Jeu de données d'un utilisateur réutilisé pour une nouvelle analyse (None s'il n'existe pas ou n'est pas le sien)
+def reutiliser_jeu(user_id, jeu_id):
+    jeu = JeuDonnees.query.filter_by(id=jeu_id, user_id=user_id).first()
+    if jeu is not None:
+        jeu.last_used_at = datetime.utcnow()
+        for sha in (jeu.counts_sha, jeu.metadata_sha, jeu.genes_sha):
+            if sha:
+                FichierDepot.query.filter_by(sha256=sha).update({'last_used_at': jeu.last_used_at}, synchronize_session=False)
+    return jeu
+
+# Jeux de données d'un utilisateur, les plus récemment utilisés d'abord, avec leur nombre de runs et leur taille
+def jeux_utilisateur(user_id):
+    n_runs = (db.session.query(Run.dataset_id, func.count(Run.id).label('n'))
+              .filter(Run.user_id == user_id, Run.dataset_id != None)
+              .group_by(Run.dataset_id)
+              .subquery())
+    jeux = (db.session.query(JeuDonnees, func.coalesce(n_runs.c.n, 0))
+            .outerjoin(n_runs, n_runs.c.dataset_id == JeuDonnees.id)
+            .filter(JeuDonnees.user_id == user_id)
+            .order_by(JeuDonnees.last_used_at.desc())
+            .all())
+    tailles = dict(db.session.query(FichierDepot.sha256, FichierDepot.size)
+                   .filter(FichierDepot.sha256.in_({jeu.counts_sha for jeu, _ in jeux})).all())
+    return [{
+        'id': jeu.id,
+        'counts_name': jeu.counts_name,
+        'metadata_name': jeu.metadata_name,
+        'genes_name': jeu.genes_name,
+        'counts_size': tailles.get(jeu.counts_sha),
+        'created_at': jeu.created_at,
+        'last_used_at': jeu.last_used_at,
+        'runs': runs,
+    } for jeu, runs in jeux]
+
+def taille_depot():
+    return db.session.query(func.coalesce(func.sum(FichierDepot.size), 0)).scalar()
+
+# Supprime la ligne d'un fichier qui ne fait plus partie d'aucun jeu de données (la transaction est validée par
+# l'appelant). Retourne la taille libérée et le chemin à supprimer après la validation (None s'il est encore utilisé).
+def liberer_fichier(sha256):
+    utilise = (JeuDonnees.query
+               .filter(or_(JeuDonnees.counts_sha == sha256, JeuDonnees.metadata_sha == sha256, JeuDonnees.genes_sha == sha256))
+               .first())
+    fichier = FichierDepot.query.get(sha256)
+    if utilise is not None or fichier is None:
+        return 0, None
+    db.session.delete(fichier)
+    return fichier.size, chemin_fichier(sha256)
+
+# Nettoyage du dépôt. Supprime les jeux de données sans run inutilisés depuis plus de retention (None: aucune limite),
+# puis les moins récemment utilisés tant que le dépôt dépasse max_octets, et les fichiers sans jeu de données
+# (téléversements refusés à la vérification). simulation: rien n'est supprimé, seul le bilan est calculé.
+# Retourne le bilan: {datasets, files, bytes_freed, bytes}.
+def nettoyer_depot(max_octets, retention=None, simulation=False, grace=DELAI_GRACE):
+    maintenant = datetime.utcnow()
+    limite_grace = maintenant - grace
+    taille = taille_depot()
+    bilan = {'datasets': 0, 'files': 0, 'bytes_freed': 0}
+    a_supprimer = []
+
+    def liberer(shas):
+        for sha in shas:
+            liberee, chemin = liberer_fichier(sha)
+            if chemin is not None:
+                bilan['files'] += 1
+                bilan['bytes_freed'] += liberee
+                a_supprimer.append(chemin)
+
+    sans_run = (db.session.query(JeuDonnees)
+                .outerjoin(Run, Run.dataset_id == JeuDonnees.id)
+                .filter(JeuDonnees.last_used_at < limite_grace)
+                .group_by(JeuDonnees.id)
+                .having(func.count(Run.id) == 0)
+                .order_by(JeuDonnees.last_used_at)
+                .all())
+    for jeu in sans_run:
+        expire = retention is not None and jeu.last_used_at < maintenant - retention
+        if not expire and taille - bilan['bytes_freed'] <= max_octets:
+            # Jeux suivants plus récents: ni expirés, ni nécessaires pour respecter le quota
+            break
+        shas = {jeu.counts_sha, jeu.metadata_sha, jeu.genes_sha} - {None}
+        db.session.delete(jeu)
+        db.session.flush()
+        bilan['datasets'] += 1
+        liberer(shas)
+
+    # Fichiers sans jeu de données (ex.: téléversement refusé à la vérification des fichiers)
+    orphelins = (db.session.query(FichierDepot.sha256)
+                 .filter(FichierDepot.last_used_at < limite_grace)
+                 .filter(~db.session.query(JeuDonnees.id).filter(or_(
+                     JeuDonnees.counts_sha == FichierDepot.sha256,
+                     JeuDonnees.metadata_sha == FichierDepot.sha256,
+                     JeuDonnees.genes_sha == FichierDepot.sha256)).exists())
+                 .all())
+    liberer(sha for sha, in orphelins)
+    bilan['bytes'] = taille - bilan['bytes_freed']
+
+    if simulation:
+        db.session.rollback()
+        return bilan
+    db.session.commit()
+    for chemin in a_supprimer:
+        if os.path.exists(chemin):
+            os.remove(chemin)
+    supprimer_fichiers_sans_ligne(limite_grace)
+    return bilan
+
+# Fichiers du dépôt sans ligne dans la BD (transaction annulée après l'écriture du fichier) et fichiers temporaires
+# abandonnés, plus anciens que limite
+def supprimer_fichiers_sans_ligne(limite):
+    dossier = current_app.config['UPLOADS_DIR']
+    if not os.path.isdir(dossier):
+        return
+    connus = {sha for sha, in db.session.query(FichierDepot.sha256).all()}
+    for racine, _, noms in os.walk(dossier):
+        for nom in noms:
+            chemin = os.path.join(racine, nom)
+            if nom in connus or datetime.utcfromtimestamp(os.path.getmtime(chemin)) >= limite:
+                continue
+            if nom.startswith(PREFIXE_TEMPORAIRE) or racine != dossier:
+                os.remove(chemin)
@@ -0,0 +1,48 @@
+# fonctions_figures.py
+# Stockage des figures (PNG) adressé par contenu dans static/output/.
+# Le nom de chaque fichier est l'empreinte SHA-256 de son contenu: une figure identique n'est écrite qu'une fois,
+# et un nom donné correspond toujours au même contenu, ce qui permet une mise en cache permanente par le navigateur.
+
+import base64
+import hashlib
+import os
+import re
+
+FORMAT_NOM_FIGURE = re.compile(r'^[0-9a-f]{64}\.png$')
+
+# Nombre maximal de gènes du heatmap: les gènes significatifs les plus variables entre les échantillons
+# (figure PNG de l'analyse et, par défaut, heatmap interactif de la page de résultats)
+HEATMAP_MAX_GENES = 500
+
+# Vrai si la valeur d'une colonne heatmap_path/volcanoplot_path est un nom de fichier du stockage
+# (les anciennes analyses contiennent l'image encodée en base64)
+def est_nom_figure(valeur):
+    return bool(valeur) and FORMAT_NOM_FIGURE.match(valeur) is not None
+
+# Fonction pour enregistrer le contenu d'une figure dans le stockage; retourne le nom du fichier
+def enregistrer_figure(contenu, dossier):
+    nom = f'{hashlib.sha256(contenu).hexdigest()}.png'
+    chemin = os.path.join(dossier, nom)
+    if not os.path.exists(chemin):
+        os.makedirs(dossier, exist_ok=True)
+        # Écriture dans un fichier temporaire puis renommage atomique: un lecteur ne voit jamais une figure partielle
+        fichier_temporaire = f'{chemin}.{os.getpid()}.tmp'
+        with open(fichier_temporaire, 'wb') as fichier:
+            fichier.write(contenu)
+        os.replace(fichier_temporaire, chemin)
+    return nom
+
+# Fonction pour convertir une figure encodée en base64 (ancien format) en fichier du stockage
+def migrer_figure(valeur, dossier):
+    if not valeur or est_nom_figure(valeur):
+        return valeur
+    return enregistrer_figure(base64.b64decode(valeur), dossier)
+
+def taille_figure(nom, dossier):
+    chemin = os.path.join(dossier, nom) if est_nom_figure(nom) else None
+    return os.path.getsize(chemin) if chemin and os.path.exists(chemin) else 0
+
+def supprimer_figure(nom, dossier):
+    chemin = os.path.join(dossier, nom)
+    if est_nom_figure(nom) and os.path.exists(chemin):
+        os.remove(chemin)
@@ -0,0 +1,241 @@
+# fonctions_genes.py
+# Index des résultats par gène de toutes les analyses (table resultat_gene), pour répondre à « dans quelles analyses ce
+# gène est-il significatif, et avec quel log2FoldChange? » sans relire le modèle ou le texte des résultats de chaque run.
+# Les lignes d'un run sont insérées en bloc par l'ordonnanceur une fois le run terminé (analyse, cache ou ancien run pas
+# encore indexé), ou par flask index-genes. Seuls les gènes testés (padj défini) sont indexés: les autres ne peuvent être
+# significatifs avec aucun seuil.
+# La recherche d'un gène est paginée par curseur (keyset) sur (valeur triée, id): chaque page ne lit que ses lignes,
+# quel que soit le nombre de lignes de la table.
+
+import math
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import undefer
+from models import db, Run, Contraste, ResultatGene, STATUT_TERMINE
+from fonctions_results import traiter_results
+from fonctions_pagination import lire_date
+
+# Lignes insérées par requête (executemany)
+LIGNES_PAR_INSERTION = 10000
+
+# Seuils par défaut du formulaire d'analyse d'origine (anciens runs dont le texte des résultats ne donne pas les seuils)
+ALPHA_ANCIENS_RUNS = 0.01
+LFC_ANCIENS_RUNS = 2.0
+
+# Tris de la recherche: colonne triée et sens (vrai: décroissant). Une valeur manquante (log2FoldChange NULL, ancien run
+# sans date) est remplacée par une valeur sentinelle triée en dernier, que le curseur encode et décode comme les autres.
+# padj n'est jamais NULL (seuls les gènes testés sont indexés).
+TRI_PADJ = 'padj'
+TRI_LFC = 'lfc'
+TRI_DATE = 'date'
+LFC_MANQUANT = -1.0
+DATE_MANQUANTE = datetime(1, 1, 1)
+TRIS = {
+    TRI_PADJ: (ResultatGene.padj, False),
+    TRI_LFC: (func.coalesce(func.abs(ResultatGene.log2_fold_change), LFC_MANQUANT), True),
+    TRI_DATE: (func.coalesce(Run.analysis_date, DATE_MANQUANTE), True),
+}
+
+def valeur_sql(valeur):
+    return None if valeur is None or math.isnan(valeur) else float(valeur)
+
+# Résultats de chaque contraste d'un run: liste de (position, gènes, baseMean, log2FoldChange, padj).
+# Modèle ajusté (.npz) des analyses récentes, ou matrice texte (un seul contraste) des anciennes analyses.
+def resultats_run(run):
+    if run.model_path:
+        with np.load(run.model_path, allow_pickle=False) as donnees:
+            genes = donnees['genes'].astype(str)
+            colonnes = [str(colonne) for colonne in donnees['results_columns']]
+            valeurs = donnees['results']
+        if valeurs.ndim == 2:
+            valeurs = valeurs[np.newaxis]
+        return [(position, genes, table[:, colonnes.index('baseMean')], table[:, colonnes.index('log2FoldChange')],
+                 table[:, colonnes.index('padj')]) for position, table in enumerate(valeurs)]
+    if run.text_results:
+        matrice = traiter_results(run.text_results).get('matrice', '')
+        lignes = [ligne.split() for ligne in matrice.split('\n')[1:] if ligne.strip()]
+        lignes = [ligne for ligne in lignes if len(ligne) == 7]
+        if lignes:
+            genes = np.array([ligne[0] for ligne in lignes])
+            valeurs = np.array([[float(valeur) for valeur in ligne[1:]] for ligne in lignes])
+            return [(0, genes, valeurs[:, 0], valeurs[:, 1], valeurs[:, 5])]
+    return []
+
+# Lignes de l'index d'un run (lecture du modèle, sans transaction d'écriture)
+def lignes_run(run):
+    lignes = []
+    for position, genes, base_mean, lfc, padj in resultats_run(run):
+        lignes += [{
+            'run_id': run.id,
+            'position': position,
+            'gene': str(genes[i]),
+            'base_mean': valeur_sql(base_mean[i]),
+            'log2_fold_change': valeur_sql(lfc[i]),
+            'padj': float(padj[i]),
+        } for i in np.flatnonzero(~np.isnan(padj))]
+    return lignes
+
+# Remplace les lignes d'un run dans l'index (la transaction est validée par l'appelant)
+def remplacer_lignes(run_id, lignes):
+    ResultatGene.query.filter_by(run_id=run_id).delete(synchronize_session=False)
+    for debut in range(0, len(lignes), LIGNES_PAR_INSERTION):
+        db.session.execute(ResultatGene.__table__.insert(), lignes[debut:debut + LIGNES_PAR_INSERTION])
+
+# Indexe au plus n runs terminés qui ne le sont pas encore (None: tous). Retourne le nombre de runs indexés.
+# Les lignes sont préparées avant la transaction d'écriture, qui ne contient que la réclamation du run (UPDATE
+# conditionnel: deux ordonnanceurs n'indexent pas le même run) et les insertions: le verrou d'écriture de la BD est
+# gardé le moins longtemps possible. Les seuils manquants d'un ancien run sont complétés par la même réclamation.
+def indexer_runs_en_attente(n=None):
+    requete = (db.session.query(Run.id)
+               .filter(Run.status == STATUT_TERMINE, Run.genes_indexed == False)
+               .order_by(Run.id))
+    if n is not None:
+        requete = requete.limit(n)
+    indexes = 0
+    for run_id, in requete.all():
+        run = Run.query.get(run_id)
+        if run is None:
+            # Supprimé entre-temps
+            continue
+        try:
+            lignes = lignes_run(run)
+        except (OSError, ValueError, KeyError) as erreur:
+            # Modèle supprimé ou illisible: le run est marqué indexé (sans lignes) pour ne pas être réessayé à chaque tour
+            current_app.logger.warning("Résultats du run %s non indexés: %s", run_id, erreur)
+            lignes = []
+        reclame = (Run.query
+                   .filter_by(id=run_id, status=STATUT_TERMINE, genes_indexed=False)
+                   .update({'genes_indexed': True, **seuils_manquants(run)}, synchronize_session=False))
+        if not reclame:
+            db.session.rollback()
+            continue
+        remplacer_lignes(run_id, lignes)
+        db.session.commit()
+        indexes += 1
+    return indexes
+
+# Les anciens runs (texte des résultats) n'ont pas de seuils dans leurs colonnes: sans eux, le filtre « significatif »
+# de la recherche les ignorerait (comparaison avec NULL). Les seuils sont lus dans le texte des résultats (lignes
+# alpha_thres: et lfc_thres:), sinon ce sont ceux du formulaire d'origine. Retourne les colonnes à compléter.
+def seuils_manquants(run):
+    if (run.alpha_thres is not None and run.lfc_thres is not None) or not run.text_results:
+        return {}
+    texte = traiter_results(run.text_results)
+    seuils = {}
+    if run.alpha_thres is None:
+        alpha = lire_reel(texte.get('alpha_thres'))
+        seuils['alpha_thres'] = ALPHA_ANCIENS_RUNS if alpha is None else alpha
+    if run.lfc_thres is None:
+        lfc = lire_reel(texte.get('lfc_thres'))
+        seuils['lfc_thres'] = LFC_ANCIENS_RUNS if lfc is None else lfc
+    return seuils
+
+# Complète les seuils des anciens runs déjà indexés (au démarrage; les autres le sont à leur indexation). Retourne le
+# nombre de runs complétés.
+def completer_seuils_anciens_runs():
+    runs = (Run.query
+            .options(undefer(Run.text_results))
+            .filter(or_(Run.alpha_thres == None, Run.lfc_thres == None), Run.text_results != None)
+            .all())
+    for run in runs:
+        for colonne, valeur in seuils_manquants(run).items():
+            setattr(run, colonne, valeur)
+    if runs:
+        db.session.commit()
+    return len(runs)
+
+def encoder_curseur(valeur, ligne_id):
+    if isinstance(valeur, datetime):
+        valeur = valeur.isoformat()
+    return f'{valeur}_{ligne_id}'
+
+def decoder_curseur(curseur, tri):
+    try:
+        valeur, ligne_id = curseur.rsplit('_', 1)
+        valeur = datetime.fromisoformat(valeur) if tri == TRI_DATE else float(valeur)
+        return valeur, int(ligne_id)
+    except (AttributeError, ValueError):
+        return None
+
+def lire_reel(valeur):
+    try:
+        return float(valeur) if valeur not in (None, '') else None
+    except ValueError:
+        return None
+
+# Filtres de la recherche à partir des paramètres de l'URL: seuil de padj, |log2FoldChange| minimal, significatif avec les
+# seuils de chaque analyse, intervalle de dates, tri
+def filtres_genes(args):
+    filtres = {
+        'gene': (args.get('gene') or '').strip(),
+        'padj_max': args.get('padj_max', ''),
+        'lfc_min': args.get('lfc_min', ''),
+        'significant': '1' if args.get('significant', '').lower() in ('1', 'true', 'on') else '',
+        'date_from': args.get('date_from', ''),
+        'date_to': args.get('date_to', ''),
+        'sort': args.get('sort') if args.get('sort') in TRIS else TRI_PADJ,
+    }
+    criteres = []
+    padj_max = lire_reel(filtres['padj_max'])
+    if padj_max is not None:
+        criteres.append(ResultatGene.padj <= padj_max)
+    lfc_min = lire_reel(filtres['lfc_min'])
+    if lfc_min is not None:
+        criteres.append(func.abs(ResultatGene.log2_fold_change) >= lfc_min)
+    if filtres['significant']:
+        criteres.append(and_(ResultatGene.padj < Run.alpha_thres, func.abs(ResultatGene.log2_fold_change) > Run.lfc_thres))
+    date_debut = lire_date(filtres['date_from'])
+    if date_debut:
+        criteres.append(Run.analysis_date >= date_debut)
+    date_fin = lire_date(filtres['date_to'])
+    if date_fin:
+        # Date de fin incluse: jusqu'à la fin de la journée
+        criteres.append(Run.analysis_date < date_fin.replace(hour=23, minute=59, second=59, microsecond=999999))
+    return filtres, criteres
+
+# Une page des résultats d'un gène dans les analyses (de l'utilisateur user_id; None: toutes) et le curseur de la page
+# suivante (None si dernière page). Chaque ligne: run, contraste, baseMean, log2FoldChange, padj, significatif avec les
+# seuils du run.
+def rechercher_gene(gene, criteres, tri, curseur, taille, user_id=None):
+    colonne, decroissant = TRIS[tri]
+    # Les anciens runs (un seul contraste) n'ont pas de ligne dans la table contraste
+    requete = (db.session.query(ResultatGene, Run.analysis_date, Run.counts_file, Run.alpha_thres, Run.lfc_thres,
+                                func.coalesce(Contraste.condition_1, Run.condition_1),
+                                func.coalesce(Contraste.condition_2, Run.condition_2), colonne)
+               .join(Run, Run.id == ResultatGene.run_id)
+               .outerjoin(Contraste, and_(Contraste.run_id == ResultatGene.run_id, Contraste.position == ResultatGene.position))
+               .filter(ResultatGene.gene == gene)
+               .filter(*criteres))
+    if user_id is not None:
+        requete = requete.filter(Run.user_id == user_id)
+    position = decoder_curseur(curseur, tri) if curseur else None
+    if position is not None:
+        valeur, ligne_id = position
+        if decroissant:
+            requete = requete.filter(or_(colonne < valeur, and_(colonne == valeur, ResultatGene.id < ligne_id)))
+        else:
+            requete = requete.filter(or_(colonne > valeur, and_(colonne == valeur, ResultatGene.id > ligne_id)))
+    ordre = (colonne.desc(), ResultatGene.id.desc()) if decroissant else (colonne.asc(), ResultatGene.id.asc())
+    lignes = requete.order_by(*ordre).limit(taille + 1).all()
+    suivant = None
+    if len(lignes) > taille:
+        suivant = encoder_curseur(lignes[taille - 1][-1], lignes[taille - 1][0].id)
+    resultats = []
+    for resultat, date, counts_file, alpha_thres, lfc_thres, condition_1, condition_2, _ in lignes[:taille]:
+        lfc = resultat.log2_fold_change
+        resultats.append({
+            'run_id': resultat.run_id,
+            'analysis_date': date,
+            'counts_file': counts_file,
+            'contrast': resultat.position,
+            'condition_1': condition_1,
+            'condition_2': condition_2,
+            'base_mean': resultat.base_mean,
+            'log2_fold_change': lfc,
+            'padj': resultat.padj,
+            'significant': (alpha_thres is not None and lfc is not None and resultat.padj < alpha_thres
+                            and abs(lfc) > lfc_thres),
+        })
+    return resultats, suivant
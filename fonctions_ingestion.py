@@ -0,0 +1,173 @@
+# fonctions_ingestion.py
+# Lecture des fichiers counts et metadata avant l'ajustement pyDESeq2.
+# La matrice counts est lue par blocs de gènes: chaque bloc est validé, filtré avec min_reads_per_gene puis converti
+# en entiers non signés compacts (uint32), de sorte que la matrice complète en int64/object n'est jamais en mémoire.
+# L'alignement des échantillons entre counts et metadata est vérifié avant la lecture de la matrice.
+# La détection du format des counts (texte, featureCounts, Parquet, MatrixMarket) et la validation des en-têtes sont dans
+# fonctions_validation, importé par le processus web sans pandas.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from fonctions_validation import (FORMAT_PARQUET, FORMAT_MATRIXMARKET, ouvrir_texte, decrire_counts, samples_counts,
+                                  verifier_alignement, verifier_design)
+
+# pyarrow est optionnel: seulement nécessaire pour les fichiers Parquet
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# Nombre de gènes (lignes du fichier counts) lus par bloc
+TAILLE_BLOC = 10000
+
+# Lecture du fichier metadata; la 1ère colonne (échantillons) devient l'index
+def lire_metadata(metadata_file):
+    metadata = pd.read_csv(metadata_file)
+    metadata = metadata.set_index(metadata.columns[0])
+    metadata.index = metadata.index.astype(str)
+    return metadata
+
+# Vérifie qu'un bloc de counts ne contient que des entiers non négatifs (comme pydeseq2, mais bloc par bloc)
+def verifier_bloc(valeurs, premier_gene):
+    if np.isnan(valeurs).any():
+        raise ValueError(f"Le fichier counts contient des valeurs manquantes (bloc commençant au gène {premier_gene}).")
+    if (valeurs < 0).any():
+        raise ValueError(f"Le fichier counts contient des valeurs négatives (bloc commençant au gène {premier_gene}).")
+    if (valeurs % 1 != 0).any():
+        raise ValueError(f"Le fichier counts contient des valeurs non entières (bloc commençant au gène {premier_gene}).")
+
+# Type entier le plus compact pour des counts (uint32 sauf si une valeur dépasse sa capacité)
+def type_counts(valeur_max):
+    return np.uint32 if valeur_max <= np.iinfo(np.uint32).max else np.uint64
+
+# Noms des gènes d'une matrice MatrixMarket: 1ère colonne du fichier des gènes (un gène par ligne, format des
+# features.tsv), ou numéro de ligne de la matrice si aucun fichier n'est fourni
+def lire_genes(genes_file, n_genes):
+    if genes_file is None:
+        return np.array([f'gene_{numero}' for numero in range(1, n_genes + 1)])
+    with ouvrir_texte(genes_file) as fichier:
+        genes = np.array([ligne.split('\t')[0].strip() for ligne in fichier if ligne.strip()])
+    if len(genes) != n_genes:
+        raise ValueError(f"Le fichier des gènes contient {len(genes)} gènes mais la matrice MatrixMarket a {n_genes} lignes.")
+    return genes
+
+# Blocs d'une matrice MatrixMarket: la matrice creuse est lue en entier (seulement les valeurs non nulles),
+# seul un bloc de lignes à la fois est converti en matrice dense
+def blocs_matrixmarket(counts_file, description, genes_file, samples, positions, taille_bloc):
+    valeurs = pd.read_csv(counts_file, sep=r'\s+', header=None, skiprows=description['lignes_ignorees'],
+                          names=['ligne', 'colonne', 'valeur'], dtype={'ligne': np.int64, 'colonne': np.int64, 'valeur': np.float64},
+                          compression='gzip' if description['gzip'] else None)
+    # Les indices MatrixMarket commencent à 1
+    matrice = scipy.sparse.csr_matrix(
+        (valeurs['valeur'].to_numpy(), (valeurs['ligne'].to_numpy() - 1, valeurs['colonne'].to_numpy() - 1)),
+        shape=(description['n_genes'], description['n_samples'])
+    )
+    del valeurs
+    genes = lire_genes(genes_file, matrice.shape[0])
+    for debut in range(0, matrice.shape[0], taille_bloc):
+        valeurs = matrice[debut:debut + taille_bloc][:, positions].toarray().astype(np.float64)
+        bloc = pd.DataFrame(valeurs, columns=samples)
+        bloc.insert(0, 'Geneid', genes[debut:debut + taille_bloc])
+        yield bloc
+
+# Blocs d'un fichier Parquet, lus par groupes de lignes avec seulement les colonnes nécessaires
+def blocs_parquet(counts_file, colonne_genes, samples, taille_bloc):
+    fichier = pq.ParquetFile(counts_file)
+    for lot in fichier.iter_batches(batch_size=taille_bloc, columns=[colonne_genes] + samples):
+        # ignore_metadata: l'index pandas éventuel (les gènes) reste une colonne ordinaire
+        bloc = lot.to_pandas(ignore_metadata=True)
+        yield bloc[[colonne_genes] + samples]
+
+# Lecture par blocs d'un fichier counts (ligne: gène, colonne: échantillon) en ne gardant que les colonnes samples
+# et les gènes qui ont au moins min_reads_per_gene reads au total. Retourne une DataFrame gènes x échantillons.
+def lire_counts(counts_file, samples, min_reads_per_gene, taille_bloc=TAILLE_BLOC, description=None, genes_file=None):
+    if description is None:
+        description = decrire_counts(counts_file)
+    colonne_genes = description['colonne_genes']
+    position_sample = dict(zip(description['samples'], description['positions']))
+
+    if description['format'] == FORMAT_MATRIXMARKET:
+        blocs = blocs_matrixmarket(counts_file, description, genes_file, samples, [position_sample[sample] for sample in samples], taille_bloc)
+    elif description['format'] == FORMAT_PARQUET:
+        blocs = blocs_parquet(counts_file, colonne_genes, samples, taille_bloc)
+    else:
+        # Colonnes lues par position: la colonne des gènes n'a pas toujours de nom (ex.: fichiers exportés de R), et les
+        # noms des échantillons de featureCounts sont des chemins de fichiers BAM
+        positions = [0] + [position_sample[sample] for sample in samples]
+        # float64 pour détecter les valeurs manquantes/non entières; seul un bloc à la fois est dans ce format
+        types = {position: np.float64 for position in positions[1:]}
+        types[0] = str
+        lecteur = pd.read_csv(counts_file, sep=description['sep'], skiprows=description['lignes_ignorees'],
+                              usecols=positions, dtype=types, chunksize=taille_bloc,
+                              compression='gzip' if description['gzip'] else None)
+        # Les colonnes lues sont dans l'ordre du fichier
+        noms = dict(zip(positions, [colonne_genes] + samples))
+        colonnes = [noms[position] for position in sorted(positions)]
+        blocs = (bloc.set_axis(colonnes, axis=1) for bloc in lecteur)
+    return filtrer_blocs(blocs, colonne_genes, min_reads_per_gene)
+
+# Filtration des blocs de counts (DataFrames avec la colonne des gènes en premier puis une colonne par échantillon)
+def filtrer_blocs(blocs, colonne_genes, min_reads_per_gene):
+    genes, valeurs_gardees = [], []
+    samples = None
+    for bloc in blocs:
+        samples = list(bloc.columns[1:])
+        valeurs = bloc.iloc[:, 1:].to_numpy(dtype=np.float64)
+        if len(valeurs) == 0:
+            continue
+        verifier_bloc(valeurs, bloc.iloc[0, 0])
+        ## Filtrer les comptes brutes ##
+        # Calcule la somme des counts/reads par gène et garder que les gènes qui ont une somme plus grande que
+        # min_reads_per_gene pour enlever les gènes qui contiennent peu de reads/counts à travers tous les échantillons
+        garder = valeurs.sum(axis=1) >= min_reads_per_gene
+        if garder.any():
+            valeurs = valeurs[garder]
+            genes.append(bloc.iloc[:, 0].to_numpy()[garder])
+            valeurs_gardees.append(valeurs.astype(type_counts(valeurs.max())))
+
+    if not genes:
+        raise ValueError(f"Aucun gène n'a au moins {min_reads_per_gene} reads au total.")
+    counts = pd.DataFrame(
+        np.concatenate(valeurs_gardees),
+        index=pd.Index(np.concatenate(genes).astype(str), name=colonne_genes),
+        columns=samples
+    )
+    if counts.index.duplicated().any():
+        doublons = counts.index[counts.index.duplicated()].unique()[:10]
+        raise ValueError(f"Le fichier counts contient des gènes en double: {', '.join(doublons)}")
+    return counts
+
+# Étape d'ingestion complète: metadata, alignement des échantillons, puis lecture filtrée des counts.
+# Retourne counts (échantillons x gènes, comme pydeseq2 le nécessite) et metadata dans le même ordre d'échantillons.
+def ingerer(counts_file, metadata_file, min_reads_per_gene, taille_bloc=TAILLE_BLOC, genes_file=None, covariables=None):
+    metadata = lire_metadata(metadata_file)
+    design_factor = metadata.columns[0]
+    erreurs = verifier_design(list(metadata.columns), set(), covariables)
+    if erreurs:
+        raise ValueError(' '.join(erreurs))
+    # Un échantillon sans valeur pour le design factor ou une covariable est retiré de l'analyse
+    complets = metadata[[design_factor] + list(covariables or [])].notna().all(axis=1)
+    conditions = {sample: (str(valeur) if complet else None)
+                  for (sample, valeur), complet in zip(metadata[design_factor].items(), complets)}
+
+    description = decrire_counts(counts_file)
+    samples_fichier, erreurs = samples_counts(description, list(metadata.index))
+    if erreurs:
+        raise ValueError(' '.join(erreurs))
+    if description['format'] == FORMAT_MATRIXMARKET:
+        description = dict(description, samples=samples_fichier, positions=list(range(len(samples_fichier))))
+    samples, erreurs = verifier_alignement(samples_fichier, conditions)
+    if erreurs:
+        raise ValueError(' '.join(erreurs))
+
+    counts = lire_counts(counts_file, samples, min_reads_per_gene, taille_bloc, description, genes_file)
+
+    ## Inverser les colonnes et lignes ##
+    # La majorité des données counts sur les base de données comme NCBI GEO sont comme-ci:
+        # ligne: features/gènes
+        # colonne: les échantillons
+    # pydeseq2 nécessite que counts soit comme-ci:
+        # ligne: les échantillons
+        # colonne: features/gènes
+    return counts.T, metadata.loc[samples]
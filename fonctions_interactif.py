@@ -0,0 +1,126 @@
+# fonctions_interactif.py
+# Données des figures interactives de la page de résultats (volcano plot et heatmap dessinés dans le navigateur).
+# Les données sont lues du modèle ajusté (.npz) et réduites pour rester légères quel que soit le nombre de gènes:
+#   volcano plot  grille de niveau x niveau cellules sur la zone affichée: les points d'une cellule qui en contient plus
+#                 de POINTS_PAR_CELLULE sont remplacés par un point représentatif (le plus significatif) et leur nombre;
+#                 les gènes isolés (significatifs, extrêmes) restent des points individuels. Un zoom redemande la zone
+#                 avec une nouvelle grille, donc plus de détails.
+#   heatmap       z-scores des gènes significatifs les plus variables, ordonnés par clustering hiérarchique
+# Les seuils alpha et log2FoldChange ne changent pas les points du volcano plot: le navigateur les colore lui-même.
+# Le volcano plot n'utilise que numpy; le heatmap charge le modèle complet avec les fonctions de l'analyse (pandas, scipy),
+# importées à la première demande seulement pour ne pas ralentir le démarrage du processus web.
+
+import numpy as np
+
+NIVEAU_VOLCANO = 200
+NIVEAU_VOLCANO_MAX = 1000
+POINTS_PAR_CELLULE = 4
+HEATMAP_MAX_GENES_INTERACTIF = 2000
+DECIMALES = 4
+
+# Table des résultats d'un contraste (gènes, log2FoldChange, padj) sans décompresser les counts log1p.
+# Les modèles d'un seul contraste (avant les analyses multi-contrastes) ont une table 2D et une clé 'contrast'.
+def lire_resultats(modele_path, contraste):
+    with np.load(modele_path, allow_pickle=False) as donnees:
+        genes = donnees['genes']
+        colonnes = [str(colonne) for colonne in donnees['results_columns']]
+        valeurs = donnees['results']
+        contrasts = donnees['contrasts'] if 'contrasts' in donnees else donnees['contrast'][np.newaxis]
+    if valeurs.ndim == 2:
+        valeurs = valeurs[np.newaxis]
+    if not 0 <= contraste < len(valeurs):
+        raise IndexError(f"Le modèle n'a pas de contraste {contraste}.")
+    return {
+        'genes': genes,
+        'contrast': [str(valeur) for valeur in contrasts[contraste]],
+        'lfc': valeurs[contraste][:, colonnes.index('log2FoldChange')],
+        'padj': valeurs[contraste][:, colonnes.index('padj')],
+    }
+
+def arrondir(valeurs):
+    return np.round(valeurs, DECIMALES).tolist()
+
+# Borne de zoom limitée à [minimum, maximum]; defaut si elle est absente ou non finie
+def limiter_borne(borne, defaut, minimum, maximum):
+    if borne is None or not np.isfinite(borne):
+        return defaut
+    return min(max(float(borne), minimum), maximum)
+
+# Points du volcano plot d'un contraste, réduits selon le niveau de détail.
+#   bornes  (x0, x1, y0, y1) de la zone affichée (None: tous les gènes). Chaque borne est limitée à l'étendue des
+#           données; une borne absente ou non finie (ex.: ?x0=nan ou inf) est remplacée par celle des données.
+# Retourne des colonnes (genes, x: log2FoldChange, y: -log10(padj), n: nombre de gènes représentés par chaque point)
+def donnees_volcano(modele_path, contraste, niveau=NIVEAU_VOLCANO, bornes=None):
+    resultats = lire_resultats(modele_path, contraste)
+    x = resultats['lfc']
+    y = -np.log10(resultats['padj'] + 1e-200)
+    # Les gènes sans padj (filtrage indépendant, outliers) ne sont pas affichés, comme dans plot_volcanoplot()
+    affiches = np.isfinite(x) & np.isfinite(y)
+    if affiches.any():
+        etendue = (float(x[affiches].min()), float(x[affiches].max()), 0.0, float(y[affiches].max()))
+    else:
+        etendue = (-1.0, 1.0, 0.0, 1.0)
+    if bornes is None:
+        bornes = etendue
+    x0, x1 = sorted(limiter_borne(borne, defaut, etendue[0], etendue[1]) for borne, defaut in zip(bornes[:2], etendue[:2]))
+    y0, y1 = sorted(limiter_borne(borne, defaut, etendue[2], etendue[3]) for borne, defaut in zip(bornes[2:], etendue[2:]))
+    affiches &= (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+    indices = np.flatnonzero(affiches)
+    x, y = x[indices], y[indices]
+
+    # Cellule de chaque point dans la grille niveau x niveau
+    largeur = max(x1 - x0, 1e-12)
+    hauteur = max(y1 - y0, 1e-12)
+    colonne = np.clip(((x - x0) / largeur * niveau).astype(np.int64), 0, niveau - 1)
+    ligne = np.clip(((y - y0) / hauteur * niveau).astype(np.int64), 0, niveau - 1)
+    cellules, cellule_point, nombres = np.unique(colonne * niveau + ligne, return_inverse=True, return_counts=True)
+
+    # Points gardés tels quels, puis un représentatif (le plus significatif) par cellule dense
+    isoles = nombres[cellule_point] <= POINTS_PAR_CELLULE
+    denses = np.flatnonzero(~isoles)
+    ordre = denses[np.lexsort((-y[denses], cellule_point[denses]))]
+    _, premiers = np.unique(cellule_point[ordre], return_index=True)
+    representants = ordre[premiers]
+    gardes = np.concatenate([np.flatnonzero(isoles), representants])
+    n = np.concatenate([np.ones(int(isoles.sum()), dtype=np.int64), nombres[cellule_point[representants]]])
+
+    return {
+        'contrast': resultats['contrast'],
+        'bounds': [x0, x1, y0, y1],
+        'level': niveau,
+        'total': int(len(indices)),
+        'genes': resultats['genes'][indices[gardes]].tolist(),
+        'x': arrondir(x[gardes]),
+        'y': arrondir(y[gardes]),
+        'n': n.tolist(),
+    }
+
+# Matrice du heatmap d'un contraste: z-scores (gènes x échantillons) des gènes significatifs avec les seuils donnés,
+# au plus max_genes gènes (les plus variables), lignes et colonnes dans l'ordre du clustering hiérarchique.
+# log2FoldChange et padj de chaque gène permettent au navigateur de prévisualiser des seuils plus stricts.
+def donnees_heatmap(modele_path, contraste, alpha_thres, lfc_thres, max_genes):
+    from scipy.cluster import hierarchy
+    from fonctions_analyse import charger_modele, post_filt, selectionner_genes_heatmap, lier
+    modele = charger_modele(modele_path)
+    if not 0 <= contraste < len(modele['contrastes']):
+        raise IndexError(f"Le modèle n'a pas de contraste {contraste}.")
+    results_df = modele['contrastes'][contraste]['results_df']
+    filt_results_df, filt_log1p_df = post_filt(results_df, modele['log1p'], alpha_thres, lfc_thres)
+    donnees = selectionner_genes_heatmap(filt_log1p_df, max_genes).T
+    z_scores = donnees.sub(donnees.mean(axis=1), axis=0).div(donnees.std(axis=1), axis=0).to_numpy()
+    ordre_genes = np.arange(z_scores.shape[0])
+    ordre_samples = np.arange(z_scores.shape[1])
+    if z_scores.shape[0] > 1:
+        ordre_genes = hierarchy.leaves_list(lier(z_scores))
+    if z_scores.shape[0] > 0 and z_scores.shape[1] > 1:
+        ordre_samples = hierarchy.leaves_list(lier(z_scores.T))
+    genes = donnees.index[ordre_genes]
+    return {
+        'contrast': modele['contrastes'][contraste]['contrast'],
+        'n_significant': int(len(filt_results_df)),
+        'genes': [str(gene) for gene in genes],
+        'samples': [str(sample) for sample in donnees.columns[ordre_samples]],
+        'z': np.round(z_scores[np.ix_(ordre_genes, ordre_samples)], 2).tolist(),
+        'lfc': arrondir(filt_results_df.loc[genes, 'log2FoldChange'].to_numpy()),
+        'padj': filt_results_df.loc[genes, 'padj'].to_numpy().tolist(),
+    }
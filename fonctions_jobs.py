@@ -0,0 +1,540 @@
+# fonctions_jobs.py
+# Ordonnanceur des analyses: file d'attente persistante (table job de la BD) et pool de processus borné.
+# Les analyses pyDESeq2 s'exécutent dans des processus séparés pour ne pas bloquer le processus web,
+# et peuvent être lancées par le processus web lui-même ou par un worker séparé (flask run-worker).
+# La pile scientifique (fonctions_analyse: pandas, matplotlib, pydeseq2) n'est jamais importée par ce module: les
+# processus du pool sont des copies d'un serveur de processus (forkserver) qui l'a importée une seule fois.
+
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy import case
+from sqlalchemy.orm import aliased
+from threadpoolctl import threadpool_limits
+from models import db, Run, Job, STATUT_EN_ATTENTE, STATUT_EN_COURS, STATUT_TERMINE, STATUT_ECHEC, JOB_ANALYSE, JOB_SEUILS, JOB_FIGURES
+from fonctions_cache import appliquer_cache, mettre_en_cache, enregistrer_contrastes, cle_cache, chemin_modele
+from fonctions_figures import enregistrer_figure
+from fonctions_profilage import mesurer
+from fonctions_metriques import enregistrer_profil
+from fonctions_courriels import mettre_en_file_courriel
+from fonctions_genes import indexer_runs_en_attente
+
+# Nombre maximal de tentatives pour un job dont le worker est mort en cours d'exécution
+MAX_TENTATIVES = 3
+
+# Runs terminés indexés par gène à chaque tour de l'ordonnanceur (les anciens runs sont rattrapés progressivement)
+RUNS_INDEXES_PAR_TOUR = 5
+
+# Modules préchargés par le serveur de processus du pool d'analyse
+MODULES_PRECHARGES = ['fonctions_analyse']
+
+# Variables d'environnement lues par les bibliothèques BLAS/OpenMP à leur chargement (ex.: processus enfants de joblib)
+VARIABLES_THREADS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+# File des messages de progression (run_id, étape) des processus du pool vers l'ordonnanceur.
+# Transmise à chaque processus du pool à sa création (initialiser_processus).
+_file_progression = None
+
+# Contexte multiprocessing du pool d'analyse: forkserver avec préchargement de MODULES_PRECHARGES si la plateforme le
+# permet, sinon le contexte par défaut (chaque processus importe alors fonctions_analyse à son premier job)
+def contexte_processus():
+    if 'forkserver' not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context()
+    contexte = multiprocessing.get_context('forkserver')
+    contexte.set_forkserver_preload(MODULES_PRECHARGES)
+    return contexte
+
+# Job soumis à la création du pool: démarre le serveur de processus et un premier processus d'analyse, pour que la
+# première analyse ne paie pas le chargement de la pile scientifique
+def prechauffer():
+    for module in MODULES_PRECHARGES:
+        importlib.import_module(module)
+    return os.getpid()
+
+def initialiser_processus(file_progression):
+    global _file_progression
+    _file_progression = file_progression
+    # Un seul thread BLAS/OpenMP par défaut: chaque job fixe ensuite sa propre limite (limiter_threads)
+    for variable in VARIABLES_THREADS:
+        os.environ[variable] = '1'
+
+def signaler_etape(run_id, etape):
+    if _file_progression is not None:
+        _file_progression.put((run_id, etape))
+
+# Limite les threads BLAS/OpenMP du processus (bibliothèques déjà chargées: threadpoolctl, fournie avec scikit-learn,
+# une dépendance de pyDESeq2) et de ses futurs processus enfants (variables d'environnement) pendant un job
+@contextmanager
+def limiter_threads(coeurs):
+    precedentes = {variable: os.environ.get(variable) for variable in VARIABLES_THREADS}
+    os.environ.update({variable: str(coeurs) for variable in VARIABLES_THREADS})
+    try:
+        with threadpool_limits(limits=coeurs):
+            yield
+    finally:
+        for variable, valeur in precedentes.items():
+            if valeur is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = valeur
+
+# Fonction exécutée dans un processus du pool.
+# Si le modèle ajusté existe déjà (job de seuils ou de figures, ou mêmes fichiers et paramètres d'ajustement qu'une
+# analyse précédente), seuls la filtration, les figures et le résumé sont refaits.
+# Lorsque le modèle est sauvegardé, les figures ne sont faites que par le job de figures qui suit (JOB_FIGURES): les
+# résultats sont enregistrés sans attendre les figures.
+# Les figures de chaque contraste sont écrites dans le stockage par le processus d'analyse; seuls leurs noms sont retournés.
+# coeurs: cœurs alloués au job par l'ordonnanceur (processus de l'inférence pyDESeq2 et threads BLAS/OpenMP).
+def executer_job(kind, parametres, modele_path, dossier_figures, run_id=None, processus_contrastes=1, coeurs=1):
+    with limiter_threads(coeurs):
+        return executer_job_limite(kind, parametres, modele_path, dossier_figures, run_id, min(processus_contrastes, coeurs), coeurs)
+
+def executer_job_limite(kind, parametres, modele_path, dossier_figures, run_id, processus_contrastes, coeurs):
+    # Déjà importé dans les processus du pool (MODULES_PRECHARGES)
+    from fonctions_analyse import analyse_dea, reseuiller
+    progression = partial(signaler_etape, run_id)
+    # Temps et mémoire de chaque étape (fonctions_profilage.mesurer)
+    profil = {}
+    resultat = None
+    figures = modele_path is None or kind == JOB_FIGURES
+    if modele_path is not None and (kind in (JOB_SEUILS, JOB_FIGURES) or os.path.exists(modele_path)):
+        try:
+            resultat = reseuiller(modele_path, parametres['alpha_thres'], parametres['lfc_thres'], progression, profil, figures)
+        except FileNotFoundError:
+            # Modèle supprimé entre-temps (éviction du cache): on refait l'analyse complète si possible
+            if kind != JOB_ANALYSE:
+                raise
+    if resultat is None:
+        resultat = analyse_dea(**parametres, modele_path=modele_path, processus_contrastes=processus_contrastes,
+                               progression=progression, profil=profil, figures=figures, n_cpus=coeurs)
+    resume, contrastes = resultat
+    if figures:
+        with mesurer(profil, 'enregistrement_figures'):
+            for contraste in contrastes:
+                contraste['heatmap'] = enregistrer_figure(contraste['heatmap'], dossier_figures)
+                contraste['volcanoplot'] = enregistrer_figure(contraste['volcanoplot'], dossier_figures)
+    return resume, contrastes, profil
+
+# Fonction pour ajouter une analyse à la file d'attente (la transaction est validée par l'appelant)
+#   covariables  colonnes du fichier metadata ajoutées au design
+#   contrastes   liste de [condition testée, condition de référence] (None: toutes les paires de conditions)
+#   jeu_donnees  jeu de données du dépôt dont viennent les fichiers (leurs noms d'origine sont affichés)
+def mettre_en_file(run, counts_file, metadata_file, refit_cooks, min_reads_per_gene, alpha_thres, lfc_thres, model_key=None, cache_key=None, genes_file=None,
+                   covariables=None, contrastes=None, jeu_donnees=None):
+    run.status = STATUT_EN_ATTENTE
+    run.counts_file = os.path.basename(counts_file)
+    run.metadata_file = os.path.basename(metadata_file)
+    if jeu_donnees is not None:
+        run.dataset = jeu_donnees
+        run.counts_file = jeu_donnees.counts_name
+        run.metadata_file = jeu_donnees.metadata_name
+    run.covariates = ', '.join(covariables) if covariables else None
+    run.refit_cooks = refit_cooks
+    run.min_reads_per_gene = min_reads_per_gene
+    run.alpha_thres = alpha_thres
+    run.lfc_thres = lfc_thres
+    job = Job(
+        run=run,
+        user_id=run.user_id,
+        kind=JOB_ANALYSE,
+        counts_file=counts_file,
+        metadata_file=metadata_file,
+        genes_file=genes_file,
+        covariates=json.dumps(covariables) if covariables else None,
+        contrasts=json.dumps(contrastes) if contrastes else None,
+        refit_cooks=refit_cooks,
+        min_reads_per_gene=min_reads_per_gene,
+        alpha_thres=alpha_thres,
+        lfc_thres=lfc_thres,
+        model_key=model_key,
+        cache_key=cache_key
+    )
+    db.session.add(job)
+    return job
+
+# Fonction pour remettre un run terminé dans la file avec de nouveaux seuils: le modèle ajusté sauvegardé est réutilisé,
+# seuls la filtration, les figures et le résumé sont refaits. Retourne vrai si les résultats étaient déjà en cache.
+# La transaction est validée par l'appelant.
+def reseuiller_run(run, alpha_thres, lfc_thres):
+    job = run.job
+    job.kind = JOB_SEUILS
+    job.alpha_thres = alpha_thres
+    job.lfc_thres = lfc_thres
+    job.attempts = 0
+    job.worker = None
+    job.cache_key = cle_cache(job.model_key, alpha_thres, lfc_thres) if job.model_key else None
+    run.alpha_thres = alpha_thres
+    run.lfc_thres = lfc_thres
+    run.status = STATUT_EN_ATTENTE
+    run.error = None
+    return bool(job.cache_key) and appliquer_cache(run, job.cache_key)
+
+# Fonction pour réclamer le prochain job de la file.
+# Les jobs de seuils et de figures (quelques secondes) passent en premier. Équité entre utilisateurs: on choisit ensuite les jobs
+# des utilisateurs qui ont le moins d'analyses en cours, puis le plus ancien. La réclamation est atomique (UPDATE conditionnel) pour supporter plusieurs workers.
+# Un job de figures est en attente tant qu'aucun worker ne l'a réclamé (son run est déjà terminé).
+# Une analyse dont le modèle (même model_key, ex.: seuils différents d'un même lot de l'API) est en cours d'ajustement
+# attend la fin de cet ajustement, puis réutilise le modèle sauvegardé au lieu de refaire l'ajustement en parallèle.
+def reclamer_job(worker, max_par_utilisateur=None):
+    en_cours = (db.session.query(Job.user_id, func.count(Job.id).label('n'))
+                .join(Run, Run.id == Job.run_id)
+                .filter(Run.status == STATUT_EN_COURS)
+                .group_by(Job.user_id)
+                .subquery())
+    n_en_cours = func.coalesce(en_cours.c.n, 0)
+    figures_en_attente = (Job.kind == JOB_FIGURES) & (Run.status == STATUT_TERMINE) & (Job.worker == None)
+    job_ajustement, run_ajustement = aliased(Job), aliased(Run)
+    ajustements_en_cours = (db.session.query(job_ajustement.model_key)
+                            .join(run_ajustement, run_ajustement.id == job_ajustement.run_id)
+                            .filter(run_ajustement.status == STATUT_EN_COURS, job_ajustement.kind == JOB_ANALYSE,
+                                    job_ajustement.model_key != None))
+    requete = (db.session.query(Job)
+               .join(Run, Run.id == Job.run_id)
+               .outerjoin(en_cours, en_cours.c.user_id == Job.user_id)
+               .filter((Run.status == STATUT_EN_ATTENTE) | figures_en_attente)
+               .filter((Job.kind != JOB_ANALYSE) | (Job.model_key == None) | Job.model_key.notin_(ajustements_en_cours)))
+    if max_par_utilisateur:
+        requete = requete.filter(n_en_cours < max_par_utilisateur)
+
+    priorite = case((Job.kind.in_((JOB_SEUILS, JOB_FIGURES)), 0), else_=1)
+    for job in requete.order_by(priorite, n_en_cours, Job.id).limit(5).all():
+        maintenant = datetime.utcnow()
+        if job.kind == JOB_FIGURES:
+            reclame = (Job.query
+                       .filter_by(id=job.id, kind=JOB_FIGURES, worker=None)
+                       .update({'worker': worker, 'heartbeat_at': maintenant}, synchronize_session=False))
+        else:
+            reclame = (Run.query
+                       .filter_by(id=job.run_id, status=STATUT_EN_ATTENTE)
+                       .update({'status': STATUT_EN_COURS, 'started_at': maintenant, 'stage': None}, synchronize_session=False))
+        if reclame:
+            job.worker = worker
+            job.heartbeat_at = maintenant
+            job.attempts += 1
+            db.session.commit()
+            return job
+        # Un autre worker a réclamé ce job entre-temps
+        db.session.rollback()
+    return None
+
+# Cœurs alloués aux jobs en cours d'exécution sur une machine, par tous ses workers (processus web et flask run-worker)
+def coeurs_utilises(hote):
+    figures_en_cours = (Job.kind == JOB_FIGURES) & (Run.status == STATUT_TERMINE) & (Job.worker != None)
+    return (db.session.query(func.coalesce(func.sum(Job.cpus), 0))
+            .join(Run, Run.id == Job.run_id)
+            .filter((Run.status == STATUT_EN_COURS) | figures_en_cours)
+            .filter(Job.worker.like(f'{hote}:%'))
+            .scalar())
+
+# Cœurs souhaités par un job: un seul pour les jobs sans ajustement (seuils, figures, modèle déjà sauvegardé) et pour les
+# petites matrices (taille du fichier counts), pour lesquelles le démarrage des processus de joblib coûte plus cher que
+# le calcul en parallèle
+def coeurs_souhaites(job, coeurs_grande_matrice, seuil_grande_matrice):
+    if job.kind != JOB_ANALYSE or (job.model_key and os.path.exists(chemin_modele(job.model_key))):
+        return 1
+    try:
+        taille = os.path.getsize(job.counts_file)
+    except OSError:
+        return 1
+    return coeurs_grande_matrice if taille >= seuil_grande_matrice else 1
+
+# Remet dans la file les jobs dont le worker ne donne plus signe de vie (processus redémarré, machine perdue)
+def recuperer_jobs_orphelins(delai):
+    limite = datetime.utcnow() - timedelta(seconds=delai)
+    figures_en_cours = (Job.kind == JOB_FIGURES) & (Run.status == STATUT_TERMINE) & (Job.worker != None)
+    orphelins = (Job.query
+                 .join(Run, Run.id == Job.run_id)
+                 .filter((Run.status == STATUT_EN_COURS) | figures_en_cours)
+                 .filter((Job.heartbeat_at == None) | (Job.heartbeat_at < limite))
+                 .all())
+    for job in orphelins:
+        if job.kind == JOB_FIGURES:
+            # Les résultats du run restent consultables; les figures sont abandonnées après plusieurs tentatives
+            if job.attempts >= MAX_TENTATIVES:
+                job.kind = JOB_SEUILS
+                job.run.error = 'Le worker générant les figures de cette analyse a été interrompu à plusieurs reprises.'
+        elif job.attempts >= MAX_TENTATIVES:
+            job.run.status = STATUT_ECHEC
+            job.run.error = 'Le worker exécutant cette analyse a été interrompu à plusieurs reprises.'
+            job.run.finished_at = datetime.utcnow()
+            notifier_fin(job.run)
+        else:
+            job.run.status = STATUT_EN_ATTENTE
+        job.worker = None
+    db.session.commit()
+    return len(orphelins)
+
+# Courriel de fin d'analyse, si l'utilisateur l'a demandé à la soumission (la transaction est validée par l'appelant).
+# Pas de courriel après un changement de seuils (quelques secondes, depuis la page de résultats).
+# Le lien vers les résultats utilise PUBLIC_URL: le worker n'a pas de requête HTTP pour construire une URL absolue.
+def notifier_fin(run):
+    if not run.notify or (run.job is not None and run.job.kind != JOB_ANALYSE):
+        return
+    if run.status == STATUT_TERMINE:
+        sujet = f'Analyse {run.id} terminée'
+        corps = (f"Votre analyse {run.id} ({run.counts_file}) est terminée: {run.n_significant} gènes significatifs.\n"
+                 f"Résultats: {current_app.config['PUBLIC_URL'].rstrip('/')}/results/{run.id}")
+    else:
+        sujet = f'Échec de l\'analyse {run.id}'
+        corps = f"Votre analyse {run.id} ({run.counts_file}) a échoué: {run.error}"
+    mettre_en_file_courriel(run.user.email, sujet, corps)
+
+# Fonction pour enregistrer le résultat d'une analyse terminée
+def enregistrer_resultat(run_id, resultat):
+    run = Run.query.get(run_id)
+    if run is None:
+        # L'analyse a été supprimée pendant son exécution
+        return
+    resume, contrastes, profil = resultat
+    job = run.job
+    job_figures = job is not None and job.kind == JOB_FIGURES
+    for colonne, valeur in resume.items():
+        setattr(run, colonne, valeur)
+    enregistrer_profil(profil)
+    if job_figures and run.profile:
+        # Mesures du job de figures ajoutées à celles du job qui a produit les résultats
+        profil_run = json.loads(run.profile)
+        for etape, mesure in profil.items():
+            if etape in profil_run:
+                mesure = {
+                    'wall': profil_run[etape]['wall'] + mesure['wall'],
+                    'cpu': profil_run[etape]['cpu'] + mesure['cpu'],
+                    'peak_rss': max(profil_run[etape]['peak_rss'], mesure['peak_rss']),
+                    'peak_rss_children': max(profil_run[etape]['peak_rss_children'], mesure['peak_rss_children']),
+                }
+            profil_run[etape] = mesure
+        profil = profil_run
+    run.profile = json.dumps(profil)
+    run.text_results = None
+    enregistrer_contrastes(run, contrastes)
+    modele_precedent = run.model_path
+    if job is not None and job.model_key and os.path.exists(chemin_modele(job.model_key)):
+        run.model_path = chemin_modele(job.model_key)
+    if run.model_path != modele_precedent:
+        # Nouveau modèle: indexé par gène au prochain tour de l'ordonnanceur (fonctions_genes). Un changement de seuils
+        # garde le modèle et l'index, qui ne dépend pas des seuils.
+        run.genes_indexed = False
+    if not job_figures:
+        run.status = STATUT_TERMINE
+        run.finished_at = datetime.utcnow()
+        notifier_fin(run)
+    if all('heatmap' in contraste for contraste in contrastes):
+        if job_figures:
+            job.kind = JOB_SEUILS
+        if job is not None and job.cache_key and run.model_path:
+            mettre_en_cache(job.cache_key, run.model_path, resume, contrastes)
+    else:
+        # Résultats consultables dès maintenant; les figures sont faites ensuite par un job de figures
+        job.kind = JOB_FIGURES
+        job.worker = None
+        job.attempts = 0
+    db.session.commit()
+
+# Fonction pour enregistrer l'échec d'une analyse
+def enregistrer_echec(run_id, erreur):
+    run = Run.query.get(run_id)
+    if run is None:
+        return
+    if run.job is not None and run.job.kind == JOB_FIGURES:
+        # Échec des figures seulement: les résultats du run restent consultables
+        run.job.kind = JOB_SEUILS
+        run.error = f'{type(erreur).__name__}: {erreur}'
+        db.session.commit()
+        return
+    run.status = STATUT_ECHEC
+    run.error = f'{type(erreur).__name__}: {erreur}'
+    run.finished_at = datetime.utcnow()
+    notifier_fin(run)
+    db.session.commit()
+
+
+class Ordonnanceur:
+    # Boucle qui réclame des jobs dans la file et les soumet à un pool de max_workers processus.
+    # Au plus max_workers analyses s'exécutent en même temps pour ce worker, et les jobs de tous les workers d'une machine
+    # se partagent budget_coeurs cœurs: un job n'est réclamé que s'il reste au moins un cœur libre.
+    def __init__(self, app, max_workers=None, intervalle=None, delai_heartbeat=None, max_par_utilisateur=None):
+        self.app = app
+        self.max_workers = max_workers or app.config['ANALYSIS_WORKERS']
+        self.intervalle = intervalle or app.config['ANALYSIS_POLL_INTERVAL']
+        self.delai_heartbeat = delai_heartbeat or app.config['ANALYSIS_HEARTBEAT_TIMEOUT']
+        self.max_par_utilisateur = max_par_utilisateur or app.config['ANALYSIS_MAX_JOBS_PER_USER']
+        self.budget_coeurs = app.config['ANALYSIS_CPU_BUDGET']
+        self.coeurs_grande_matrice = app.config['ANALYSIS_CPUS_LARGE_MATRIX']
+        self.seuil_grande_matrice = app.config['ANALYSIS_LARGE_MATRIX_BYTES']
+        self.hote = socket.gethostname()
+        self.nom = f'{self.hote}:{os.getpid()}'
+        self.pool = None
+        self.prechauffage = None
+        self.en_cours = {}  # future -> run_id
+        self.reveil = threading.Event()
+        self.arret = threading.Event()
+        self.thread = None
+        self.contexte = contexte_processus()
+        self.progression = self.contexte.Queue()
+        self.thread_progression = None
+
+    # Démarre la boucle dans un thread du processus courant (mode intégré au processus web)
+    def demarrer(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.boucle, name='ordonnanceur-analyses', daemon=True)
+            self.thread.start()
+
+    def nouveau_pool(self):
+        pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.contexte,
+                                   initializer=initialiser_processus, initargs=(self.progression,))
+        self.prechauffage = pool.submit(prechauffer)
+        return pool
+
+    # Pool cassé sans qu'un job suivi ne l'ait signalé (ex.: processus inactif tué, échec du préchauffage): toute
+    # soumission échouerait
+    def pool_casse(self):
+        if self.prechauffage.done() and not self.prechauffage.cancelled():
+            if isinstance(self.prechauffage.exception(), BrokenProcessPool):
+                return True
+        return bool(getattr(self.pool, '_broken', False))
+
+    # Enregistre dans la BD l'étape en cours signalée par les processus du pool, dès sa réception
+    def relayer_progression(self):
+        while not self.arret.is_set():
+            try:
+                run_id, etape = self.progression.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self.app.app_context():
+                try:
+                    Run.query.filter_by(id=run_id, status=STATUT_EN_COURS).update({'stage': etape}, synchronize_session=False)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception("Erreur lors de l'enregistrement de la progression de l'analyse %s", run_id)
+                finally:
+                    db.session.remove()
+
+    # Réveille la boucle immédiatement (appelé après la soumission d'une analyse)
+    def reveiller(self):
+        self.reveil.set()
+
+    def arreter(self):
+        self.arret.set()
+        self.reveil.set()
+
+    def boucle(self):
+        self.pool = self.nouveau_pool()
+        self.thread_progression = threading.Thread(target=self.relayer_progression, name='progression-analyses', daemon=True)
+        self.thread_progression.start()
+        try:
+            while not self.arret.is_set():
+                with self.app.app_context():
+                    try:
+                        self.iteration()
+                    except Exception:
+                        # Une erreur passagère (ex.: BD verrouillée) ne doit pas arrêter l'ordonnanceur
+                        db.session.rollback()
+                        self.app.logger.exception("Erreur dans l'ordonnanceur des analyses")
+                    finally:
+                        db.session.remove()
+                self.reveil.wait(self.intervalle)
+                self.reveil.clear()
+        finally:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            with self.app.app_context():
+                self.remettre_en_file()
+                db.session.remove()
+
+    def iteration(self):
+        self.collecter_termines()
+        if self.pool_casse():
+            self.app.logger.warning("Pool des analyses cassé, il est recréé")
+            self.remplacer_pool()
+        recuperer_jobs_orphelins(self.delai_heartbeat)
+        indexer_runs_en_attente(RUNS_INDEXES_PAR_TOUR)
+
+        pool_recree = False
+        while len(self.en_cours) < self.max_workers:
+            coeurs_libres = self.budget_coeurs - coeurs_utilises(self.hote)
+            if coeurs_libres < 1:
+                break
+            job = reclamer_job(self.nom, self.max_par_utilisateur)
+            if job is None:
+                break
+            # Une analyse identique a pu se terminer pendant que ce job attendait dans la file
+            if job.cache_key and appliquer_cache(job.run, job.cache_key, compter_echec=False):
+                if job.kind == JOB_FIGURES:
+                    job.kind = JOB_SEUILS
+                else:
+                    notifier_fin(job.run)
+                db.session.commit()
+                continue
+            modele_path = chemin_modele(job.model_key) if job.model_key else job.run.model_path
+            job.cpus = min(coeurs_souhaites(job, self.coeurs_grande_matrice, self.seuil_grande_matrice), coeurs_libres)
+            db.session.commit()
+            try:
+                future = self.pool.submit(executer_job, job.kind, job.parametres(), modele_path, self.app.config['PLOTS_DIR'],
+                                          job.run_id, self.app.config['ANALYSIS_CONTRAST_PROCESSES'], job.cpus)
+            except BrokenProcessPool:
+                # Le pool s'est cassé depuis la vérification: le job retourne dans la file (sans compter la tentative) et
+                # il est soumis de nouveau au pool recréé
+                self.remettre_runs_en_file([job.run_id])
+                if pool_recree:
+                    break
+                self.app.logger.warning("Pool des analyses cassé, il est recréé")
+                self.remplacer_pool()
+                pool_recree = True
+                continue
+            future.add_done_callback(lambda _: self.reveil.set())
+            self.en_cours[future] = job.run_id
+
+        # Heartbeat pour les jobs en cours d'exécution dans ce worker
+        if self.en_cours:
+            Job.query.filter(Job.run_id.in_(self.en_cours.values())).update(
+                {'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+
+    def collecter_termines(self):
+        for future in [f for f in self.en_cours if f.done()]:
+            if future not in self.en_cours:
+                # Déjà traité par remplacer_pool()
+                continue
+            run_id = self.en_cours.pop(future)
+            erreur = future.exception()
+            if erreur is None:
+                enregistrer_resultat(run_id, future.result())
+            else:
+                self.app.logger.error("Échec de l'analyse %s: %s", run_id, erreur)
+                enregistrer_echec(run_id, erreur)
+                if isinstance(erreur, BrokenProcessPool):
+                    # Un processus du pool a été tué (ex.: manque de mémoire), le pool doit être recréé
+                    self.remplacer_pool()
+
+    def remplacer_pool(self):
+        for future, run_id in list(self.en_cours.items()):
+            enregistrer_echec(run_id, BrokenProcessPool("Le processus d'analyse s'est terminé de façon inattendue."))
+        self.en_cours.clear()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.pool = self.nouveau_pool()
+
+    # À l'arrêt du worker, les analyses non terminées retournent dans la file pour un autre worker
+    def remettre_en_file(self):
+        run_ids = list(self.en_cours.values())
+        self.en_cours.clear()
+        if run_ids:
+            self.remettre_runs_en_file(run_ids)
+
+    # Rend des jobs réclamés par ce worker à la file, sans compter leur tentative
+    def remettre_runs_en_file(self, run_ids):
+        Run.query.filter(Run.id.in_(run_ids), Run.status == STATUT_EN_COURS).update(
+            {'status': STATUT_EN_ATTENTE}, synchronize_session=False)
+        Job.query.filter(Job.run_id.in_(run_ids)).update(
+            {'worker': None, 'attempts': Job.attempts - 1}, synchronize_session=False)
+        db.session.commit()
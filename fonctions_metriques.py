@@ -0,0 +1,79 @@
+# fonctions_metriques.py
+# Métriques au format texte de Prometheus (route /metrics): file d'attente, analyses par statut, cache des résultats,
+# et temps/mémoire cumulés de chaque étape des analyses (mesurés par fonctions_profilage).
+# Les cumuls par étape sont gardés dans la table compteur (entiers: temps en millisecondes, mémoire en octets),
+# partagée entre le processus web et les workers.
+
+from sqlalchemy import case, func
+from models import db, Run, Compteur, STATUT_EN_ATTENTE
+from fonctions_cache import incrementer, statistiques as statistiques_cache
+
+PREFIXE = 'pydeseq2'
+PREFIXE_ETAPE = 'etape:'
+
+# Garde la plus grande valeur observée d'un compteur (créé à la première utilisation)
+def maximum(nom, valeur):
+    plus_grand = case((Compteur.value < valeur, valeur), else_=Compteur.value)
+    if Compteur.query.filter_by(name=nom).update({'value': plus_grand}, synchronize_session=False) == 0:
+        db.session.add(Compteur(name=nom, value=valeur))
+
+# Ajoute les mesures d'un job terminé aux cumuls par étape (la transaction est validée par l'appelant)
+def enregistrer_profil(profil):
+    for etape, mesure in profil.items():
+        incrementer(f'{PREFIXE_ETAPE}{etape}:count')
+        incrementer(f'{PREFIXE_ETAPE}{etape}:wall_ms', int(round(mesure['wall'] * 1000)))
+        incrementer(f'{PREFIXE_ETAPE}{etape}:cpu_ms', int(round(mesure['cpu'] * 1000)))
+        maximum(f'{PREFIXE_ETAPE}{etape}:peak_rss', int(mesure['peak_rss']))
+        maximum(f'{PREFIXE_ETAPE}{etape}:peak_rss_children', int(mesure['peak_rss_children']))
+
+# Cumuls par étape: étape -> {count, wall_ms, cpu_ms, peak_rss, peak_rss_children}
+def cumuls_etapes():
+    cumuls = {}
+    for compteur in Compteur.query.filter(Compteur.name.like(f'{PREFIXE_ETAPE}%')).all():
+        _, etape, mesure = compteur.name.split(':', 2)
+        cumuls.setdefault(etape, {})[mesure] = compteur.value
+    return cumuls
+
+def ligne(nom, valeur, etiquettes=None):
+    if etiquettes:
+        texte = ','.join(f'{cle}="{val}"' for cle, val in etiquettes.items())
+        return f'{PREFIXE}_{nom}{{{texte}}} {valeur}'
+    return f'{PREFIXE}_{nom} {valeur}'
+
+def entete(nom, type_metrique, description):
+    return [f'# HELP {PREFIXE}_{nom} {description}', f'# TYPE {PREFIXE}_{nom} {type_metrique}']
+
+# Texte complet de la route /metrics
+def exporter_metriques():
+    lignes = []
+    statuts = dict(db.session.query(Run.status, func.count(Run.id)).group_by(Run.status).all())
+
+    lignes += entete('queue_depth', 'gauge', "Analyses en attente d'un worker.")
+    lignes.append(ligne('queue_depth', statuts.get(STATUT_EN_ATTENTE, 0)))
+    lignes += entete('runs', 'gauge', 'Analyses par statut.')
+    for statut, nombre in sorted(statuts.items()):
+        lignes.append(ligne('runs', nombre, {'status': statut}))
+
+    cache = statistiques_cache()
+    lignes += entete('cache_entries', 'gauge', 'Entrées du cache des résultats.')
+    lignes.append(ligne('cache_entries', cache['entries']))
+    lignes += entete('cache_bytes', 'gauge', 'Taille des fichiers référencés par le cache des résultats.')
+    lignes.append(ligne('cache_bytes', cache['bytes']))
+    for nom, cle, description in (('cache_hits_total', 'hits', 'Succès du cache des résultats.'),
+                                  ('cache_misses_total', 'misses', 'Échecs du cache des résultats.'),
+                                  ('cache_evictions_total', 'evictions', 'Entrées évincées du cache des résultats.')):
+        lignes += entete(nom, 'counter', description)
+        lignes.append(ligne(nom, cache[cle]))
+
+    cumuls = cumuls_etapes()
+    for nom, mesure, type_metrique, facteur, description in (
+            ('stage_runs_total', 'count', 'counter', 1, "Nombre d'exécutions de chaque étape."),
+            ('stage_wall_seconds_total', 'wall_ms', 'counter', 1000, 'Temps réel cumulé de chaque étape.'),
+            ('stage_cpu_seconds_total', 'cpu_ms', 'counter', 1000, 'Temps CPU cumulé de chaque étape (avec les processus joblib).'),
+            ('stage_peak_rss_bytes', 'peak_rss', 'gauge', 1, "Plus grand pic de mémoire résidente du processus d'analyse pendant chaque étape."),
+            ('stage_peak_rss_children_bytes', 'peak_rss_children', 'gauge', 1, 'Plus grand pic de mémoire résidente des processus enfants pendant chaque étape.')):
+        lignes += entete(nom, type_metrique, description)
+        for etape in sorted(cumuls):
+            valeur = cumuls[etape].get(mesure, 0)
+            lignes.append(ligne(nom, valeur / facteur if facteur != 1 else valeur, {'stage': etape}))
+    return '\n'.join(lignes) + '\n'
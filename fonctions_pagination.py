@@ -0,0 +1,61 @@
+# fonctions_pagination.py
+# Pagination par curseur (keyset) des listes d'analyses: au lieu d'un OFFSET qui relit toutes les lignes précédentes,
+# chaque page commence après la dernière ligne de la page précédente, identifiée par (analysis_date, id).
+# Avec l'index (user_id, analysis_date, id), chaque page ne lit que les lignes affichées.
+
+from datetime import datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+from models import Run, STATUT_EN_ATTENTE, STATUT_EN_COURS, STATUT_TERMINE, STATUT_ECHEC
+
+# Colonnes nécessaires pour afficher une ligne de l'historique (les colonnes volumineuses ne sont pas chargées)
+COLONNES_LISTE = ('id', 'user_id', 'analysis_date', 'status', 'counts_file', 'metadata_file', 'n_significant')
+STATUTS = (STATUT_EN_ATTENTE, STATUT_EN_COURS, STATUT_TERMINE, STATUT_ECHEC)
+
+def encoder_curseur(run):
+    return f"{run.analysis_date.isoformat()}_{run.id}"
+
+def decoder_curseur(curseur):
+    try:
+        date, run_id = curseur.rsplit('_', 1)
+        return datetime.fromisoformat(date), int(run_id)
+    except (AttributeError, ValueError):
+        return None
+
+def lire_date(valeur):
+    try:
+        return datetime.fromisoformat(valeur) if valeur else None
+    except ValueError:
+        return None
+
+# Filtres de la liste des analyses à partir des paramètres de l'URL (statut, intervalle de dates)
+def filtres_runs(args):
+    filtres = {
+        'status': args.get('status') if args.get('status') in STATUTS else '',
+        'date_from': args.get('date_from', ''),
+        'date_to': args.get('date_to', ''),
+    }
+    criteres = []
+    if filtres['status']:
+        criteres.append(Run.status == filtres['status'])
+    date_debut = lire_date(filtres['date_from'])
+    if date_debut:
+        criteres.append(Run.analysis_date >= date_debut)
+    date_fin = lire_date(filtres['date_to'])
+    if date_fin:
+        # Date de fin incluse: jusqu'à la fin de la journée
+        criteres.append(Run.analysis_date < date_fin.replace(hour=23, minute=59, second=59, microsecond=999999))
+    return filtres, criteres
+
+# Retourne une page d'analyses (les plus récentes d'abord) et le curseur de la page suivante (None si dernière page)
+def paginer_runs(requete, curseur, taille):
+    position = decoder_curseur(curseur)
+    if position is not None:
+        date, run_id = position
+        requete = requete.filter(or_(Run.analysis_date < date, and_(Run.analysis_date == date, Run.id < run_id)))
+    runs = (requete.options(load_only(*COLONNES_LISTE))
+            .order_by(Run.analysis_date.desc(), Run.id.desc())
+            .limit(taille + 1)
+            .all())
+    suivant = encoder_curseur(runs[taille - 1]) if len(runs) > taille else None
+    return runs[:taille], suivant
@@ -0,0 +1,91 @@
+# fonctions_profilage.py
+# Mesure du temps et de la mémoire de chaque étape d'une analyse, dans le processus qui l'exécute.
+# Pour chaque étape: temps réel (wall), temps CPU (processus d'analyse et processus joblib de pydeseq2) et pic de
+# mémoire résidente (RSS) du processus d'analyse et de ses processus enfants.
+# Le pic de mémoire est remis à zéro au début de chaque étape (Linux: /proc/<pid>/clear_refs), sinon c'est le pic
+# depuis le début du processus (les processus du pool sont réutilisés d'une analyse à l'autre).
+
+import os
+import resource
+import time
+from contextlib import contextmanager
+
+PAGE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+# Processus enfants directs (ex.: workers loky de joblib utilisés par pydeseq2); liste vide hors Linux
+def processus_enfants(pid=None):
+    pid = pid or os.getpid()
+    enfants = []
+    try:
+        noms = os.listdir('/proc')
+    except OSError:
+        return enfants
+    for nom in noms:
+        if not nom.isdigit():
+            continue
+        try:
+            with open(f'/proc/{nom}/stat') as fichier:
+                champs = fichier.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        if int(champs[1]) == pid:
+            enfants.append(int(nom))
+    return enfants
+
+# Temps CPU (utilisateur + système, s) d'un processus lu dans /proc/<pid>/stat
+def temps_cpu_processus(pid):
+    try:
+        with open(f'/proc/{pid}/stat') as fichier:
+            champs = fichier.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return 0.0
+    return (int(champs[11]) + int(champs[12])) / TICKS
+
+# Pic de mémoire résidente (octets) d'un processus depuis sa dernière remise à zéro
+def pic_rss_processus(pid):
+    try:
+        with open(f'/proc/{pid}/status') as fichier:
+            for ligne in fichier:
+                if ligne.startswith('VmHWM:'):
+                    return int(ligne.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid == os.getpid():
+        # ru_maxrss est en kilo-octets sous Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return 0
+
+def remettre_pic_rss(pid):
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as fichier:
+            fichier.write('5')
+    except OSError:
+        pass
+
+# Temps CPU du processus courant et de ses enfants vivants
+def temps_cpu_total(enfants):
+    return time.process_time() + sum(temps_cpu_processus(pid) for pid in enfants)
+
+# Mesure d'une étape: profil est un dictionnaire étape -> mesures (None: aucune mesure).
+# Une étape mesurée plusieurs fois cumule ses temps et garde le plus grand pic.
+@contextmanager
+def mesurer(profil, etape):
+    if profil is None:
+        yield
+        return
+    enfants = processus_enfants()
+    for pid in [os.getpid()] + enfants:
+        remettre_pic_rss(pid)
+    debut_wall = time.perf_counter()
+    debut_cpu = temps_cpu_total(enfants)
+    try:
+        yield
+    finally:
+        # Les processus joblib peuvent avoir été créés pendant l'étape
+        enfants_fin = processus_enfants()
+        mesure = profil.setdefault(etape, {'wall': 0.0, 'cpu': 0.0, 'peak_rss': 0, 'peak_rss_children': 0})
+        mesure['wall'] += time.perf_counter() - debut_wall
+        mesure['cpu'] += temps_cpu_total(enfants_fin) - debut_cpu
+        mesure['peak_rss'] = max(mesure['peak_rss'], pic_rss_processus(os.getpid()))
+        mesure['peak_rss_children'] = max(mesure['peak_rss_children'], sum(pic_rss_processus(pid) for pid in enfants_fin))
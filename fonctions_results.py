@@ -1,5 +1,15 @@
 # fonctions_results.py
-# traiter_results() traite le run.text_results stocké dans la BD pour chaque analyse pour créer un dictionnaire des informations dans le texte
+# traiter_results() traite le run.text_results stocké dans la BD pour les analyses créées avant le stockage en colonnes
+# pour créer un dictionnaire des informations dans le texte.
+# Les analyses récentes gardent leurs paramètres dans les colonnes de Run et la table des résultats dans le modèle
+# ajusté (.npz, une colonne par statistique), lue par charger_table().
+
+import csv
+import io
+import numpy as np
+
+COLONNES_RESULTATS = ['baseMean', 'log2FoldChange', 'lfcSE', 'stat', 'pvalue', 'padj']
+LIGNES_PAR_BLOC = 5000
 
 def traiter_results(texte):
     result_dict = {} # dictionnaire pour stocker chaque pair de key:value dans chaque ligne
@@ -29,3 +39,105 @@ def traiter_results(texte):
 
     return result_dict
 
+
+# matrice_texte_vers_csv() convertit la matrice à largeur fixe d'un ancien run.text_results en vrai CSV
+def matrice_texte_vers_csv(matrice):
+    sortie = io.StringIO()
+    writer = csv.writer(sortie)
+    lines = matrice.split('\n')
+    writer.writerow(['Geneid'] + COLONNES_RESULTATS)
+    for line in lines[1:]:
+        if line.strip():
+            writer.writerow(line.split())
+    return sortie.getvalue()
+
+# resume_run() crée le dictionnaire des informations affichées sur la page de résultats d'un run, avec les figures de
+# chaque contraste (runs créés avant les analyses multi-contrastes: un seul contraste, celui des colonnes du run)
+def resume_run(run):
+    if run.text_results is not None:
+        resultats = traiter_results(run.text_results)
+        resultats['contrastes'] = [{
+            'position': 0,
+            'design_factor': resultats.get('design_factor'),
+            'condition_1': resultats.get('condition_1'),
+            'condition_2': resultats.get('condition_2'),
+            'n_significant': resultats.get('n_significant'),
+            'heatmap_path': run.heatmap_path,
+            'volcanoplot_path': run.volcanoplot_path,
+        }]
+        return resultats
+    contrastes = [{
+        'position': contraste.position,
+        'design_factor': contraste.design_factor,
+        'condition_1': contraste.condition_1,
+        'condition_2': contraste.condition_2,
+        'n_significant': contraste.n_significant,
+        'heatmap_path': contraste.heatmap_path,
+        'volcanoplot_path': contraste.volcanoplot_path,
+    } for contraste in run.contrastes]
+    if not contrastes:
+        contrastes = [{
+            'position': 0,
+            'design_factor': run.design_factor,
+            'condition_1': run.condition_1,
+            'condition_2': run.condition_2,
+            'n_significant': run.n_significant,
+            'heatmap_path': run.heatmap_path,
+            'volcanoplot_path': run.volcanoplot_path,
+        }]
+    return {
+        'counts_file': run.counts_file,
+        'metadata_file': run.metadata_file,
+        'refit_cooks': run.refit_cooks,
+        'min_reads_per_gene': run.min_reads_per_gene,
+        'alpha_thres': run.alpha_thres,
+        'lfc_thres': run.lfc_thres,
+        'design_factor': run.design_factor,
+        'condition_1': run.condition_1,
+        'condition_2': run.condition_2,
+        'n_genes': run.n_genes,
+        'n_significant': run.n_significant,
+        'covariates': run.covariates,
+        'contrastes': contrastes,
+    }
+
+# charger_table() lit les colonnes des résultats du modèle ajusté et garde les gènes significatifs selon les seuils,
+# sans charger les counts log1p (np.load ne décompresse que les tableaux demandés).
+# contraste: position du contraste dans le modèle (les modèles d'un seul contraste ont une table 2D)
+def charger_table(modele_path, alpha_thres, lfc_thres, contraste=0):
+    with np.load(modele_path, allow_pickle=False) as donnees:
+        genes = donnees['genes']
+        gene_index_name = str(donnees['gene_index_name'])
+        colonnes = [str(colonne) for colonne in donnees['results_columns']]
+        valeurs = donnees['results']
+    if valeurs.ndim == 2:
+        valeurs = valeurs[np.newaxis]
+    if not 0 <= contraste < len(valeurs):
+        raise IndexError(f"Le modèle n'a pas de contraste {contraste}.")
+    valeurs = valeurs[contraste]
+    padj = valeurs[:, colonnes.index('padj')]
+    lfc = valeurs[:, colonnes.index('log2FoldChange')]
+    with np.errstate(invalid='ignore'):
+        masque = (padj < alpha_thres) & (np.abs(lfc) > lfc_thres)
+    return {
+        'index_name': gene_index_name,
+        'genes': genes[masque],
+        'columns': {colonne: valeurs[masque, i] for i, colonne in enumerate(colonnes)},
+    }
+
+# table_vers_csv() produit le CSV d'une table de résultats par blocs de lignes, pour une réponse Flask en streaming
+def table_vers_csv(table):
+    sortie = io.StringIO()
+    writer = csv.writer(sortie)
+    noms = list(table['columns'])
+    writer.writerow([table['index_name']] + noms)
+    colonnes = [table['columns'][nom] for nom in noms]
+    for debut in range(0, len(table['genes']), LIGNES_PAR_BLOC):
+        fin = debut + LIGNES_PAR_BLOC
+        for ligne in zip(table['genes'][debut:fin], *(colonne[debut:fin] for colonne in colonnes)):
+            writer.writerow([ligne[0]] + ['' if np.isnan(valeur) else repr(float(valeur)) for valeur in ligne[1:]])
+        yield sortie.getvalue()
+        sortie.seek(0)
+        sortie.truncate()
+    if sortie.tell():
+        yield sortie.getvalue()
@@ -0,0 +1,223 @@
+# fonctions_validation.py
+# Détection du format des fichiers counts et validation des fichiers d'une analyse avant sa mise en file.
+# Seuls les en-têtes sont lus, sans pandas ni numpy: ce module est importé par le processus web (formulaire d'analyse,
+# API par lots), la lecture complète des matrices (fonctions_ingestion) ne se fait que dans les processus d'analyse.
+# Formats acceptés pour les counts (détectés par le contenu, pas par l'extension):
+#   texte           .csv/.tsv/.txt (séparateur virgule ou tabulation), compressés ou non avec gzip
+#   featureCounts   sortie de featureCounts (ligne de commande, colonnes Chr/Start/End/Strand/Length ignorées)
+#   Parquet         colonne des gènes (ou index pandas) puis une colonne par échantillon (nécessite pyarrow)
+#   MatrixMarket    matrice creuse gènes x échantillons (.mtx, compressée ou non); les colonnes sont les échantillons
+#                   du fichier metadata dans l'ordre, les noms des gènes sont lus d'un fichier optionnel (un par ligne)
+
+import csv
+import gzip
+import os
+
+FORMAT_TEXTE = 'texte'
+FORMAT_FEATURECOUNTS = 'featurecounts'
+FORMAT_PARQUET = 'parquet'
+FORMAT_MATRIXMARKET = 'matrixmarket'
+
+# Colonnes d'annotation de featureCounts entre la colonne Geneid et les échantillons
+COLONNES_FEATURECOUNTS = ['Chr', 'Start', 'End', 'Strand', 'Length']
+
+SIGNATURE_GZIP = b'\x1f\x8b'
+SIGNATURE_PARQUET = b'PAR1'
+SIGNATURE_MATRIXMARKET = '%%MatrixMarket'
+
+def est_gzip(chemin):
+    with open(chemin, 'rb') as fichier:
+        return fichier.read(2) == SIGNATURE_GZIP
+
+# Ouverture d'un fichier texte, décompressé à la volée s'il est compressé avec gzip
+def ouvrir_texte(chemin):
+    return gzip.open(chemin, 'rt', newline='') if est_gzip(chemin) else open(chemin, newline='')
+
+# Nom d'un échantillon dans la sortie de featureCounts: chemin du fichier BAM/SAM sans dossier ni extension
+def nom_featurecounts(colonne):
+    nom = os.path.basename(colonne)
+    for extension in ('.bam', '.sam'):
+        if nom.endswith(extension):
+            return nom[:-len(extension)]
+    return nom
+
+# Détection du format d'un fichier counts et lecture de son en-tête seulement. Retourne un dictionnaire:
+#   format          un des FORMAT_*
+#   sep             séparateur des colonnes (formats texte)
+#   lignes_ignorees nombre de lignes avant l'en-tête (formats texte) ou avant les valeurs (MatrixMarket)
+#   gzip            vrai si le fichier est compressé avec gzip (formats texte et MatrixMarket)
+#   colonne_genes   nom de la colonne des gènes
+#   samples         noms des échantillons (None pour MatrixMarket: ils viennent du fichier metadata)
+#   positions       position de la colonne de chaque échantillon dans le fichier
+#   n_samples       nombre de colonnes d'échantillons
+#   n_genes         nombre de lignes de la matrice (MatrixMarket)
+def decrire_counts(chemin):
+    with open(chemin, 'rb') as fichier:
+        signature = fichier.read(4)
+    if signature == SIGNATURE_PARQUET:
+        # pyarrow est optionnel (seulement nécessaire pour les fichiers Parquet) et n'est importé qu'à la lecture d'un tel fichier
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Le fichier counts est au format Parquet, mais pyarrow n'est pas installé sur le serveur.")
+        schema = pq.read_schema(chemin)
+        colonnes = list(schema.names)
+        colonne_genes = colonnes[0]
+        # Fichier écrit avec DataFrame.to_parquet(): l'index (les gènes) est stocké comme une colonne
+        metadata_pandas = schema.pandas_metadata or {}
+        index = [nom for nom in metadata_pandas.get('index_columns', []) if isinstance(nom, str)]
+        if index:
+            colonne_genes = index[0]
+        samples = [colonne for colonne in colonnes if colonne != colonne_genes]
+        return {'format': FORMAT_PARQUET, 'colonne_genes': colonne_genes, 'samples': samples,
+                'positions': samples, 'n_samples': len(samples)}
+
+    with ouvrir_texte(chemin) as fichier:
+        premiere_ligne = fichier.readline()
+        if premiere_ligne.startswith(SIGNATURE_MATRIXMARKET):
+            # Bannière: %%MatrixMarket matrix coordinate <integer|real> general
+            banniere = premiere_ligne.lower().split()
+            if banniere[2:3] != ['coordinate'] or banniere[3:4] not in (['integer'], ['real']) or banniere[4:5] != ['general']:
+                raise ValueError("Le fichier MatrixMarket doit être une matrice creuse (coordinate) de valeurs, non symétrique.")
+            lignes_ignorees = 1
+            ligne = fichier.readline()
+            while ligne.startswith('%'):
+                lignes_ignorees += 1
+                ligne = fichier.readline()
+            n_genes, n_colonnes, _ = (int(valeur) for valeur in ligne.split())
+            return {'format': FORMAT_MATRIXMARKET, 'lignes_ignorees': lignes_ignorees + 1, 'gzip': est_gzip(chemin),
+                    'colonne_genes': 'Geneid', 'samples': None, 'positions': None, 'n_samples': n_colonnes,
+                    'n_genes': n_genes}
+        # Lignes de commentaires (ex.: ligne de commande de featureCounts) avant l'en-tête
+        lignes_ignorees = 0
+        while premiere_ligne.startswith('#'):
+            lignes_ignorees += 1
+            premiere_ligne = fichier.readline()
+    sep = '\t' if '\t' in premiere_ligne else ','
+    entete = next(csv.reader([premiere_ligne], delimiter=sep), [])
+    if entete[1:6] == COLONNES_FEATURECOUNTS:
+        positions = list(range(6, len(entete)))
+        samples = [nom_featurecounts(entete[position]) for position in positions]
+        format_counts = FORMAT_FEATURECOUNTS
+    else:
+        positions = list(range(1, len(entete)))
+        samples = entete[1:]
+        format_counts = FORMAT_TEXTE
+    return {'format': format_counts, 'sep': sep, 'lignes_ignorees': lignes_ignorees, 'gzip': est_gzip(chemin),
+            'colonne_genes': (entete[0] if entete else '') or 'Geneid', 'samples': samples,
+            'positions': positions, 'n_samples': len(samples)}
+
+# Échantillons d'un fichier counts; pour MatrixMarket ce sont ceux du fichier metadata, dans l'ordre des colonnes
+def samples_counts(description, samples_metadata):
+    if description['samples'] is not None:
+        return description['samples'], []
+    if description['n_samples'] != len(samples_metadata):
+        return [], [f"La matrice MatrixMarket a {description['n_samples']} colonnes mais le fichier metadata "
+                    f"contient {len(samples_metadata)} échantillons."]
+    return list(samples_metadata), []
+
+# Vérifie que chaque échantillon du fichier counts a une condition dans le fichier metadata.
+#   samples_counts  noms des échantillons (colonnes du fichier counts, sans la colonne des gènes)
+#   conditions      dictionnaire échantillon -> valeur du design factor ('' ou None si manquante)
+# Retourne la liste des échantillons à garder (ceux avec une condition) et la liste des erreurs.
+def verifier_alignement(samples_counts, conditions):
+    erreurs = []
+    if len(set(samples_counts)) != len(samples_counts):
+        erreurs.append("Le fichier counts contient des noms d'échantillons en double.")
+    manquants = [sample for sample in samples_counts if sample not in conditions]
+    if manquants:
+        erreurs.append(f"Échantillons du fichier counts absents du fichier metadata: {', '.join(manquants[:10])}"
+                       + (' ...' if len(manquants) > 10 else ''))
+
+    # Les échantillons sans condition (NaN) sont retirés de l'analyse
+    samples = [sample for sample in samples_counts if conditions.get(sample) not in (None, '')]
+    if not erreurs:
+        if len(samples) < 2:
+            erreurs.append("Au moins deux échantillons avec une condition sont nécessaires.")
+        elif len({conditions[sample] for sample in samples}) < 2:
+            erreurs.append("Le design factor du fichier metadata doit avoir au moins deux conditions différentes.")
+    return samples, erreurs
+
+# Covariables saisies dans le formulaire d'analyse: noms de colonnes du fichier metadata séparés par des virgules
+def lire_covariables(texte):
+    return [nom.strip() for nom in (texte or '').split(',') if nom.strip()]
+
+# Contrastes saisis dans le formulaire d'analyse, ex.: "KO vs WT; KO2 vs WT" -> [['KO', 'WT'], ['KO2', 'WT']].
+# Retourne None si aucun contraste n'est saisi (toutes les paires de conditions sont testées).
+def lire_contrastes(texte):
+    contrastes = []
+    for morceau in (texte or '').replace('\n', ';').split(';'):
+        if not morceau.strip():
+            continue
+        conditions = [condition.strip() for condition in morceau.split(' vs ')]
+        if len(conditions) != 2 or not all(conditions):
+            raise ValueError(f"Contraste invalide: '{morceau.strip()}' (format attendu: condition testée vs condition de référence).")
+        contrastes.append(conditions)
+    return contrastes or None
+
+# Niveau d'un facteur tel que pydeseq2 le nomme: les '_' des niveaux sont remplacés par des '-'
+def niveau_pydeseq(condition):
+    return str(condition).replace('_', '-')
+
+# Vérifie les covariables et contrastes demandés par rapport aux colonnes et conditions du fichier metadata.
+#   colonnes    colonnes du fichier metadata (sans la colonne des échantillons)
+#   conditions  valeurs du design factor (1ère colonne) des échantillons gardés
+def verifier_design(colonnes, conditions, covariables=None, contrastes=None):
+    erreurs = []
+    for covariable in covariables or []:
+        if covariable not in colonnes:
+            erreurs.append(f"La covariable '{covariable}' n'est pas une colonne du fichier metadata.")
+        elif covariable == colonnes[0]:
+            erreurs.append(f"La covariable '{covariable}' est déjà le design factor (1ère colonne du fichier metadata).")
+    # Les contrastes sont comparés aux niveaux renommés par pydeseq2 ('ko_b' et 'ko-b' désignent la même condition)
+    niveaux = {}
+    for condition in conditions:
+        niveaux.setdefault(niveau_pydeseq(condition), set()).add(condition)
+    for niveau, originales in sorted(niveaux.items()):
+        if len(originales) > 1:
+            erreurs.append(f"Les conditions {', '.join(sorted(originales))} seraient confondues par pyDESeq2 "
+                           f"(les '_' sont remplacés par des '-': {niveau}).")
+    for condition_1, condition_2 in contrastes or []:
+        for condition in (condition_1, condition_2):
+            if niveau_pydeseq(condition) not in niveaux:
+                erreurs.append(f"La condition '{condition}' n'existe pas dans la colonne '{colonnes[0]}' du fichier metadata.")
+        if niveau_pydeseq(condition_1) == niveau_pydeseq(condition_2):
+            erreurs.append(f"Le contraste {condition_1} vs {condition_2} compare une condition à elle-même.")
+    return erreurs
+
+# Validation rapide des fichiers avant de soumettre une analyse: seulement l'en-tête du fichier counts est lu.
+# Retourne la liste des erreurs (vide si les fichiers sont compatibles).
+def valider_fichiers(counts_file, metadata_file, genes_file=None, covariables=None, contrastes=None):
+    try:
+        description = decrire_counts(counts_file)
+    except (ValueError, OSError, UnicodeDecodeError, csv.Error) as erreur:
+        return [f"Le fichier counts n'a pas pu être lu: {erreur}"]
+    if description['n_samples'] < 2:
+        return ["Le fichier counts doit contenir une colonne de gènes et au moins deux échantillons."]
+    try:
+        with open(metadata_file, newline='') as fichier:
+            lignes = list(csv.reader(fichier))
+    except (OSError, UnicodeDecodeError, csv.Error) as erreur:
+        return [f"Le fichier metadata n'a pas pu être lu: {erreur}"]
+    if len(lignes) < 2 or len(lignes[0]) < 2:
+        return ["Le fichier metadata doit contenir une colonne d'échantillons et au moins une colonne de conditions."]
+    colonnes = lignes[0][1:]
+    erreurs = verifier_design(colonnes, set(), covariables)
+    if erreurs:
+        return erreurs
+    # Un échantillon sans valeur pour le design factor ou une covariable est retiré de l'analyse
+    positions = [1] + [lignes[0].index(covariable) for covariable in covariables or []]
+    conditions = {}
+    for ligne in lignes[1:]:
+        if ligne:
+            valeurs = [ligne[position].strip() if len(ligne) > position else '' for position in positions]
+            conditions[ligne[0]] = valeurs[0] if all(valeurs) else ''
+    samples, erreurs = samples_counts(description, [ligne[0] for ligne in lignes[1:] if ligne])
+    if erreurs:
+        return erreurs
+    if genes_file is not None and description['format'] != FORMAT_MATRIXMARKET:
+        return ["Le fichier des gènes n'est utilisé qu'avec une matrice MatrixMarket."]
+    samples, erreurs = verifier_alignement(samples, conditions)
+    if erreurs:
+        return erreurs
+    return verifier_design(colonnes, {conditions[sample] for sample in samples}, None, contrastes)
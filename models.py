@@ -0,0 +1,299 @@
+# models.py
+# Modèles de données partagés entre le processus web (app.py) et les workers d'analyse (fonctions_jobs.py)
+
+import json
+from datetime import datetime
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+
+db = SQLAlchemy()
+
+# États possibles d'une analyse
+STATUT_EN_ATTENTE = 'queued'
+STATUT_EN_COURS = 'running'
+STATUT_TERMINE = 'done'
+STATUT_ECHEC = 'failed'
+
+# Étapes d'une analyse, dans l'ordre d'exécution, avec leur libellé affiché sur la page d'attente
+ETAPE_LECTURE = 'lecture'
+ETAPE_SIZE_FACTORS = 'size_factors'
+ETAPE_DISPERSIONS = 'dispersions'
+ETAPE_LFC = 'lfc'
+ETAPE_COOKS = 'cooks'
+ETAPE_WALD = 'wald'
+ETAPE_FIGURES = 'figures'
+ETAPES = {
+    ETAPE_LECTURE: 'Lecture et filtration des counts',
+    ETAPE_SIZE_FACTORS: 'Facteurs de normalisation (size factors)',
+    ETAPE_DISPERSIONS: 'Estimation des dispersions',
+    ETAPE_LFC: 'Estimation des log2 fold changes',
+    ETAPE_COOKS: "Distances de Cook et refit des outliers",
+    ETAPE_WALD: 'Test de Wald',
+    ETAPE_FIGURES: 'Filtration des résultats et figures',
+}
+
+# Types de jobs: analyse complète, ou seulement filtration/figures/résumé à partir d'un modèle déjà ajusté.
+# Les figures sont faites par un second job (JOB_FIGURES) après l'enregistrement des résultats: le run est déjà terminé
+# (résultats consultables) pendant leur génération. Un job de figures terminé redevient un job de seuils.
+JOB_ANALYSE = 'analyse'
+JOB_SEUILS = 'seuils'
+JOB_FIGURES = 'figures'
+
+# États d'un courriel de la file d'envoi (fonctions_courriels)
+COURRIEL_EN_ATTENTE = 'queued'
+COURRIEL_ENVOI = 'sending'
+COURRIEL_ENVOYE = 'sent'
+COURRIEL_ECHEC = 'failed'
+
+# Définition du modèle de données utilisateur
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    first_name = db.Column(db.String(120), nullable=False)
+    last_name = db.Column(db.String(120), nullable=False)
+    role = db.Column(db.String(10), default='user', nullable=False)
+
+# Jeton d'accès à l'API JSON (/api/...), créé avec la commande flask create-token.
+# Seule l'empreinte SHA-256 du jeton est gardée: le jeton n'est affiché qu'à sa création.
+class JetonApi(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    name = db.Column(db.String(120), nullable=True)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = db.Column(db.DateTime, nullable=True)
+    user = db.relationship('User', backref=db.backref('jetons_api', lazy=True, cascade='all, delete-orphan'))
+
+# Définition du modèle de données pour les résultats d'analyse
+class Run(db.Model):
+    # Index pour l'historique d'un utilisateur trié par date (pagination par curseur)
+    __table_args__ = (db.Index('ix_run_user_id_analysis_date', 'user_id', 'analysis_date', 'id'),)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    analysis_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    status = db.Column(db.String(10), default=STATUT_EN_ATTENTE, nullable=False, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    # Étape en cours (une des clés de ETAPES), mise à jour par l'ordonnanceur pendant l'exécution
+    stage = db.Column(db.String(20), nullable=True)
+    # Mesures de chaque étape du dernier job exécuté (JSON: étape -> wall, cpu (s), peak_rss, peak_rss_children (octets))
+    profile = db.Column(db.Text, nullable=True)
+    # Paramètres et résumé de l'analyse
+    counts_file = db.Column(db.String(255), nullable=True)
+    metadata_file = db.Column(db.String(255), nullable=True)
+    refit_cooks = db.Column(db.Boolean, nullable=True)
+    min_reads_per_gene = db.Column(db.Integer, nullable=True)
+    alpha_thres = db.Column(db.Float, nullable=True)
+    lfc_thres = db.Column(db.Float, nullable=True)
+    design_factor = db.Column(db.String(120), nullable=True)
+    # Covariables du design (colonnes du fichier metadata, séparées par des virgules)
+    covariates = db.Column(db.String(255), nullable=True)
+    # Premier contraste testé (les contrastes d'un run sont dans la table contraste)
+    condition_1 = db.Column(db.String(120), nullable=True)
+    condition_2 = db.Column(db.String(120), nullable=True)
+    n_genes = db.Column(db.Integer, nullable=True)
+    # Gènes significatifs dans au moins un contraste
+    n_significant = db.Column(db.Integer, nullable=True)
+    # Ancien format texte des résultats (analyses créées avant le stockage en colonnes). Colonnes chargées seulement
+    # lorsqu'elles sont utilisées: elles peuvent contenir des mégaoctets (texte, images base64 non migrées).
+    # heatmap_path et volcanoplot_path sont les figures du premier contraste.
+    text_results = db.deferred(db.Column(db.Text, nullable=True), group='resultats')
+    heatmap_path = db.deferred(db.Column(db.String(255), nullable=True), group='resultats')
+    volcanoplot_path = db.deferred(db.Column(db.String(255), nullable=True), group='resultats')
+    # Modèle ajusté (.npz): table complète des résultats de chaque contraste et counts log1p, filtrée avec alpha_thres et lfc_thres
+    model_path = db.Column(db.String(255), nullable=True)
+    # Jeu de données du dépôt analysé (NULL pour les analyses dont les fichiers ont été enregistrés sous leur nom d'origine)
+    dataset_id = db.Column(db.Integer, db.ForeignKey('jeu_donnees.id'), nullable=True, index=True)
+    # Courriel à l'utilisateur à la fin de l'analyse (terminée ou en échec)
+    notify = db.Column(db.Boolean, nullable=False, default=False)
+    # Résultats par gène copiés dans la table resultat_gene (fonctions_genes), une fois le run terminé
+    genes_indexed = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    user = db.relationship('User', backref=db.backref('runs', lazy=True, order_by='Run.analysis_date.desc()'))
+    dataset = db.relationship('JeuDonnees', backref=db.backref('runs', lazy='dynamic'))
+
+# Fichier du dépôt des téléversements (fonctions_depot), nommé par l'empreinte SHA-256 de son contenu: un seul exemplaire
+# de chaque contenu, partagé par tous les jeux de données qui le contiennent
+class FichierDepot(db.Model):
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+# Jeu de données téléversé par un utilisateur: fichiers counts, metadata et gènes (optionnel) du dépôt, avec leurs noms
+# d'origine. Il peut servir à de nouvelles analyses sans nouveau téléversement. Les runs qui l'utilisent sont ses
+# références: flask gc-datasets ne supprime que les jeux de données sans run.
+class JeuDonnees(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    counts_sha = db.Column(db.String(64), db.ForeignKey('fichier_depot.sha256'), nullable=False, index=True)
+    metadata_sha = db.Column(db.String(64), db.ForeignKey('fichier_depot.sha256'), nullable=False, index=True)
+    genes_sha = db.Column(db.String(64), db.ForeignKey('fichier_depot.sha256'), nullable=True, index=True)
+    counts_name = db.Column(db.String(255), nullable=False)
+    metadata_name = db.Column(db.String(255), nullable=False)
+    genes_name = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    user = db.relationship('User', backref=db.backref('jeux_donnees', lazy=True, cascade='all, delete-orphan'))
+
+# Résultats d'un contraste (condition_1 vs condition_2 du design_factor) d'une analyse: le modèle pyDESeq2 est ajusté
+# une seule fois par run, puis un test de Wald est fait pour chaque contraste
+class Contraste(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('run.id'), nullable=False, index=True)
+    # Position du contraste dans le modèle ajusté (.npz) et sur la page de résultats
+    position = db.Column(db.Integer, nullable=False)
+    design_factor = db.Column(db.String(120), nullable=False)
+    condition_1 = db.Column(db.String(120), nullable=False)
+    condition_2 = db.Column(db.String(120), nullable=False)
+    n_significant = db.Column(db.Integer, nullable=True)
+    heatmap_path = db.Column(db.String(255), nullable=True)
+    volcanoplot_path = db.Column(db.String(255), nullable=True)
+    run = db.relationship('Run', backref=db.backref('contrastes', lazy=True, order_by='Contraste.position', cascade='all, delete-orphan'))
+
+# Index des résultats par gène de toutes les analyses terminées (fonctions_genes): une ligne par gène testé (padj défini)
+# et par contraste d'un run, pour retrouver un gène dans toutes les analyses sans lire leurs modèles.
+# L'index (gene, padj) sert la recherche d'un gène triée par padj, l'index (run_id, gene) la recherche parcourue par run
+# (tri par date, analyses d'un utilisateur) et la suppression des lignes d'un run. Les lignes d'un run ne changent pas
+# avec ses seuils.
+class ResultatGene(db.Model):
+    __table_args__ = (db.Index('ix_resultat_gene_gene_padj', 'gene', 'padj'),
+                      db.Index('ix_resultat_gene_run_id_gene', 'run_id', 'gene'))
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('run.id'), nullable=False)
+    # Position du contraste dans le run (table contraste)
+    position = db.Column(db.Integer, nullable=False)
+    gene = db.Column(db.String(120), nullable=False)
+    base_mean = db.Column(db.Float, nullable=True)
+    log2_fold_change = db.Column(db.Float, nullable=True)
+    padj = db.Column(db.Float, nullable=False)
+
+# File d'attente persistante: une ligne par analyse soumise, avec les paramètres nécessaires pour la relancer
+# et les informations du worker qui l'exécute (heartbeat pour détecter les workers morts)
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('run.id'), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    kind = db.Column(db.String(10), default=JOB_ANALYSE, nullable=False)
+    counts_file = db.Column(db.String(255), nullable=False)
+    metadata_file = db.Column(db.String(255), nullable=False)
+    # Noms des gènes d'une matrice MatrixMarket (optionnel)
+    genes_file = db.Column(db.String(255), nullable=True)
+    # Design: covariables (JSON: liste de colonnes du fichier metadata) et contrastes demandés
+    # (JSON: liste de [condition testée, condition de référence]; NULL: toutes les paires de conditions)
+    covariates = db.Column(db.Text, nullable=True)
+    contrasts = db.Column(db.Text, nullable=True)
+    refit_cooks = db.Column(db.Boolean, nullable=False, default=False)
+    min_reads_per_gene = db.Column(db.Integer, nullable=False)
+    alpha_thres = db.Column(db.Float, nullable=False)
+    lfc_thres = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    worker = db.Column(db.String(120), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    # Cœurs alloués au job par le worker qui l'exécute (budget de cœurs partagé par les workers d'une même machine)
+    cpus = db.Column(db.Integer, nullable=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    model_key = db.Column(db.String(64), nullable=True)
+    cache_key = db.Column(db.String(64), nullable=True)
+    run = db.relationship('Run', backref=db.backref('job', uselist=False, cascade='all, delete-orphan'))
+
+    # Paramètres passés à analyse_dea() dans le processus worker
+    def parametres(self):
+        return {
+            'counts_file': self.counts_file,
+            'metadata_file': self.metadata_file,
+            'genes_file': self.genes_file,
+            'refit_cooks': self.refit_cooks,
+            'min_reads_per_gene': self.min_reads_per_gene,
+            'alpha_thres': self.alpha_thres,
+            'lfc_thres': self.lfc_thres,
+            'covariables': json.loads(self.covariates) if self.covariates else None,
+            'contrastes': json.loads(self.contrasts) if self.contrasts else None,
+        }
+
+# Cache des résultats adressé par contenu: la clé est une empreinte des fichiers d'entrée et des paramètres d'analyse
+class ResultatCache(db.Model):
+    key = db.Column(db.String(64), primary_key=True)
+    model_path = db.Column(db.String(255), nullable=False)
+    summary = db.Column(db.Text, nullable=False)
+    heatmap = db.Column(db.Text, nullable=True)
+    volcanoplot = db.Column(db.Text, nullable=True)
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    hits = db.Column(db.Integer, default=0, nullable=False)
+
+# File d'envoi persistante des courriels: ajoutés par les routes et l'ordonnanceur, envoyés en arrière-plan par un
+# expéditeur (fonctions_courriels) qui les réclame par lots (worker, claimed_at) et les réessaie jusqu'à leur envoi
+class Courriel(db.Model):
+    __table_args__ = (db.Index('ix_courriel_status_next_attempt_at', 'status', 'next_attempt_at'),)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), default=COURRIEL_EN_ATTENTE, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    # Prochaine tentative d'envoi (délai croissant après chaque échec)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    worker = db.Column(db.String(120), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+# Compteurs globaux partagés entre le processus web et les workers (ex.: succès/échecs du cache)
+class Compteur(db.Model):
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, default=0, nullable=False)
+
+# Réglages de chaque nouvelle connexion SQLite. En journal WAL, les lectures (tableau de bord, pages de résultats) ne
+# sont jamais bloquées par l'écriture des résultats, et une écriture n'attend que la fin des autres écritures; la
+# synchronisation NORMAL est sûre en WAL (une coupure de courant peut perdre les dernières transactions, pas corrompre
+# la BD). Une écriture qui trouve la BD verrouillée attend jusqu'à delai_attente secondes au lieu d'échouer.
+def configurer_sqlite(engine, wal, delai_attente):
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def reglages(connexion, _):
+        curseur = connexion.cursor()
+        curseur.execute(f'PRAGMA busy_timeout = {int(delai_attente * 1000)}')
+        if wal:
+            curseur.execute('PRAGMA journal_mode = WAL')
+            curseur.execute('PRAGMA synchronous = NORMAL')
+        curseur.close()
+
+# Ajoute aux tables existantes les colonnes et index définis dans les modèles mais absents de la BD
+# (db.create_all() ne crée que les tables manquantes). Retourne l'ensemble des (table, colonne) ajoutées.
+def mettre_a_jour_schema():
+    inspecteur = inspect(db.engine)
+    colonnes_ajoutees = set()
+    for table in db.metadata.sorted_tables:
+        if not inspecteur.has_table(table.name):
+            continue
+        colonnes_existantes = {colonne['name'] for colonne in inspecteur.get_columns(table.name)}
+        for colonne in table.columns:
+            if colonne.name in colonnes_existantes:
+                continue
+            type_sql = colonne.type.compile(dialect=db.engine.dialect)
+            defaut = colonne.default.arg if colonne.default is not None and colonne.default.is_scalar else None
+            instruction = f'ALTER TABLE "{table.name}" ADD COLUMN "{colonne.name}" {type_sql}'
+            if isinstance(defaut, bool):
+                defaut = int(defaut)
+            if defaut is not None:
+                instruction += f" DEFAULT {defaut!r}"
+            db.session.execute(text(instruction))
+            colonnes_ajoutees.add((table.name, colonne.name))
+        db.session.commit()
+        index_existants = {index['name'] for index in inspecteur.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in index_existants:
+                index.create(db.engine)
+
+    # Les analyses créées avant la file d'attente n'ont pas de statut: celles avec des résultats sont terminées,
+    # les autres ont été perdues avec leur thread
+    if ('run', 'status') in colonnes_ajoutees:
+        db.session.execute(text("UPDATE run SET status = :termine WHERE text_results IS NOT NULL"), {'termine': STATUT_TERMINE})
+        db.session.execute(text("UPDATE run SET status = :echec WHERE text_results IS NULL"), {'echec': STATUT_ECHEC})
+        db.session.commit()
+    return colonnes_ajoutees